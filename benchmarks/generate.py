@@ -0,0 +1,146 @@
+import csv
+import datetime
+import random
+import string
+from pathlib import Path
+
+import pydantic
+
+# one of each kind per six columns, wider tables repeat them with a number
+COLUMN_KINDS = ["date", "name", "category", "code", "amount", "text"]
+COLUMN_BASE_NAMES = {
+    "date": ("PolicyDate", "policy_date"),
+    "name": ("EmployeeName", "employee_name"),
+    "category": ("Plan", "plan"),
+    "code": ("PolicyNumber", "policy_number"),
+    "amount": ("Premium", "premium"),
+    "text": ("Notes", "notes"),
+}
+FIRST_NAMES = ["John", "Jane", "Michael", "Alice", "Bob", "Carol", "David", "Eva", "Grace"]
+LAST_NAMES = ["Doe", "Smith", "Brown", "Johnson", "Wilson", "Martinez", "Anderson", "Thomas"]
+CATEGORIES = ["Gold", "Silver", "Bronze", "Platinum", "Basic", "Family"]
+TEMPLATE_ROWS = 20
+WRITE_BATCH_ROWS = 10_000
+FIRST_DATE = datetime.date(2015, 1, 1)
+
+
+class Scenario(pydantic.BaseModel):
+    """
+    Shape of a synthetic incoming csv and its template
+
+    :param name: identifies the scenario in results
+    :param rows: incoming data rows
+    :param columns: columns in both files
+    :param cardinality: distinct values per incoming column, at most `rows`
+    :param cell_size: characters in each text cell
+    :param quote_rate: share of text cells with a comma, quote or newline, which csv has to quote
+    :param date_format: strftime format of incoming dates
+    :param template_date_format: strftime format of template dates
+    :param seed: seed for the generated values
+    """
+
+    name: str
+    rows: int
+    columns: int = 6
+    cardinality: int = 1000
+    cell_size: int = 20
+    quote_rate: float = 0.0
+    date_format: str = "%m/%d/%Y"
+    template_date_format: str = "%Y-%m-%d"
+    seed: int = 0
+
+
+SCENARIOS = {
+    "tall": Scenario(name="tall", rows=200_000),
+    "wide": Scenario(name="wide", rows=10_000, columns=120, cardinality=200),
+    "blob": Scenario(
+        name="blob", rows=10_000, columns=6, cardinality=5_000, cell_size=2_000, quote_rate=0.5
+    ),
+}
+
+
+def column_names(columns: int) -> list[tuple[str, str, str]]:
+    """
+    The kind, template name and incoming name of each generated column
+    """
+    names = []
+    for idx in range(columns):
+        kind = COLUMN_KINDS[idx % len(COLUMN_KINDS)]
+        template_name, incoming_name = COLUMN_BASE_NAMES[kind]
+        if repeat := idx // len(COLUMN_KINDS):
+            template_name, incoming_name = f"{template_name}{repeat}", f"{incoming_name}_{repeat}"
+        names.append((kind, template_name, incoming_name))
+    return names
+
+
+def _text(rng: random.Random, size: int, quoted: bool) -> str:
+    words = []
+    length = 0
+    while length < size:
+        word = "".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9)))
+        words.append(word)
+        length += len(word) + 1
+    if quoted:
+        words.insert(rng.randrange(len(words)), rng.choice([",", '"quoted"', "\n"]))
+    return " ".join(words)[:size]
+
+
+def _value_pair(kind: str, scenario: Scenario, rng: random.Random) -> tuple[str, str]:
+    # (incoming value, the same value as the template formats it)
+    if kind == "date":
+        date = FIRST_DATE + datetime.timedelta(days=rng.randrange(3650))
+        return date.strftime(scenario.date_format), date.strftime(scenario.template_date_format)
+    if kind == "name":
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        return name, name
+    if kind == "category":
+        category = rng.choice(CATEGORIES)
+        return category, category
+    if kind == "code":
+        letters = "".join(rng.choices(string.ascii_uppercase, k=2))
+        digits = f"{rng.randrange(100_000):05d}"
+        return f"{letters}-{digits}", f"{letters}{digits}"
+    if kind == "amount":
+        cents = rng.randrange(1_000, 500_000)
+        return f"${cents // 100:,}.{cents % 100:02d}", f"{cents // 100}.{cents % 100:02d}"
+    text = _text(rng, scenario.cell_size, rng.random() < scenario.quote_rate)
+    return text, text
+
+
+def generate_files(scenario: Scenario, directory: Path) -> tuple[Path, Path]:
+    """
+    Write a template csv and an incoming csv for a scenario
+
+    Each incoming column draws its values from a pool of `cardinality` values. The
+    template holds the same kinds of values in the formats the merge has to produce:
+    dates in `template_date_format`, codes without the dash and amounts without the
+    currency formatting.
+
+    :param scenario: the shape of the files
+    :param directory: where to write them
+    :return: the template and incoming paths
+    """
+    rng = random.Random(scenario.seed)
+    names = column_names(scenario.columns)
+    pool_size = max(1, min(scenario.cardinality, scenario.rows))
+    pools = [[_value_pair(kind, scenario, rng) for _ in range(pool_size)] for kind, _, _ in names]
+
+    template_path = directory / f"{scenario.name}_template.csv"
+    with template_path.open("w", newline="") as out_file:
+        writer = csv.writer(out_file)
+        writer.writerow([template_name for _, template_name, _ in names])
+        writer.writerows([rng.choice(pool)[1] for pool in pools] for _ in range(TEMPLATE_ROWS))
+
+    incoming_path = directory / f"{scenario.name}_incoming.csv"
+    with incoming_path.open("w", newline="") as out_file:
+        writer = csv.writer(out_file)
+        writer.writerow([incoming_name for _, _, incoming_name in names])
+        remaining = scenario.rows
+        while remaining:
+            batch = min(remaining, WRITE_BATCH_ROWS)
+            indexes = [rng.choices(range(pool_size), k=batch) for _ in pools]
+            writer.writerows(
+                [pool[idx][0] for pool, idx in zip(pools, row)] for row in zip(*indexes)
+            )
+            remaining -= batch
+    return template_path, incoming_path
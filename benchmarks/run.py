@@ -0,0 +1,230 @@
+"""
+Time the merge pipeline on synthetic csv files
+
+    python -m benchmarks.run --scenario tall --compare benchmarks/results/<commit>.json
+
+Models are replaced by `FakeLLM`, which answers at once, so the suggestion stages
+measure prompt construction and response parsing rather than a model.
+"""
+import argparse
+import gc
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable
+
+from benchmarks.generate import SCENARIOS, Scenario, generate_files
+from table_merger.fake_llm import FakeLLM
+from table_merger.llm_cache import set_response_cache
+from table_merger.table_mergers import TableMergeOperation, TableMergerManager
+
+RESULTS_DIR = Path(__file__).parent / "results"
+# slowdowns and memory growth beyond this share of the baseline are regressions
+REGRESSION_THRESHOLD = 0.2
+# stages quicker than this are too noisy to compare
+MIN_COMPARED_SECONDS = 0.01
+
+
+def _measure(stage: Callable[[], Any], trace_memory: bool) -> tuple[Any, dict[str, float | None]]:
+    # timed without tracemalloc, which slows allocation heavy code several times over
+    gc.collect()
+    start = time.perf_counter()
+    result = stage()
+    seconds = time.perf_counter() - start
+    peak_memory_mb = None
+    if trace_memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            stage()
+            peak_memory_mb = tracemalloc.get_traced_memory()[1] / 1e6
+        finally:
+            tracemalloc.stop()
+    return result, {"seconds": seconds, "peak_memory_mb": peak_memory_mb}
+
+
+def _with_throughput(measured: dict, rows: int, size: int) -> dict:
+    seconds = measured["seconds"]
+    return {
+        **measured,
+        "rows_per_second": rows / seconds if seconds else None,
+        "mb_per_second": size / 1e6 / seconds if seconds else None,
+    }
+
+
+def run_scenario(scenario: Scenario, directory: Path, trace_memory: bool = True) -> dict:
+    """
+    Generate a scenario's files and time each stage of merging them
+
+    :param scenario: the files to generate
+    :param directory: where the files are written
+    :param trace_memory: also run each stage under tracemalloc for its peak memory
+    :return: the scenario's parameters, input size and per stage measurements
+    """
+    template_path, incoming_path = generate_files(scenario, directory)
+    size = incoming_path.stat().st_size
+    stages: dict[str, dict] = {}
+
+    manager = TableMergerManager(FakeLLM())
+    with template_path.open(newline="") as template_file:
+        manager.ready(template_file)
+
+    operation: TableMergeOperation
+    operation, stages["extract_columns"] = _measure(
+        lambda: manager.prep_csv_file_from_path(incoming_path), trace_memory
+    )
+    stages["extract_columns"] = _with_throughput(stages["extract_columns"], scenario.rows, size)
+
+    merge_info, stages["suggest_mapping"] = _measure(
+        lambda: operation.create_suggested_merge_info(manager.llm), trace_memory
+    )
+    operation.assign_column_mapping(
+        {x.template_column: x.incoming_column for x in merge_info.column_mapping}
+    )
+    transformations, stages["suggest_transformations"] = _measure(
+        lambda: operation.create_suggested_transformation_operations(manager.llm), trace_memory
+    )
+    transforms = {x.column_name: x.python_lambda_body for x in transformations.transformations}
+    _, stages["assign_transformations"] = _measure(
+        lambda: operation.assign_column_transformations(transforms), trace_memory
+    )
+
+    out_path = directory / f"{scenario.name}_merged.csv"
+    rows_written, stages["apply"] = _measure(
+        lambda: operation.apply_to_file(out_path), trace_memory
+    )
+    stages["apply"] = _with_throughput(stages["apply"], scenario.rows, size)
+
+    return {
+        "scenario": scenario.model_dump(),
+        "input_bytes": size,
+        "rows_written": rows_written,
+        "mapped_columns": len(merge_info.column_mapping),
+        "transform_errors": operation.error_collector.total,
+        "stages": stages,
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare_results(
+    results: dict, baseline: dict, threshold: float = REGRESSION_THRESHOLD
+) -> list[str]:
+    """
+    Stages that got slower or used more memory than in the baseline
+
+    :param results: results from `run_benchmarks`
+    :param baseline: earlier results, such as those saved for a previous version
+    :param threshold: the share a measurement may grow by before it is a regression
+    :return: a description of each regression
+    """
+    regressions = []
+    for name, scenario in results["scenarios"].items():
+        baseline_stages = baseline.get("scenarios", {}).get(name, {}).get("stages", {})
+        for stage, measured in scenario["stages"].items():
+            if not (before := baseline_stages.get(stage)):
+                continue
+            seconds, seconds_before = measured["seconds"], before["seconds"]
+            slower = seconds > seconds_before * (1 + threshold)
+            if slower and seconds_before >= MIN_COMPARED_SECONDS:
+                regressions.append(f"{name}/{stage}: {seconds_before:.3f}s -> {seconds:.3f}s")
+            if (
+                before.get("peak_memory_mb")
+                and measured.get("peak_memory_mb")
+                and measured["peak_memory_mb"] > before["peak_memory_mb"] * (1 + threshold)
+            ):
+                regressions.append(
+                    f"{name}/{stage}: peak memory {before['peak_memory_mb']:.1f}MB"
+                    f" -> {measured['peak_memory_mb']:.1f}MB"
+                )
+    return regressions
+
+
+def run_benchmarks(scenarios: list[Scenario], directory: Path, trace_memory: bool = True) -> dict:
+    # a response cache would hide the prompt work being measured
+    set_response_cache(None)
+    return {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "scenarios": {x.name: run_scenario(x, directory, trace_memory) for x in scenarios},
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=sorted(SCENARIOS),
+        help="scenario to run, can be repeated, defaults to all",
+    )
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="multiplies each scenario's rows"
+    )
+    parser.add_argument(
+        "--output", type=Path, help="results file, defaults to results/<commit>.json"
+    )
+    parser.add_argument("--compare", type=Path, help="earlier results to check for regressions")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--work-dir", type=Path, help="keep the generated files here")
+    args = parser.parse_args(argv)
+
+    scenarios = [
+        SCENARIOS[name].model_copy(
+            update={"rows": max(1, int(SCENARIOS[name].rows * args.scale))}
+        )
+        for name in args.scenario or SCENARIOS
+    ]
+    if args.work_dir:
+        args.work_dir.mkdir(parents=True, exist_ok=True)
+        results = run_benchmarks(scenarios, args.work_dir, not args.no_memory)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            results = run_benchmarks(scenarios, Path(directory), not args.no_memory)
+
+    output = args.output or RESULTS_DIR / f"{results['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+
+    for name, scenario in results["scenarios"].items():
+        for stage, measured in scenario["stages"].items():
+            line = f"{name:>6} {stage:<24} {measured['seconds']:9.3f}s"
+            if measured.get("rows_per_second"):
+                line += f" {measured['rows_per_second']:12,.0f} rows/s"
+                line += f" {measured['mb_per_second']:8.1f} MB/s"
+            if measured.get("peak_memory_mb") is not None:
+                line += f"  peak {measured['peak_memory_mb']:.1f}MB"
+            print(line)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        regressions = compare_results(
+            results, json.loads(args.compare.read_text()), args.threshold
+        )
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,11 @@
+import pytest
+
+
+# registered here rather than in tests/integration, so the option is known whichever
+# directory pytest is run on
+def pytest_addoption(parser: pytest.Parser) -> None:
+    parser.addoption(
+        "--fake-llm",
+        action="store_true",
+        help="use the offline fake models instead of OpenAI, also set by TABLE_MERGER_FAKE_LLM=1",
+    )
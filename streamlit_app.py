@@ -7,6 +7,8 @@ from langchain.chat_models import ChatOpenAI
 from langchain.globals import set_debug
 from langchain.llms.openai import OpenAI
 
+from table_merger.llm_cache import SQLiteLLMResponseCache, set_response_cache
+from table_merger.mapping_store import MappingStore
 from table_merger.table_mergers import (
     ColumnMapping,
     ColumnTransformations,
@@ -20,6 +22,20 @@ set_debug(True)
 st.set_page_config(page_title="CSV Merger")
 
 
+@st.cache_resource
+def get_response_cache() -> SQLiteLLMResponseCache:
+    # reruns and re-uploads of the same files shouldn't go back to OpenAI
+    return SQLiteLLMResponseCache(Path(".llm_cache.sqlite"))
+
+
+set_response_cache(get_response_cache())
+
+
+@st.cache_resource
+def get_mapping_store() -> MappingStore:
+    return MappingStore(Path(".mapping_store.sqlite"))
+
+
 @st.cache_data
 def get_api_key() -> str:
     api_key_path = Path(".api_key")
@@ -127,7 +143,11 @@ def main() -> None:
                     apply_column_mapping(active_operation, user_mapping)
                     # TODO: finish, need to present to user
                     column_transformation = (
-                        active_operation.create_suggested_transformation_operations(get_gpt4())
+                        active_operation.suggested_transformation_operations
+                        if active_operation.recalled
+                        else active_operation.create_suggested_transformation_operations(
+                            get_gpt4()
+                        )
                     )
                     st.session_state["transform_code"] = column_transformation
     if (column_transformation := st.session_state.get("transform_code")) and (
@@ -168,6 +188,8 @@ def main() -> None:
                 st.error("There were errors applying the transformations!")
                 for error in active_operation.errors:
                     st.error(error)
+            else:
+                st.session_state["merger_manager"].remember_operation(active_operation)
             ready_next_file()
 
     # Prepare data for Streamlit table
@@ -187,7 +209,7 @@ def handle_uploaded_template_file(uploaded_file: StringIO) -> Any:
     if st.session_state.get("merger_manager"):
         table_merger = st.session_state["merger_manager"]
     else:
-        table_merger = TableMergerManager(get_llm())
+        table_merger = TableMergerManager(get_llm(), mapping_store=get_mapping_store())
     if not (template_ready := st.session_state.get("template_ready", False)):
         template_ready = table_merger.ready(template_file=uploaded_file)
     return table_merger, template_ready
@@ -203,8 +225,9 @@ def handle_uploaded_input_file(
         for error in operation.errors:
             st.error(error)
     else:
-        st.write("Calculating info...")
-        operation.create_suggested_merge_info(get_gpt4())
+        if not operation.recalled:
+            st.write("Calculating info...")
+            operation.create_suggested_merge_info(get_gpt4())
         assert operation.suggested_merge_info
 
         user_selected_mapping = {}
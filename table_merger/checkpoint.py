@@ -0,0 +1,163 @@
+import csv
+import hashlib
+import io
+import json
+import os
+from pathlib import Path
+from typing import BinaryIO, Iterator, TextIO
+
+import pydantic
+
+from table_merger import readers
+from table_merger.types import IncomingColName, TemplateColName
+
+# input bytes between checkpoints
+CHECKPOINT_INTERVAL = 64 * 1024 * 1024
+CHECKPOINT_BLOCK_SIZE = 1 << 20
+# bytes read from each end of the input for its fingerprint
+FINGERPRINT_SAMPLE_SIZE = 64 * 1024
+
+
+class Checkpoint(pydantic.BaseModel):
+    input_fingerprint: str
+    transform_fingerprint: str
+    # the input is consumed up to here, always the start of a row
+    input_offset: int
+    rows_read: int
+    output_offset: int
+    rows_written: int
+    reject_offset: int | None = None
+    # [template column, error type, count]
+    error_counts: list[tuple[TemplateColName, str, int]] = []
+    failed_rows: int = 0
+
+
+def input_fingerprint(path: Path) -> str:
+    """
+    Fingerprint a file from its size, modification time and the bytes at either end
+
+    Reading the whole of a very large file would take as long as the merge itself.
+    """
+    stat = path.stat()
+    digest = hashlib.sha256(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+    with path.open("rb") as in_file:
+        digest.update(in_file.read(FINGERPRINT_SAMPLE_SIZE))
+        in_file.seek(max(0, stat.st_size - FINGERPRINT_SAMPLE_SIZE))
+        digest.update(in_file.read(FINGERPRINT_SAMPLE_SIZE))
+    return digest.hexdigest()
+
+
+def transform_fingerprint(
+    template_columns: list[TemplateColName],
+    column_mapping: dict[TemplateColName, IncomingColName],
+    transformations: dict[TemplateColName, str],
+) -> str:
+    return hashlib.sha256(
+        json.dumps([template_columns, column_mapping, transformations], sort_keys=True).encode()
+    ).hexdigest()
+
+
+def load_checkpoint(path: Path) -> Checkpoint | None:
+    try:
+        return Checkpoint.model_validate_json(path.read_text())
+    except (FileNotFoundError, pydantic.ValidationError):
+        return None
+
+
+def save_checkpoint(path: Path, checkpoint: Checkpoint) -> None:
+    """
+    Write a checkpoint atomically, a crash leaves either the old or the new one
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("w") as out_file:
+        out_file.write(checkpoint.model_dump_json())
+        out_file.flush()
+        os.fsync(out_file.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_header(in_file: BinaryIO, encoding: str) -> tuple[int, list[str]]:
+    """
+    Read the header row from the start of a csv file
+
+    :return: the offset where the header ends, and the header
+    """
+    in_file.seek(0)
+    header_bytes = in_file.readline()
+    # a quoted header name can contain a newline
+    while header_bytes.count(b'"') & 1 and (line := in_file.readline()):
+        header_bytes += line
+    header = next(csv.reader(io.StringIO(header_bytes.decode(encoding), newline="")), [])
+    return in_file.tell(), header
+
+
+def _last_row_boundary(data: bytes) -> int:
+    # data starts on a row boundary, so the quotes can be followed from its start
+    newline = data.rfind(b"\n")
+    if newline == -1:
+        return 0
+    scanner = readers.RowBoundaryScanner()
+    scanner.advance(data, 0, newline)
+    if not scanner.in_quotes:
+        return newline + 1
+    # the last newline is inside a quoted field, look for the last one that isn't
+    boundary = 0
+    scanner = readers.RowBoundaryScanner()
+    while (found := scanner.next_boundary(data, boundary)) != -1:
+        boundary = found
+    return boundary
+
+
+def iter_row_aligned_blocks(
+    in_file: BinaryIO, start: int, block_size: int = CHECKPOINT_BLOCK_SIZE
+) -> Iterator[tuple[int, bytes]]:
+    """
+    Read a csv file in blocks that end on row boundaries
+
+    :param in_file: the file, opened in binary mode
+    :param start: where to start reading, must be the start of a row
+    :param block_size: bytes read at a time
+    :return: the offset each block ends at, and the block
+    """
+    in_file.seek(start)
+    position = start
+    carry = b""
+    while block := in_file.read(block_size):
+        data = carry + block
+        boundary = _last_row_boundary(data)
+        # a row longer than the block is carried over until it ends
+        carry = data[boundary:]
+        if boundary:
+            position += boundary
+            yield position, data[:boundary]
+    if carry:
+        yield position + len(carry), carry
+
+
+def open_output(path: Path, offset: int | None, buffering: int = -1) -> TextIO:
+    """
+    Open a csv output for writing, from scratch or to continue from a checkpoint
+
+    :param path: the output file
+    :param offset: where the checkpointed output ends, anything after it is discarded,
+        or None to start a new file
+    :param buffering: passed on to `open`
+    :return: the file, positioned at its end
+    """
+    if offset is None:
+        return path.open("w", newline="", buffering=buffering)
+    out_file = path.open("r+", newline="", buffering=buffering)
+    out_file.truncate(offset)
+    out_file.seek(0, os.SEEK_END)
+    return out_file
+
+
+def sync(out_file: TextIO) -> int:
+    """
+    Flush a file to disk
+
+    :return: the file's position, for the checkpoint
+    """
+    out_file.flush()
+    os.fsync(out_file.fileno())
+    return out_file.tell()
@@ -0,0 +1,117 @@
+import time
+from typing import Sequence
+
+import pydantic
+
+from table_merger.readers import ProjectedValues
+from table_merger.transform_library import compile_output_format
+from table_merger.transforms import compile_row_projector
+from table_merger.types import TemplateColName
+
+# rows read from the start of the incoming file for a dry run
+DRY_RUN_ROWS = 1000
+# failing values kept per column as examples
+MAX_DRY_RUN_ERRORS = 3
+
+
+class ColumnDryRun(pydantic.BaseModel):
+    column: TemplateColName
+    values_tested: int
+    failures: int
+    # non-empty outputs that don't fully match the template's output_format regex
+    format_mismatches: int
+    seconds_per_value: float
+    sample_errors: list[str] = []
+
+    @property
+    def failure_rate(self) -> float:
+        return self.failures / self.values_tested if self.values_tested else 0.0
+
+    @property
+    def format_mismatch_rate(self) -> float:
+        converted = self.values_tested - self.failures
+        return self.format_mismatches / converted if converted else 0.0
+
+
+class DryRunReport(pydantic.BaseModel):
+    columns: list[ColumnDryRun]
+    rows_tested: int
+    # transform throughput only, reading and writing the files is not included
+    rows_per_second: float | None
+
+
+def dry_run_column(
+    column: TemplateColName, transform: str, values: Sequence[str | None], output_format: str
+) -> ColumnDryRun:
+    """
+    Run one column's transform over sample values, timing it and checking its output
+
+    :param column: the template column
+    :param transform: the body of the column's lambda
+    :param values: incoming values to try
+    :param output_format: the template column's output format, checked when it's a regex
+    :return: the failures, format mismatches and time per value
+    """
+    project_row = compile_row_projector({column: transform})
+    pattern = compile_output_format(output_format)
+    failures = 0
+    format_mismatches = 0
+    sample_errors: list[str] = []
+    elapsed = 0.0
+    for value in values:
+        start = time.perf_counter()
+        transformed_row, failed_columns = project_row([value])
+        elapsed += time.perf_counter() - start
+        if failed_columns:
+            failures += 1
+            if len(sample_errors) < MAX_DRY_RUN_ERRORS:
+                exc = failed_columns[0][1]
+                sample_errors.append(f"{value!r}: {type(exc).__name__}: {exc}")
+            continue
+        output = transformed_row[column]
+        if pattern and output not in (None, "") and not pattern.fullmatch(str(output)):
+            format_mismatches += 1
+    return ColumnDryRun(
+        column=column,
+        values_tested=len(values),
+        failures=failures,
+        format_mismatches=format_mismatches,
+        seconds_per_value=elapsed / len(values) if values else 0.0,
+        sample_errors=sample_errors,
+    )
+
+
+def dry_run_transforms(
+    transforms: dict[TemplateColName, str],
+    values: dict[TemplateColName, list[str | None]],
+    output_formats: dict[TemplateColName, str],
+    rows: list[ProjectedValues],
+) -> DryRunReport:
+    """
+    Try out a plan's transforms on sample values before the full pass
+
+    Transforms are run without memoizing, so the throughput is a lower bound for files
+    with repeated values.
+
+    :param transforms: python lambda bodies keyed by template column
+    :param values: the values to try each column's transform on
+    :param output_formats: the template's output format for each column
+    :param rows: sample rows projected to the columns of `transforms`, in the same order,
+        used to time the whole row transform
+    :return: per column results and the estimated rows per second
+    """
+    columns = [
+        dry_run_column(column, transform, values.get(column, []), output_formats.get(column, ""))
+        for column, transform in transforms.items()
+    ]
+    rows_per_second = None
+    if rows:
+        project_row = compile_row_projector(transforms)
+        start = time.perf_counter()
+        for row in rows:
+            project_row(row)
+        elapsed = time.perf_counter() - start
+        rows_per_second = len(rows) / elapsed if elapsed else None
+    elif row_cost := sum(x.seconds_per_value for x in columns):
+        rows_per_second = 1 / row_cost
+    return DryRunReport(columns=columns, rows_tested=len(rows), rows_per_second=rows_per_second)
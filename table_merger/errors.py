@@ -0,0 +1,92 @@
+from collections import Counter
+
+from table_merger.sinks import RejectSink
+from table_merger.types import TemplateColName
+
+MAX_ERROR_SAMPLES = 100
+
+# (template column, error type, reason)
+RowFailure = tuple[TemplateColName, str, str]
+
+
+def row_failures(failed_columns: list[tuple[TemplateColName, Exception]]) -> list[RowFailure]:
+    return [(template_col, type(exc).__name__, str(exc)) for template_col, exc in failed_columns]
+
+
+def format_row_error(row_num: int, template_col: TemplateColName, reason: str) -> str:
+    return (
+        f"Row: {row_num} - Error applying transformation for column {template_col}."
+        f" Reason: {reason}"
+    )
+
+
+class ErrorCollector:
+    """
+    Collects transformation failures in memory proportional to the kinds of error seen
+
+    Failures are counted per template column and error type. The first `max_samples`
+    are added to `messages` as readable errors, and every failing row can be written
+    in full to a reject sink.
+
+    :param messages: list the sample errors are added to, such as an operation's errors
+    :param max_samples: the most failures added to `messages`
+    :param reject_sink: where failing rows are written
+    """
+
+    def __init__(
+        self,
+        messages: list[str],
+        max_samples: int = MAX_ERROR_SAMPLES,
+        reject_sink: RejectSink | None = None,
+    ) -> None:
+        self.messages = messages
+        self.max_samples = max_samples
+        self.reject_sink = reject_sink
+        self.counts: Counter[tuple[TemplateColName, str]] = Counter()
+        self.failed_rows = 0
+        self.sampled = 0
+
+    def record(self, row_num: int, fields: list[str], failures: list[RowFailure]) -> None:
+        """
+        Record a row that failed to transform
+
+        :param row_num: the 1 based row number, not counting the header
+        :param fields: the row as read from the incoming file
+        :param failures: the columns that failed
+        """
+        self.failed_rows += 1
+        for template_col, error_type, reason in failures:
+            self.counts[template_col, error_type] += 1
+            if self.sampled < self.max_samples:
+                self.messages.append(format_row_error(row_num, template_col, reason))
+                self.sampled += 1
+        if self.reject_sink:
+            self.reject_sink.write_row(
+                row_num,
+                [x for x in fields if x is not None],
+                [f"{template_col}: {reason}" for template_col, _, reason in failures],
+            )
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def summary(self) -> list[str]:
+        """
+        One line per column and error type, most frequent first
+        """
+        return [
+            f"{count} rows failed for column {template_col} with {error_type}"
+            for (template_col, error_type), count in self.counts.most_common()
+        ]
+
+    def finish(self) -> None:
+        """
+        Add the summary to `messages` if some failures were left out of the samples
+        """
+        if self.total > self.sampled:
+            self.messages.append(
+                f"{self.total} transformation errors in {self.failed_rows} rows,"
+                f" only the first {self.sampled} are listed."
+            )
+            self.messages.extend(self.summary())
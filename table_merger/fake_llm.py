@@ -0,0 +1,360 @@
+import asyncio
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from typing import Any, Mapping
+
+from langchain.callbacks.manager import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain.chat_models.base import BaseChatModel
+from langchain.llms.base import LLM
+from langchain.pydantic_v1 import Field
+from langchain.schema import AIMessage, ChatGeneration, ChatResult
+from langchain.schema.messages import BaseMessage
+
+from table_merger.matching import match_score
+from table_merger.profiling import DATE_PATTERN, value_pattern
+from table_merger.table_mergers import ColumnInfo
+from table_merger.transform_library import detect_transform
+
+LATENCY_DISTRIBUTIONS = {"constant", "uniform", "exponential", "lognormal"}
+# template columns are left unmapped below this score
+FAKE_MATCH_SCORE = 0.2
+FAKE_EXAMPLE_COUNT = 5
+NUMBER_VALUE = re.compile(r"[-+]?\$?[0-9,]*\.?[0-9]+")
+
+
+class FakeRateLimitError(Exception):
+    """
+    A 429 from a fake model, retried by `LLMScheduler` like a real rate limit
+    """
+
+    http_status = 429
+
+
+def _section(prompt: str, name: str) -> str | None:
+    found = re.search(rf"BEGIN {name}\n-----\n(.*?)\n-----\nEND {name}", prompt, re.DOTALL)
+    return found.group(1) if found else None
+
+
+def _pattern_regex(pattern: str) -> str:
+    # letter runs vary in length between values, digit runs usually don't
+    parts = []
+    for char, run in itertools.groupby(pattern):
+        count = len(list(run))
+        if char == "A":
+            parts.append("[A-Za-z]+")
+        elif char == "9":
+            parts.append(f"[0-9]{{{count}}}" if count > 1 else "[0-9]")
+        else:
+            parts.append(re.escape(char * count))
+    return "".join(parts)
+
+
+def infer_column_info(name: str, sample_values: list[str]) -> dict:
+    """
+    Column info for a column from its name and samples, like the LLM would report it
+    """
+    values = [x for x in sample_values if x.strip()]
+    if values and all(NUMBER_VALUE.fullmatch(x.strip()) for x in values):
+        column_type = "number"
+    elif values and all(DATE_PATTERN.fullmatch(x.strip()) for x in values):
+        column_type = "date"
+    else:
+        column_type = "string"
+    patterns = sorted({value_pattern(x) for x in values})
+    output_format = (
+        "^(" + "|".join(_pattern_regex(x) for x in patterns) + ")$"
+        if patterns and len(patterns) <= FAKE_EXAMPLE_COUNT
+        else ".*"
+    )
+    return {
+        "name": name,
+        "type": column_type,
+        "output_format": output_format,
+        "empty_expected": len(values) < len(sample_values) or not values,
+        "example_values": list(dict.fromkeys(values))[:FAKE_EXAMPLE_COUNT],
+    }
+
+
+def _merge_info(template_cols: list[ColumnInfo], incoming_cols: list[ColumnInfo]) -> dict:
+    scores = sorted(
+        (
+            (match_score(template_col, incoming_col), template_col.name, incoming_col.name)
+            for template_col in template_cols
+            for incoming_col in incoming_cols
+        ),
+        reverse=True,
+    )
+    mapping: dict[str, tuple[str, float]] = {}
+    used: set[str] = set()
+    for score, template_name, incoming_name in scores:
+        if score < FAKE_MATCH_SCORE:
+            break
+        if template_name not in mapping and incoming_name not in used:
+            mapping[template_name] = (incoming_name, score)
+            used.add(incoming_name)
+    return {
+        "reasoning": ["Columns are paired by name and sample value similarity."],
+        "column_mapping": [
+            {
+                "template_column": x.name,
+                "incoming_column": mapping[x.name][0],
+                "reasoning": f"Scored {mapping[x.name][1]:.2f} on names and values.",
+                "confidence": "high" if mapping[x.name][1] >= 0.8 else "medium",
+                "ambiguous_with": [],
+            }
+            for x in template_cols
+            if x.name in mapping
+        ],
+        "errors": [f"Column {x.name} is missing" for x in template_cols if x.name not in mapping],
+    }
+
+
+def _transformations(column_data: list[dict]) -> dict:
+    transformations = []
+    for column in column_data:
+        template_col = ColumnInfo(
+            name=column["template_column"],
+            type=column["template_column_type"],
+            output_format=column["template_column_format"],
+            empty_expected=column["empty_expected"],
+            example_values=column["example_values_template"],
+        )
+        incoming_col = ColumnInfo(
+            name=column["incoming_column"],
+            type=column["incoming_column_type"],
+            output_format="",
+            empty_expected=False,
+            example_values=column["example_values_incoming"],
+        )
+        found = detect_transform(template_col, incoming_col)
+        transformations.append(
+            {
+                "reasoning": [found.reasoning if found else "The values are used as they are."],
+                "column_name": template_col.name,
+                "python_lambda_body": found.python_lambda_body if found else "value",
+            }
+        )
+    return {"transformations": transformations, "errors": []}
+
+
+def rule_based_response(prompt: str) -> str:
+    """
+    Answer the table merger's prompts from the data in them, without a model
+
+    Column info is inferred from the sample values, columns are mapped with the same
+    scores used to premap them and transformations come from the transform library.
+    Repair prompts include the original prompt and are answered the same way.
+
+    :param prompt: a prompt made by `TableMergerManager` or `TableMergeOperation`
+    :return: the JSON response, or "{}" for a prompt that isn't recognized
+    """
+    if (columns := _section(prompt, "COLUMNS")) is not None:
+        column_samples = json.loads(columns)
+        response: dict = {
+            "columns": [
+                infer_column_info(name, values) for name, values in column_samples.items()
+            ]
+        }
+    elif (column_name := _section(prompt, "COLUMN NAME")) is not None:
+        response = infer_column_info(
+            column_name, json.loads(_section(prompt, "SAMPLE VALUES") or "[]")
+        )
+    elif (template_columns := _section(prompt, "TEMPLATE COLUMNS")) is not None:
+        response = _merge_info(
+            [ColumnInfo(**x) for x in json.loads(template_columns)],
+            [ColumnInfo(**x) for x in json.loads(_section(prompt, "INCOMING COLUMNS") or "[]")],
+        )
+    elif (column_data := _section(prompt, "COLUMN DATA")) is not None:
+        response = _transformations(json.loads(column_data))
+    else:
+        response = {}
+    return json.dumps(response)
+
+
+class FakeBehavior:
+    """
+    How a fake model responds: scripted responses, latency and injected failures
+
+    Responses come from `responses` in order, then from `rule_based_response`. Latency
+    is drawn around `latency_seconds`: exactly it ("constant"), uniformly between 0 and
+    twice it ("uniform"), with it as the mean ("exponential") or the median
+    ("lognormal", spread by `latency_sigma`). A `rate_limit_rate` share of calls raise
+    `FakeRateLimitError` and a `malformed_rate` share return truncated JSON.
+
+    The counters can be shared by several models to measure concurrency and caching.
+
+    :param responses: scripted responses, used before the rules
+    :param latency_seconds: typical latency of a call
+    :param latency_distribution: "constant", "uniform", "exponential" or "lognormal"
+    :param latency_sigma: spread of the lognormal distribution
+    :param malformed_rate: share of calls answered with malformed JSON
+    :param rate_limit_rate: share of calls that fail with a 429
+    :param seed: seed for latency and failure injection, so runs are reproducible
+    """
+
+    def __init__(
+        self,
+        responses: list[str] | None = None,
+        latency_seconds: float = 0.0,
+        latency_distribution: str = "constant",
+        latency_sigma: float = 0.5,
+        malformed_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        seed: int = 0,
+    ) -> None:
+        if latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(
+                f"latency_distribution must be one of {', '.join(sorted(LATENCY_DISTRIBUTIONS))}"
+            )
+        self.responses = list(responses or [])
+        self.latency_seconds = latency_seconds
+        self.latency_distribution = latency_distribution
+        self.latency_sigma = latency_sigma
+        self.malformed_rate = malformed_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.seed = seed
+        self.calls = 0
+        self.rate_limited = 0
+        self.malformed = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.prompts: list[str] = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def params(self) -> dict[str, Any]:
+        return {
+            "malformed_rate": self.malformed_rate,
+            "rate_limit_rate": self.rate_limit_rate,
+            "seed": self.seed,
+        }
+
+    def start(self, prompt: str) -> float:
+        """
+        Count a call and pick its latency
+
+        :raises FakeRateLimitError: for the injected share of rate limited calls
+        :return: seconds to wait before responding
+        """
+        with self._lock:
+            self.calls += 1
+            self.prompts.append(prompt)
+            if self._random.random() < self.rate_limit_rate:
+                self.rate_limited += 1
+                raise FakeRateLimitError("Rate limit reached for fake model (429)")
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            return self._latency()
+
+    def finish(self, prompt: str) -> str:
+        with self._lock:
+            self.in_flight -= 1
+            response = self.responses.pop(0) if self.responses else rule_based_response(prompt)
+            if self._random.random() < self.malformed_rate:
+                self.malformed += 1
+                # cut off part way, like a response that ran out of tokens
+                response = response[: len(response) // 2]
+            return response
+
+    def _latency(self) -> float:
+        mean = self.latency_seconds
+        if mean <= 0:
+            return 0.0
+        if self.latency_distribution == "uniform":
+            return self._random.uniform(0, 2 * mean)
+        if self.latency_distribution == "exponential":
+            return self._random.expovariate(1 / mean)
+        if self.latency_distribution == "lognormal":
+            return self._random.lognormvariate(0, self.latency_sigma) * mean
+        return mean
+
+
+class FakeLLM(LLM):
+    """
+    Offline stand-in for a completion model, see `FakeBehavior`
+    """
+
+    behavior: FakeBehavior = Field(default_factory=FakeBehavior)
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-table-merger"
+
+    @property
+    def _identifying_params(self) -> Mapping[str, Any]:
+        return self.behavior.params()
+
+    def _call(
+        self,
+        prompt: str,
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> str:
+        time.sleep(self.behavior.start(prompt))
+        return self.behavior.finish(prompt)
+
+    async def _acall(
+        self,
+        prompt: str,
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> str:
+        await asyncio.sleep(self.behavior.start(prompt))
+        return self.behavior.finish(prompt)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Offline stand-in for a chat model, see `FakeBehavior`
+    """
+
+    behavior: FakeBehavior = Field(default_factory=FakeBehavior)
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-table-merger-chat"
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return self.behavior.params()
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        prompt = "\n".join(str(x.content) for x in messages)
+        time.sleep(self.behavior.start(prompt))
+        return _chat_result(self.behavior.finish(prompt))
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        prompt = "\n".join(str(x.content) for x in messages)
+        await asyncio.sleep(self.behavior.start(prompt))
+        return _chat_result(self.behavior.finish(prompt))
+
+
+def _chat_result(response: str) -> ChatResult:
+    return ChatResult(generations=[ChatGeneration(message=AIMessage(content=response))])
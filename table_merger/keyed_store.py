@@ -0,0 +1,142 @@
+import csv
+import itertools
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Iterable, TextIO
+
+from table_merger.sinks import WRITE_BATCH_SIZE, RowSink
+from table_merger.types import TemplateColName
+
+ON_CONFLICT = ("skip", "replace")
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _sql_value(value: Any) -> str | None:
+    # stored as the text CsvSink would write, so the int 1 and the str "1" are one key
+    return None if value is None else str(value)
+
+
+class KeyedRowStore(RowSink):
+    """
+    Output store that keeps one row per key, across files and runs
+
+    Rows are upserted into a SQLite table whose primary key is the key columns, so
+    duplicates are found by the index rather than in memory. Rows are written with
+    `executemany`, one transaction per batch. Rows with an empty key can't be
+    deduplicated and are counted in `rows_missing_key` rather than stored.
+
+    :param path: the SQLite database file
+    :param columns: the template columns
+    :param key_columns: the template columns that identify a row, such as PolicyNumber
+    :param on_conflict: "skip" keeps the first row seen for a key, "replace" the last
+    :param batch_size: rows per transaction
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        columns: list[TemplateColName],
+        key_columns: list[TemplateColName],
+        on_conflict: str = "skip",
+        batch_size: int = WRITE_BATCH_SIZE,
+    ) -> None:
+        if on_conflict not in ON_CONFLICT:
+            raise ValueError(f"on_conflict must be one of {', '.join(ON_CONFLICT)}")
+        if missing := [x for x in key_columns if x not in columns]:
+            raise ValueError(f"Key columns {missing} are not template columns")
+        self.path = path
+        self.columns = columns
+        self.key_columns = key_columns
+        self.on_conflict = on_conflict
+        self.batch_size = batch_size
+        self.rows_written = 0
+        self.rows_skipped = 0
+        self.rows_missing_key = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS merged_rows (
+                {", ".join(f"{_quote(x)} TEXT" for x in columns)},
+                PRIMARY KEY ({", ".join(_quote(x) for x in key_columns)})
+            )
+            """
+        )
+        stored_columns = [x[1] for x in self._conn.execute("PRAGMA table_info(merged_rows)")]
+        if stored_columns != columns:
+            raise ValueError(f"{path} holds rows with columns {stored_columns}, not {columns}")
+        # an upsert rather than INSERT OR REPLACE, which deletes the old row and so
+        # moves the key to the end of the export order
+        action = (
+            "DO UPDATE SET " + ", ".join(f"{_quote(x)} = excluded.{_quote(x)}" for x in columns)
+            if on_conflict == "replace"
+            else "DO NOTHING"
+        )
+        self._insert = (
+            f"INSERT INTO merged_rows VALUES ({', '.join('?' for _ in columns)})"
+            f" ON CONFLICT ({', '.join(_quote(x) for x in key_columns)}) {action}"
+        )
+
+    def write_rows(self, rows: Iterable[dict]) -> int:
+        """
+        Upsert rows, or skip them when their key is already stored
+
+        :param rows: transformed rows keyed by template column
+        :return: number of rows inserted or replaced
+        """
+        columns = self.columns
+        key_columns = self.key_columns
+        written = 0
+        rows_iter = iter(rows)
+        while batch := list(itertools.islice(rows_iter, self.batch_size)):
+            values = []
+            for row in batch:
+                if any(row.get(x) in (None, "") for x in key_columns):
+                    self.rows_missing_key += 1
+                    continue
+                values.append([_sql_value(row.get(col)) for col in columns])
+            with self._lock:
+                self._conn.execute("BEGIN")
+                try:
+                    changed = self._conn.executemany(self._insert, values).rowcount
+                    self._conn.execute("COMMIT")
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
+            written += changed
+            self.rows_skipped += len(values) - changed
+        self.rows_written += written
+        return written
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM merged_rows").fetchone()
+        return count
+
+    def export_csv(self, out_file: TextIO, write_header: bool = True) -> int:
+        """
+        Write the stored rows to a csv file, in the order they were first stored
+
+        :param out_file: the output, opened with newline=""
+        :param write_header: whether to write the template columns as the first row
+        :return: number of rows written
+        """
+        writer = csv.writer(out_file)
+        if write_header:
+            writer.writerow(self.columns)
+        written = 0
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM merged_rows ORDER BY rowid")
+            while batch := cursor.fetchmany(self.batch_size):
+                writer.writerows(batch)
+                written += len(batch)
+        return written
+
+    def close(self) -> None:
+        self._conn.close()
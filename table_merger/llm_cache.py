@@ -0,0 +1,164 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from langchain.chat_models.base import BaseChatModel
+from langchain.schema.language_model import BaseLanguageModel
+
+
+class LLMResponseCache:
+    """
+    Base class for caches of raw LLM responses
+
+    Subclasses implement `_lookup` and `_update`. Counters are kept here.
+    """
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, key: str) -> str | None:
+        response = self._lookup(key)
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return response
+
+    def update(self, key: str, response: str) -> None:
+        self._update(key, response)
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def _lookup(self, key: str) -> str | None:
+        raise NotImplementedError
+
+    def _update(self, key: str, response: str) -> None:
+        raise NotImplementedError
+
+
+class SQLiteLLMResponseCache(LLMResponseCache):
+    """
+    LLM response cache stored in a local SQLite database
+
+    :param path: the database file
+    :param max_bytes: evict least recently used responses once their total size goes past this
+    :param max_age: seconds a response stays valid, None to keep them until evicted for size
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        max_bytes: int | None = 256 * 1024 * 1024,
+        max_age: float | None = 7 * 24 * 60 * 60,
+    ) -> None:
+        super().__init__()
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)"
+        )
+
+    def _lookup(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            found = self._conn.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if found is None:
+                return None
+            response, created = found
+            if self.max_age is not None and created < now - self.max_age:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.evictions += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            return response
+
+    def _update(self, key: str, response: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, response, len(response.encode()), now, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        if self.max_age is not None:
+            cursor = self._conn.execute(
+                "DELETE FROM responses WHERE created < ?", (now - self.max_age,)
+            )
+            self.evictions += cursor.rowcount
+        if self.max_bytes is None:
+            return
+        (total_size,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if total_size <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY last_access"
+        ).fetchall():
+            if total_size <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total_size -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self.evictions += len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+_response_cache: LLMResponseCache | None = None
+
+
+def set_response_cache(cache: LLMResponseCache | None) -> None:
+    """
+    Set the cache used by `get_response` and `get_response_async` when none is passed in
+
+    :param cache: the cache, or None to disable caching
+    """
+    global _response_cache
+    _response_cache = cache
+
+
+def get_response_cache() -> LLMResponseCache | None:
+    return _response_cache
+
+
+def make_cache_key(llm: BaseLanguageModel | BaseChatModel, message: str) -> str:
+    """
+    Key a response by the model class, its parameters (model name, temperature, etc.) and prompt
+    """
+    identity = {
+        "model": f"{type(llm).__module__}.{type(llm).__qualname__}",
+        "params": getattr(llm, "_identifying_params", {}),
+        "prompt_sha256": hashlib.sha256(message.encode()).hexdigest(),
+    }
+    return hashlib.sha256(json.dumps(identity, sort_keys=True, default=str).encode()).hexdigest()
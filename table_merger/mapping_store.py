@@ -0,0 +1,160 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import pydantic
+
+from table_merger.matching import normalize_column_name
+from table_merger.types import IncomingColName, TemplateColName
+
+FUZZY_MATCH_THRESHOLD = 0.8
+
+
+class AcceptedMerge(pydantic.BaseModel):
+    template_columns: list[TemplateColName]
+    incoming_columns: list[IncomingColName]
+    # ColumnInfo.model_dump() for each incoming column
+    incoming_column_info: list[dict]
+    column_mapping: dict[TemplateColName, IncomingColName]
+    transformations: dict[TemplateColName, str]
+
+
+def _resolvable_names(incoming_columns: list[IncomingColName]) -> dict[str, IncomingColName]:
+    # names that normalize the same way (FullName vs Full_Name) can't be told apart
+    by_normalized: dict[str, IncomingColName | None] = {}
+    for name in incoming_columns:
+        normalized = normalize_column_name(name)
+        by_normalized[normalized] = None if normalized in by_normalized else name
+    resolvable = {k: v for k, v in by_normalized.items() if v is not None}
+    resolvable.update({name: name for name in incoming_columns})
+    return resolvable
+
+
+def _resolve(name: str, resolvable: dict[str, IncomingColName]) -> IncomingColName | None:
+    return resolvable.get(name) or resolvable.get(normalize_column_name(name))
+
+
+def schema_fingerprint(columns: list[str]) -> str:
+    """
+    Fingerprint a header so trivial differences in case, spacing and punctuation still match
+    """
+    normalized = [normalize_column_name(x) for x in columns]
+    return hashlib.sha256(json.dumps(normalized).encode()).hexdigest()
+
+
+class MappingStore:
+    """
+    Local store of column mappings and transformations a user has accepted
+
+    Entries are keyed by a fingerprint of the template columns plus the incoming header
+    so a file with a known layout can skip the LLM entirely.
+
+    :param path: SQLite database file
+    :param fuzzy_threshold: minimum overlap of normalized incoming column names for a
+        near-identical header to be recalled
+    """
+
+    def __init__(self, path: Path, fuzzy_threshold: float = FUZZY_MATCH_THRESHOLD) -> None:
+        self.path = path
+        self.fuzzy_threshold = fuzzy_threshold
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS accepted_merges (
+                template_fingerprint TEXT NOT NULL,
+                incoming_fingerprint TEXT NOT NULL,
+                merge TEXT NOT NULL,
+                updated REAL NOT NULL,
+                PRIMARY KEY (template_fingerprint, incoming_fingerprint)
+            )
+            """
+        )
+
+    def save(self, accepted: AcceptedMerge) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO accepted_merges VALUES (?, ?, ?, ?)",
+                (
+                    schema_fingerprint(accepted.template_columns),
+                    schema_fingerprint(accepted.incoming_columns),
+                    accepted.model_dump_json(),
+                    time.time(),
+                ),
+            )
+
+    def recall(
+        self, template_columns: list[TemplateColName], incoming_columns: list[IncomingColName]
+    ) -> AcceptedMerge | None:
+        """
+        Find a previously accepted merge for this pair of layouts
+
+        An exact fingerprint match is tried first, then the closest stored header for the
+        same template whose mapped columns can all be found in the incoming header.
+        The result refers to the column names of `incoming_columns`.
+
+        :param template_columns: the template column names
+        :param incoming_columns: the incoming file's header
+        :return: the accepted merge, or None
+        """
+        template_fingerprint = schema_fingerprint(template_columns)
+        with self._lock:
+            found = self._conn.execute(
+                "SELECT merge FROM accepted_merges"
+                " WHERE template_fingerprint = ? AND incoming_fingerprint = ?",
+                (template_fingerprint, schema_fingerprint(incoming_columns)),
+            ).fetchone()
+            candidates = (
+                [found]
+                if found
+                else self._conn.execute(
+                    "SELECT merge FROM accepted_merges WHERE template_fingerprint = ?"
+                    " ORDER BY updated DESC",
+                    (template_fingerprint,),
+                ).fetchall()
+            )
+
+        resolvable = _resolvable_names(incoming_columns)
+        incoming_normalized = {normalize_column_name(x) for x in incoming_columns}
+        best: tuple[float, AcceptedMerge] | None = None
+        for (merge_json,) in candidates:
+            accepted = AcceptedMerge.model_validate_json(merge_json)
+            stored_normalized = {normalize_column_name(x) for x in accepted.incoming_columns}
+            overlap = len(stored_normalized & incoming_normalized) / len(
+                stored_normalized | incoming_normalized
+            )
+            if overlap < self.fuzzy_threshold or (best and best[0] >= overlap):
+                continue
+            if all(_resolve(x, resolvable) for x in accepted.column_mapping.values()):
+                best = (overlap, accepted)
+
+        if best is None:
+            return None
+        return self._rename_to_incoming(best[1], incoming_columns, resolvable)
+
+    @staticmethod
+    def _rename_to_incoming(
+        accepted: AcceptedMerge,
+        incoming_columns: list[IncomingColName],
+        resolvable: dict[str, IncomingColName],
+    ) -> AcceptedMerge:
+        incoming_column_info = []
+        for info in accepted.incoming_column_info:
+            if name := _resolve(info["name"], resolvable):
+                incoming_column_info.append({**info, "name": name})
+        return AcceptedMerge(
+            template_columns=accepted.template_columns,
+            incoming_columns=incoming_columns,
+            incoming_column_info=incoming_column_info,
+            column_mapping={
+                template_col: _resolve(incoming_col, resolvable) or incoming_col
+                for template_col, incoming_col in accepted.column_mapping.items()
+            },
+            transformations=accepted.transformations,
+        )
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,266 @@
+import re
+from difflib import SequenceMatcher
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from table_merger.table_mergers import ColumnInfo
+
+CONFIDENCE_RANK = {"high": 3, "medium": 2, "low": 1}
+# common header abbreviations, so Policy_No and PolicyNumber share their tokens
+TOKEN_SYNONYMS = {
+    "no": "number",
+    "num": "number",
+    "nbr": "number",
+    "amt": "amount",
+    "dt": "date",
+    "qty": "quantity",
+    "desc": "description",
+    "addr": "address",
+}
+# a pair is locked without the LLM at this score, if the names are this alike and no rival
+# comes within the margin. Values often need a transformation, so the names carry it and
+# the score only turns away pairs whose values look nothing alike
+LOCK_SCORE = 0.5
+LOCK_NAME_SCORE = 0.75
+LOCK_MARGIN = 0.1
+# a column that lost its match to another is only moved to a candidate this good on both
+# names and values, rather than to whatever is left
+FALLBACK_SCORE = 0.5
+
+
+def normalize_column_name(name: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", name.lower())
+
+
+def column_name_tokens(name: str) -> set[str]:
+    # PolicyNumber, policy_number and "Policy Number" all become {"policy", "number"}
+    spaced = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", name)
+    return {TOKEN_SYNONYMS.get(x, x) for x in re.split(r"[^a-z0-9]+", spaced.lower()) if x}
+
+
+def name_similarity(name_a: str, name_b: str) -> float:
+    """
+    Similarity of two column names between 0 and 1, ignoring case and punctuation
+    """
+    return _name_similarity(
+        normalize_column_name(name_a),
+        column_name_tokens(name_a),
+        normalize_column_name(name_b),
+        column_name_tokens(name_b),
+    )
+
+
+def _name_similarity(
+    normalized_a: str, tokens_a: set[str], normalized_b: str, tokens_b: set[str]
+) -> float:
+    token_overlap = (
+        len(tokens_a & tokens_b) / len(tokens_a | tokens_b) if tokens_a or tokens_b else 0
+    )
+    char_ratio = SequenceMatcher(None, normalized_a, normalized_b).ratio()
+    # Premium vs Monthly_Premium
+    containment = (
+        0.85
+        if normalized_a
+        and normalized_b
+        and (normalized_a in normalized_b or normalized_b in normalized_a)
+        else 0.0
+    )
+    return max(token_overlap, char_ratio, containment)
+
+
+def value_shape(value: str) -> str:
+    # AB-12345 -> A-9, 05/01/2023 -> 9/9/9
+    return re.sub(r"[0-9]+", "9", re.sub(r"[A-Za-z]+", "A", value.strip()))
+
+
+class ColumnFeatures:
+    """
+    The parts of a column the match scores look at, worked out once per column
+
+    :param column: the column
+    """
+
+    def __init__(self, column: "ColumnInfo") -> None:
+        self.name = column.name
+        self.normalized_name = normalize_column_name(column.name)
+        self.tokens = column_name_tokens(column.name)
+        self.values = [x for x in column.example_values if x]
+        self.shapes = [value_shape(x) for x in self.values]
+        self.mean_length = sum(map(len, self.values)) / len(self.values) if self.values else 0.0
+        self.output_format: re.Pattern[str] | None
+        try:
+            self.output_format = re.compile(column.output_format)
+        except re.error:
+            self.output_format = None
+        self.profile = column.profile
+        self.pattern_shares = column.profile.pattern_shares() if column.profile else {}
+
+
+def value_similarity(template_col: "ColumnInfo", incoming_col: "ColumnInfo") -> float:
+    """
+    How well the incoming sample values fit the template's, between 0 and 1
+
+    Combines how many incoming values already match the template `output_format`,
+    how many share a character class shape with a template example, and how close
+    the value lengths are.
+    """
+    return _value_similarity(ColumnFeatures(template_col), ColumnFeatures(incoming_col))
+
+
+def _value_similarity(template: ColumnFeatures, incoming: ColumnFeatures) -> float:
+    if not incoming.values or not template.values:
+        return 0.0
+
+    output_format = template.output_format
+    format_match = (
+        sum(bool(output_format.fullmatch(x)) for x in incoming.values) / len(incoming.values)
+        if output_format
+        else 0.0
+    )
+
+    template_shapes = set(template.shapes)
+    shape_match = sum(x in template_shapes for x in incoming.shapes) / len(incoming.shapes)
+
+    length_match = min(incoming.mean_length, template.mean_length) / max(
+        incoming.mean_length, template.mean_length
+    )
+
+    return 0.4 * format_match + 0.4 * shape_match + 0.2 * length_match
+
+
+def profile_similarity(template_col: "ColumnInfo", incoming_col: "ColumnInfo") -> float | None:
+    """
+    How alike two columns' values look from their whole-file profiles, between 0 and 1
+
+    Averages how close the numeric and date rates are with the overlap of the pattern
+    histograms. None if either column wasn't profiled.
+    """
+    return _profile_similarity(ColumnFeatures(template_col), ColumnFeatures(incoming_col))
+
+
+def _profile_similarity(template: ColumnFeatures, incoming: ColumnFeatures) -> float | None:
+    if not template.profile or not incoming.profile:
+        return None
+    numeric_match = 1 - abs(template.profile.numeric_rate - incoming.profile.numeric_rate)
+    date_match = 1 - abs(template.profile.date_rate - incoming.profile.date_rate)
+    pattern_overlap = sum(
+        min(share, incoming.pattern_shares.get(shape, 0.0))
+        for shape, share in template.pattern_shares.items()
+    )
+    return (numeric_match + date_match + pattern_overlap) / 3
+
+
+def match_score(template_col: "ColumnInfo", incoming_col: "ColumnInfo") -> float:
+    return _match_score(ColumnFeatures(template_col), ColumnFeatures(incoming_col))
+
+
+def _match_score(
+    template: ColumnFeatures, incoming: ColumnFeatures, name_score: float | None = None
+) -> float:
+    value_score = _value_similarity(template, incoming)
+    # profiles cover the whole file, the examples only a handful of values
+    if (profile_score := _profile_similarity(template, incoming)) is not None:
+        value_score = (value_score + profile_score) / 2
+    if name_score is None:
+        name_score = _features_name_similarity(template, incoming)
+    return 0.6 * name_score + 0.4 * value_score
+
+
+def _features_name_similarity(features_a: ColumnFeatures, features_b: ColumnFeatures) -> float:
+    return _name_similarity(
+        features_a.normalized_name,
+        features_a.tokens,
+        features_b.normalized_name,
+        features_b.tokens,
+    )
+
+
+def candidate_score(template_col: "ColumnInfo", incoming_col: "ColumnInfo") -> float:
+    type_match = 1.0 if template_col.type.lower() == incoming_col.type.lower() else 0.0
+    return 0.75 * name_similarity(template_col.name, incoming_col.name) + 0.25 * type_match
+
+
+def rank_candidates(
+    template_col: "ColumnInfo", incoming_cols: list["ColumnInfo"], limit: int
+) -> list["ColumnInfo"]:
+    """
+    The incoming columns most likely to map to a template column, best first
+    """
+    return sorted(incoming_cols, key=lambda x: candidate_score(template_col, x), reverse=True)[
+        :limit
+    ]
+
+
+def confidence_rank(confidence: str) -> int:
+    return CONFIDENCE_RANK.get(confidence.strip().lower(), 0)
+
+
+def match_obvious_columns(
+    template_cols: list["ColumnInfo"], incoming_cols: list["ColumnInfo"]
+) -> dict[str, tuple[str, float]]:
+    """
+    Pair up template and incoming columns whose mapping is clear without the LLM
+
+    A pair is locked when it scores at least `LOCK_SCORE`, the names are at least
+    `LOCK_NAME_SCORE` alike, and no other incoming column for that template column, or
+    other template column for that incoming column, comes within `LOCK_MARGIN` of it.
+    Only pairs whose names share a token or contain one another are scored, since
+    anything else can't reach `LOCK_NAME_SCORE` in practice.
+
+    :param template_cols: the template columns
+    :param incoming_cols: the incoming columns
+    :return: incoming column name and score keyed by template column name
+    """
+    template_features = [ColumnFeatures(x) for x in template_cols]
+    incoming_features = [ColumnFeatures(x) for x in incoming_cols]
+    incoming_by_token: dict[str, list[int]] = {}
+    for idx, incoming in enumerate(incoming_features):
+        for token in incoming.tokens:
+            incoming_by_token.setdefault(token, []).append(idx)
+
+    # (score, name similarity) keyed by (template index, incoming index)
+    scores: dict[tuple[int, int], tuple[float, float]] = {}
+    for template_idx, template in enumerate(template_features):
+        candidates = {
+            idx for token in template.tokens for idx in incoming_by_token.get(token, [])
+        }
+        candidates.update(
+            idx
+            for idx, incoming in enumerate(incoming_features)
+            if template.normalized_name
+            and incoming.normalized_name
+            and (
+                template.normalized_name in incoming.normalized_name
+                or incoming.normalized_name in template.normalized_name
+            )
+        )
+        for incoming_idx in candidates:
+            incoming = incoming_features[incoming_idx]
+            name_score = _features_name_similarity(template, incoming)
+            scores[template_idx, incoming_idx] = (
+                _match_score(template, incoming, name_score),
+                name_score,
+            )
+
+    by_template: dict[int, list[tuple[float, int]]] = {}
+    by_incoming: dict[int, list[tuple[float, int]]] = {}
+    for (template_idx, incoming_idx), (score, _) in scores.items():
+        by_template.setdefault(template_idx, []).append((score, incoming_idx))
+        by_incoming.setdefault(incoming_idx, []).append((score, template_idx))
+
+    locked: dict[str, tuple[str, float]] = {}
+    for template_idx, ranked in by_template.items():
+        ranked.sort(reverse=True)
+        best_score, best_incoming = ranked[0]
+        if best_score < LOCK_SCORE or scores[template_idx, best_incoming][1] < LOCK_NAME_SCORE:
+            continue
+        if len(ranked) > 1 and best_score - ranked[1][0] < LOCK_MARGIN:
+            continue
+        rivals = [score for score, idx in by_incoming[best_incoming] if idx != template_idx]
+        if rivals and best_score - max(rivals) < LOCK_MARGIN:
+            continue
+        locked[template_features[template_idx].name] = (
+            incoming_features[best_incoming].name,
+            best_score,
+        )
+    return locked
@@ -0,0 +1,95 @@
+from pathlib import Path
+
+from table_merger import readers
+from table_merger.errors import RowFailure, row_failures
+from table_merger.transforms import RowProjector, compile_row_projector
+from table_merger.types import TemplateColName
+
+READ_BLOCK_SIZE = 1 << 20
+
+# set up once per worker process by init_worker
+_row_projector: RowProjector | None = None
+
+
+def split_row_aligned_ranges(path: Path, chunk_size: int) -> tuple[int, list[tuple[int, int]]]:
+    """
+    Split a csv file into byte ranges that each start and end on a row boundary
+
+    Quotes are tracked from the start of the file with `readers.RowBoundaryScanner`, so
+    a newline inside a quoted field is never used as a boundary.
+
+    :param path: the csv file
+    :param chunk_size: approximate number of bytes per range
+    :return: the offset where the header row ends and the (start, end) ranges after it
+    """
+    boundaries: list[int] = []
+    next_target = 0
+    scanner = readers.RowBoundaryScanner()
+    block_pos = 0
+    with path.open("rb") as in_file:
+        while block := in_file.read(READ_BLOCK_SIZE):
+            # quotes are accounted for up to `start` within the block
+            start = 0
+            while start < len(block):
+                search = max(next_target - block_pos, start)
+                if search >= len(block):
+                    scanner.advance(block, start, len(block))
+                    break
+                scanner.advance(block, start, search)
+                boundary = scanner.next_boundary(block, search)
+                if boundary == -1:
+                    break
+                boundaries.append(block_pos + boundary)
+                next_target = block_pos + boundary + chunk_size
+                start = boundary
+            block_pos += len(block)
+
+    if not boundaries:
+        # header only, without a trailing newline
+        return block_pos, []
+    if boundaries[-1] < block_pos:
+        boundaries.append(block_pos)
+    return boundaries[0], list(zip(boundaries, boundaries[1:]))
+
+
+def init_worker(
+    transforms: dict[TemplateColName, str],
+    memo_size: int = 0,
+    memoized_columns: set[TemplateColName] | None = None,
+) -> None:
+    global _row_projector
+    _row_projector = compile_row_projector(transforms, memo_size, memoized_columns)
+
+
+def apply_range(
+    path: Path, start: int, end: int, field_indexes: list[int], encoding: str
+) -> tuple[int, list[dict], list[tuple[int, list[str], list[RowFailure]]]]:
+    """
+    Apply the worker's row projector to the rows in one byte range of the file
+
+    :return: the number of rows read, the transformed rows, and the failing rows as
+        (row number within the range, the row's fields, the failed columns)
+    """
+    assert _row_projector is not None, "init_worker must run first"
+    with path.open("rb") as in_file:
+        in_file.seek(start)
+        text = in_file.read(end - start).decode(encoding)
+
+    rows = []
+    failed_rows: list[tuple[int, list[str], list[RowFailure]]] = []
+    row_count = 0
+    projected_rows = readers.iter_projected_rows(readers.iter_lines([text]), field_indexes)
+    for row_num, (values, raw) in enumerate(projected_rows):
+        row_count += 1
+        transformed_row, failed_columns = _row_projector(values)
+        if failed_columns:
+            failed_rows.append(
+                (
+                    row_num,
+                    readers.parse_record(raw),
+                    row_failures(failed_columns),
+                )
+            )
+        else:
+            rows.append(transformed_row)
+    return row_count, rows, failed_rows
@@ -0,0 +1,158 @@
+import csv
+import io
+import itertools
+import operator
+from functools import partial
+from typing import Callable, Iterable, Iterator, Sequence, TextIO
+
+READ_BLOCK_SIZE = 1 << 20
+QUOTE = ord('"')
+# bytes after which a quote opens a quoted field
+FIELD_STARTS = (b",", b"\n", b"\r")
+
+# the fields a template uses, in projection order, with None for fields a short row lacks
+ProjectedValues = Sequence[str | None]
+
+
+class RowBoundaryScanner:
+    """
+    Finds where csv records end in raw bytes, a block at a time
+
+    A quote only opens a quoted field at the start of a field, as with `csv.reader`, so
+    a stray quote inside an unquoted field such as `5" tall` doesn't hide the newlines
+    after it. Doubled quotes inside a quoted field are kept as a quote. Only quotes are
+    looked at one by one, stretches without them are searched for newlines in one go.
+    """
+
+    def __init__(self) -> None:
+        self.in_quotes = False
+        # the byte before the next one scanned, a newline at the start of the data
+        self._previous = b"\n"
+        # the last quote seen closed a quoted field, unless the next byte is a quote too
+        self._maybe_escaped = False
+
+    def advance(self, data: bytes, start: int, end: int) -> None:
+        """
+        Take `data[start:end]` into account without looking for a boundary
+        """
+        self._scan(data, start, end, find_boundary=False)
+
+    def next_boundary(self, data: bytes, start: int) -> int:
+        """
+        The offset just after the first newline from `start` that ends a record
+
+        :return: the offset, or -1 when there is none before the end of `data`, which
+            has then all been taken into account
+        """
+        return self._scan(data, start, len(data), find_boundary=True)
+
+    def _scan(self, data: bytes, start: int, end: int, find_boundary: bool) -> int:
+        pos = start
+        while pos < end:
+            if self._maybe_escaped:
+                self._maybe_escaped = False
+                if data[pos] == QUOTE:
+                    self.in_quotes = True
+                    pos += 1
+                    continue
+            if self.in_quotes:
+                quote = data.find(b'"', pos, end)
+                if quote == -1:
+                    pos = end
+                    break
+                self.in_quotes = False
+                self._maybe_escaped = True
+                pos = quote + 1
+                continue
+            quote = data.find(b'"', pos, end)
+            if find_boundary:
+                newline = data.find(b"\n", pos, end if quote == -1 else quote)
+                if newline != -1:
+                    self._previous = b"\n"
+                    return newline + 1
+            if quote == -1:
+                pos = end
+                break
+            previous = data[quote - 1 : quote] if quote > start else self._previous
+            # a quote anywhere else in an unquoted field is part of its text
+            self.in_quotes = previous in FIELD_STARTS
+            pos = quote + 1
+        if pos > start:
+            self._previous = data[pos - 1 : pos]
+        return -1
+
+
+def iter_lines(blocks: Iterable[str]) -> Iterator[str]:
+    """
+    Split decoded blocks of text into lines, keeping the newline on each line
+    """
+    pending = ""
+    for block in blocks:
+        lines = (pending + block).split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    if pending:
+        yield pending
+
+
+def parse_record(raw: str) -> list[str]:
+    """
+    Parse a raw record returned by `iter_projected_rows` into all of its fields
+    """
+    return next(csv.reader(io.StringIO(raw, newline="")), [])
+
+
+def iter_projected_rows(
+    lines: Iterator[str], field_indexes: list[int]
+) -> Iterator[tuple[ProjectedValues, str]]:
+    """
+    Parse csv records, keeping only the fields at `field_indexes`
+
+    Lines without a quote are split with a `maxsplit` that stops after the last used
+    field, so the fields after it are never separated out. Records with quotes go
+    through `csv.reader`, which also picks up fields that span lines. Blank lines are
+    skipped and short rows are padded with None, as with `csv.reader` in `apply`.
+
+    :param lines: the lines of the file after the header, with their newlines
+    :param field_indexes: the fields to keep, in the order they are wanted
+    :return: the projected values and the raw record text, for each record
+    """
+    width = max(field_indexes, default=-1) + 1
+    # itemgetter returns a bare value rather than a tuple for a single index
+    get_values: Callable[[list[str]], ProjectedValues]
+    if len(field_indexes) > 1:
+        get_values = operator.itemgetter(*field_indexes)
+    else:
+        get_values = lambda fields: [fields[idx] for idx in field_indexes]  # noqa: E731
+
+    for line in lines:
+        if '"' in line:
+            consumed: list[str] = []
+            # the reader pulls in as many more lines as the quoted record needs
+            fields = next(csv.reader(_recording(itertools.chain([line], lines), consumed)), [])
+            if not fields:
+                continue
+            raw = "".join(consumed)
+        else:
+            stripped = line.rstrip("\r\n")
+            if not stripped:
+                continue
+            raw = line
+            fields = stripped.split(",", width)
+        if len(fields) < width:
+            fields += [None] * (width - len(fields))  # type: ignore
+        yield get_values(fields), raw
+
+
+def _recording(lines: Iterator[str], consumed: list[str]) -> Iterator[str]:
+    for line in lines:
+        consumed.append(line)
+        yield line
+
+
+def iter_file_lines(in_file: TextIO, block_size: int = READ_BLOCK_SIZE) -> Iterator[str]:
+    """
+    The lines of a text file, read and decoded a large block at a time
+    """
+    return iter_lines(iter(partial(in_file.read, block_size), ""))
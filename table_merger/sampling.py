@@ -0,0 +1,185 @@
+import csv
+import random
+from pathlib import Path
+from typing import Sequence, TextIO
+
+from table_merger.profiling import ColumnProfile
+
+SAMPLES_PER_COLUMN = 10
+# longer cells are cut down before they go into a prompt
+MAX_CELL_CHARS = 120
+# the same file always gives the same samples, and so the same prompts
+SAMPLE_SEED = 0
+# files at least this big are sampled by seeking to random offsets instead of a full read
+RANDOM_OFFSET_MIN_BYTES = 64 * 1024 * 1024
+RANDOM_OFFSET_PROBES = 2000
+PROFILE_BATCH_ROWS = 4096
+
+
+def truncate_cell(value: str, max_chars: int = MAX_CELL_CHARS) -> str:
+    if len(value) <= max_chars:
+        return value
+    return f"{value[:max_chars]}... ({len(value)} characters)"
+
+
+class ColumnSampler:
+    """
+    Reservoir sample of distinct values for each column, in constant memory
+
+    Every value in the file has a chance of being picked, so sorted files still give
+    representative samples. Values are truncated before sampling and duplicates of a
+    value already in the reservoir are skipped. With `profile` set, the same pass also
+    builds a `ColumnProfile` for each column from the full values.
+
+    :param columns: the header
+    :param size: values kept per column
+    :param max_cell_chars: cells longer than this are truncated
+    :param seed: seed for the sampling
+    :param profile: also profile each column
+    """
+
+    def __init__(
+        self,
+        columns: Sequence[str],
+        size: int = SAMPLES_PER_COLUMN,
+        max_cell_chars: int = MAX_CELL_CHARS,
+        seed: int = SAMPLE_SEED,
+        profile: bool = False,
+    ) -> None:
+        self.columns = list(columns)
+        self.size = size
+        self.max_cell_chars = max_cell_chars
+        self.rows_seen = 0
+        self._rng = random.Random(seed)
+        self._reservoirs: list[list[str]] = [[] for _ in self.columns]
+        self._kept: list[set[str]] = [set() for _ in self.columns]
+        self._distinct_seen = [0] * len(self.columns)
+        self._profiles = [ColumnProfile() for _ in self.columns] if profile else None
+        # rows waiting to be profiled, a column at a time
+        self._pending_rows: list[Sequence[str]] = []
+
+    def add_row(self, row: Sequence[str]) -> None:
+        self.rows_seen += 1
+        if self._profiles is not None:
+            self._pending_rows.append(row)
+            if len(self._pending_rows) >= PROFILE_BATCH_ROWS:
+                self._profile_pending_rows()
+        for index, value in enumerate(row[: len(self.columns)]):
+            if len(value) > self.max_cell_chars:
+                value = truncate_cell(value, self.max_cell_chars)
+            kept = self._kept[index]
+            if value in kept:
+                continue
+            reservoir = self._reservoirs[index]
+            self._distinct_seen[index] += 1
+            if len(reservoir) < self.size:
+                reservoir.append(value)
+                kept.add(value)
+                continue
+            replace_at = self._rng.randrange(self._distinct_seen[index])
+            if replace_at < self.size:
+                kept.discard(reservoir[replace_at])
+                reservoir[replace_at] = value
+                kept.add(value)
+
+    def samples(self) -> dict[str, list[str]]:
+        return dict(zip(self.columns, (list(x) for x in self._reservoirs)))
+
+    def _profile_pending_rows(self) -> None:
+        assert self._profiles is not None
+        width = len(self.columns)
+        # short rows are padded with None, which the profile counts as a null
+        columns = zip(
+            *(
+                row if len(row) == width else [*row[:width], *[None] * (width - len(row))]
+                for row in self._pending_rows
+            )
+        )
+        for column_profile, values in zip(self._profiles, columns):
+            column_profile.add_many(values)
+        self._pending_rows = []
+
+    def profiles(self) -> dict[str, ColumnProfile]:
+        if self._profiles is None:
+            return {}
+        if self._pending_rows:
+            self._profile_pending_rows()
+        return dict(zip(self.columns, self._profiles))
+
+
+def sample_text_io(
+    in_file: TextIO,
+    size: int = SAMPLES_PER_COLUMN,
+    max_cell_chars: int = MAX_CELL_CHARS,
+    profile: bool = False,
+) -> ColumnSampler | None:
+    """
+    Sample every column in one pass over a csv file
+
+    :param in_file: the file, read from its current position
+    :param size: values kept per column
+    :param max_cell_chars: cells longer than this are truncated
+    :param profile: also profile each column
+    :return: the sampler, or None if the file has no header
+    """
+    reader = csv.reader(in_file)
+    header = next(reader, None)
+    if not header:
+        return None
+    sampler = ColumnSampler(header, size, max_cell_chars, profile=profile)
+    for row in reader:
+        if row:
+            sampler.add_row(row)
+    return sampler
+
+
+def sample_path_at_random_offsets(
+    path: Path,
+    size: int = SAMPLES_PER_COLUMN,
+    max_cell_chars: int = MAX_CELL_CHARS,
+    probes: int = RANDOM_OFFSET_PROBES,
+    encoding: str = "utf-8",
+    profile: bool = False,
+) -> ColumnSampler | None:
+    """
+    Sample a large csv file by reading the row after each of a number of random offsets
+
+    Only `probes` rows are read, whatever the size of the file. A probe that lands
+    inside a quoted field with newlines is discarded when its field count doesn't
+    match the header. Profiles, if asked for, are built from the probed rows only and
+    are marked `sampled`.
+
+    :param path: the file
+    :param size: values kept per column
+    :param max_cell_chars: cells longer than this are truncated
+    :param probes: number of random offsets to read from
+    :param encoding: the file's encoding
+    :param profile: also profile each column
+    :return: the sampler, or None if the file has no header
+    """
+    with path.open("rb") as in_file:
+        header = next(csv.reader([in_file.readline().decode(encoding)]), None)
+        if not header:
+            return None
+        data_start = in_file.tell()
+        file_size = path.stat().st_size
+        sampler = ColumnSampler(header, size, max_cell_chars, profile=profile)
+        rng = random.Random(SAMPLE_SEED)
+        offsets = (
+            sorted(rng.randrange(data_start, file_size) for _ in range(probes))
+            if file_size > data_start
+            else []
+        )
+        for offset in offsets:
+            in_file.seek(offset)
+            # the first line is most likely partial
+            in_file.readline()
+            line = in_file.readline()
+            if not line:
+                continue
+            row = next(csv.reader([line.decode(encoding, errors="replace")]), [])
+            if len(row) == len(header):
+                sampler.add_row(row)
+        for column_profile in sampler.profiles().values():
+            column_profile.sampled = True
+        return sampler
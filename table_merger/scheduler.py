@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+# openai 0.x error classes that are worth retrying, matched by name to avoid the import
+RETRYABLE_ERROR_NAMES = {
+    "RateLimitError",
+    "APIConnectionError",
+    "ServiceUnavailableError",
+    "Timeout",
+    "TryAgain",
+}
+
+
+def is_retryable_error(exc: BaseException) -> bool:
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    status = getattr(exc, "http_status", None) or getattr(exc, "status_code", None)
+    if status in RETRYABLE_STATUS_CODES:
+        return True
+    return any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(exc).__mro__)
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at a per minute rate
+
+    :param per_minute: tokens added per minute
+    :param capacity: most tokens the bucket holds, defaults to one minute's worth
+    """
+
+    def __init__(self, per_minute: float, capacity: float | None = None) -> None:
+        self.rate = per_minute / 60
+        self.capacity = capacity or per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock: asyncio.Lock | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    async def acquire(self, amount: float = 1) -> None:
+        # a request larger than the bucket would never fit, so it waits for a full bucket
+        amount = min(amount, self.capacity)
+        # asyncio primitives belong to one loop, and the sync API runs a new loop per call
+        if self._lock is None or self._loop is not asyncio.get_running_loop():
+            self._lock = asyncio.Lock()
+            self._loop = asyncio.get_running_loop()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                await asyncio.sleep((amount - self._tokens) / self.rate)
+
+
+class LLMScheduler:
+    """
+    Runs LLM calls with a concurrency cap, request and token rate limits, per call timeouts
+    and retries with jittered exponential backoff
+
+    :param max_concurrency: most calls in flight at once
+    :param requests_per_minute: request quota, None for no limit
+    :param tokens_per_minute: token quota, None for no limit
+    :param max_retries: retries for errors that look transient, such as 429s and timeouts
+    :param base_delay: backoff before the first retry in seconds, doubled on each retry
+    :param max_delay: cap on the backoff in seconds
+    :param timeout: seconds a single attempt may take, None for no timeout
+    :param rng: random source for the jitter
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        timeout: float | None = 120.0,
+        rng: random.Random | None = None,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.rng = rng or random.Random()
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self._semaphore: asyncio.Semaphore | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # created lazily for the running loop, the sync API runs a new loop per call
+        if self._semaphore is None or self._loop is not asyncio.get_running_loop():
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = asyncio.get_running_loop()
+        return self._semaphore
+
+    async def run(self, call: Callable[[], Awaitable[T]], estimated_tokens: int = 0) -> T:
+        """
+        Run an LLM call under the scheduler's limits
+
+        :param call: creates the awaitable for one attempt
+        :param estimated_tokens: prompt plus expected response tokens, charged to the token quota
+        :return: the call's result
+        """
+        attempt = 0
+        while True:
+            async with self.semaphore:
+                if self.request_bucket:
+                    await self.request_bucket.acquire()
+                if self.token_bucket and estimated_tokens:
+                    await self.token_bucket.acquire(estimated_tokens)
+                self.calls += 1
+                try:
+                    return await asyncio.wait_for(call(), self.timeout)
+                except Exception as exc:
+                    if attempt >= self.max_retries or not is_retryable_error(exc):
+                        self.failures += 1
+                        raise
+                    logging.warning("LLM call failed, retrying: %r", exc)
+
+            # full jitter keeps many retrying callers from hitting the quota in lockstep
+            delay = min(self.max_delay, self.base_delay * 2**attempt)
+            await asyncio.sleep(self.rng.uniform(0, delay))
+            attempt += 1
+            self.retries += 1
+
+    def stats(self) -> dict[str, int]:
+        return {"calls": self.calls, "retries": self.retries, "failures": self.failures}
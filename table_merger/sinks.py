@@ -0,0 +1,401 @@
+import csv
+import datetime
+import itertools
+import json
+import pickle
+import tempfile
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, BinaryIO, Callable, Iterable, Iterator, TextIO
+
+from table_merger.transform_library import date_formats
+from table_merger.types import TemplateColName
+
+if TYPE_CHECKING:
+    from table_merger.table_mergers import ColumnInfo
+
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+WRITE_BATCH_SIZE = 10_000
+RECORD_BATCH_SIZE = 64 * 1024
+# ColumnInfo.type values are free text from the LLM
+INTEGER_TYPES = {"int", "integer", "bigint"}
+NUMBER_TYPES = {"number", "numeric", "float", "double", "decimal", "currency", "money"}
+DATE_TYPES = {"date"}
+
+
+class RowSink:
+    """
+    Base class for destinations of transformed rows
+
+    Subclasses implement `write_rows`. A single sink can be shared by several merge
+    operations to combine them into one output.
+    """
+
+    rows_written = 0
+
+    def write_rows(self, rows: Iterable[dict]) -> int:
+        """
+        Write rows keyed by template column
+
+        :param rows: the transformed rows
+        :return: number of rows written
+        """
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.flush()
+
+
+class CsvSink(RowSink):
+    """
+    Streams transformed rows into a csv file in template column order
+
+    A single sink can be shared by several merge operations to combine them into one output.
+    """
+
+    def __init__(
+        self,
+        out_file: TextIO,
+        columns: list[TemplateColName],
+        write_header: bool = True,
+        batch_size: int = WRITE_BATCH_SIZE,
+    ) -> None:
+        self.out_file = out_file
+        self.columns = columns
+        self.batch_size = batch_size
+        self.rows_written = 0
+        self._writer = csv.writer(out_file)
+        if write_header:
+            self._writer.writerow(columns)
+
+    def write_rows(self, rows: Iterable[dict]) -> int:
+        """
+        Write rows, filling in template columns missing from a row with an empty value
+
+        :param rows: transformed rows keyed by template column
+        :return: number of rows written
+        """
+        columns = self.columns
+        values = ([row.get(col, "") for col in columns] for row in rows)
+        written = 0
+        while batch := list(itertools.islice(values, self.batch_size)):
+            self._writer.writerows(batch)
+            written += len(batch)
+        self.rows_written += written
+        return written
+
+    def flush(self) -> None:
+        self.out_file.flush()
+
+
+class SpoolSink(RowSink):
+    """
+    Holds rows in a temporary file until they are known to be complete
+
+    Lets a file's rows be copied into a shared sink only once the whole file was
+    transformed, so a failure part way doesn't leave some of them in the output.
+    """
+
+    def __init__(self, batch_size: int = WRITE_BATCH_SIZE) -> None:
+        self.batch_size = batch_size
+        self.rows_written = 0
+        self._file = tempfile.TemporaryFile()
+
+    def write_rows(self, rows: Iterable[dict]) -> int:
+        rows = iter(rows)
+        written = 0
+        while batch := list(itertools.islice(rows, self.batch_size)):
+            pickle.dump(batch, self._file, pickle.HIGHEST_PROTOCOL)
+            written += len(batch)
+        self.rows_written += written
+        return written
+
+    def rows(self) -> Iterator[dict]:
+        """
+        The spooled rows, in the order they were written
+        """
+        self._file.seek(0)
+        while True:
+            try:
+                batch = pickle.load(self._file)
+            except EOFError:
+                return
+            yield from batch
+
+    def close(self) -> None:
+        self._file.close()
+
+
+REJECT_COLUMNS = ["row_number", "reject_reasons"]
+
+
+def read_reject_header(path: Path) -> list[str] | None:
+    """
+    The incoming columns heading an existing reject file
+
+    :param path: the reject file
+    :raises ValueError: when the file isn't empty and doesn't start with a reject header
+    :return: the incoming file's columns, or None if there is no file or it's empty
+    """
+    if not path.exists():
+        return None
+    with path.open(newline="") as in_file:
+        header = next(csv.reader(in_file), None)
+    if header is None:
+        return None
+    if header[: len(REJECT_COLUMNS)] != REJECT_COLUMNS:
+        raise ValueError(f"{path} isn't a file of rejected rows")
+    return header[len(REJECT_COLUMNS) :]
+
+
+class RejectSink:
+    """
+    Writes incoming rows that failed to transform, with the reasons, to a csv file
+
+    The columns are the row number, the reasons, then the incoming file's own columns.
+    The header is written once, so every incoming file sharing a reject file must have
+    the same columns.
+
+    :param out_file: the output, opened with newline=""
+    :param header: the incoming columns already heading `out_file` when adding to it,
+        see `read_reject_header`
+    """
+
+    def __init__(self, out_file: TextIO, header: list[str] | None = None) -> None:
+        self.out_file = out_file
+        self.rows_written = 0
+        self._writer = csv.writer(out_file)
+        self._header = header
+
+    def start(self, header: list[str]) -> None:
+        """
+        Write the header for an incoming file, or check it matches the one already written
+
+        :param header: the incoming file's header
+        :raises ValueError: when rejects from a file with other columns were written
+        """
+        if self._header is None:
+            self._writer.writerow([*REJECT_COLUMNS, *header])
+            self._header = header
+        elif header != self._header:
+            raise ValueError(
+                f"The reject file holds rows with columns {self._header}, not {header}."
+                " Use a separate reject file for this incoming file"
+            )
+
+    def write_row(self, row_num: int, fields: list[str], reasons: list[str]) -> None:
+        self._writer.writerow([row_num, "; ".join(reasons), *fields])
+        self.rows_written += 1
+
+    def flush(self) -> None:
+        self.out_file.flush()
+
+
+class TypedColumn:
+    """
+    How the text values of a template column convert to a typed value
+
+    The kind is worked out from `ColumnInfo.type`: "int", "float", "date" or "string".
+    Date columns are only typed when one strptime format fits the template's examples
+    and output format, otherwise they stay strings.
+
+    :param column_info: the template column
+    """
+
+    def __init__(self, column_info: "ColumnInfo") -> None:
+        self.name = column_info.name
+        column_type = column_info.type.strip().lower()
+        self.date_format: str | None = None
+        if column_type in INTEGER_TYPES:
+            self.kind = "int"
+        elif column_type in NUMBER_TYPES:
+            self.kind = "float"
+        elif (
+            column_type in DATE_TYPES
+            and len(
+                found := date_formats(
+                    [x for x in column_info.example_values if x.strip()],
+                    column_info.output_format,
+                )
+            )
+            == 1
+        ):
+            self.kind = "date"
+            self.date_format = found[0]
+        else:
+            self.kind = "string"
+        self.convert: Callable[[Any], Any] = getattr(self, f"_to_{self.kind}")
+        # values that couldn't be converted and were written as null
+        self.failures = 0
+
+    def _to_int(self, value: Any) -> int | None:
+        if isinstance(value, int) or value is None:
+            return value
+        text = str(value).replace(",", "").strip()
+        try:
+            return int(text)
+        except ValueError:
+            pass
+        # only for text like "150.0", parsing every value as a float loses digits past 2**53
+        try:
+            number = float(text)
+        except ValueError:
+            self._count_failure(value)
+            return None
+        if number.is_integer():
+            return int(number)
+        self._count_failure(value)
+        return None
+
+    def _to_float(self, value: Any) -> float | None:
+        if isinstance(value, float) or value is None:
+            return value
+        try:
+            return float(str(value).replace(",", ""))
+        except ValueError:
+            self._count_failure(value)
+            return None
+
+    def _to_date(self, value: Any) -> datetime.date | None:
+        if isinstance(value, datetime.date) or value is None:
+            return value
+        assert self.date_format
+        try:
+            return datetime.datetime.strptime(str(value).strip(), self.date_format).date()
+        except ValueError:
+            self._count_failure(value)
+            return None
+
+    def _to_string(self, value: Any) -> str | None:
+        return value if value is None or isinstance(value, str) else str(value)
+
+    def _count_failure(self, value: Any) -> None:
+        # an empty value is a null rather than a failure
+        if str(value).strip():
+            self.failures += 1
+
+
+class JsonLinesSink(RowSink):
+    """
+    Writes transformed rows as newline delimited JSON with typed values
+
+    Numbers are written as JSON numbers and dates in ISO format.
+
+    :param out_file: the output stream
+    :param columns: the template columns
+    :param batch_size: rows encoded per write
+    """
+
+    def __init__(
+        self, out_file: TextIO, columns: list["ColumnInfo"], batch_size: int = WRITE_BATCH_SIZE
+    ) -> None:
+        self.out_file = out_file
+        self.columns = [TypedColumn(x) for x in columns]
+        self.batch_size = batch_size
+        self.rows_written = 0
+        self._encoder = json.JSONEncoder(default=datetime.date.isoformat, ensure_ascii=False)
+
+    def write_rows(self, rows: Iterable[dict]) -> int:
+        columns = [(x.name, x.convert) for x in self.columns]
+        encode = self._encoder.encode
+        lines = (
+            encode({name: convert(row.get(name)) for name, convert in columns}) + "\n"
+            for row in rows
+        )
+        written = 0
+        while batch := list(itertools.islice(lines, self.batch_size)):
+            self.out_file.write("".join(batch))
+            written += len(batch)
+        self.rows_written += written
+        return written
+
+    def flush(self) -> None:
+        self.out_file.flush()
+
+
+class ArrowSink(RowSink):
+    """
+    Writes transformed rows as typed Parquet or Arrow IPC record batches
+
+    Rows are gathered a column at a time into record batches of `batch_size` rows.
+    Needs pyarrow, which is optional: `poetry install --extras arrow`. Call `close` to
+    finish the file.
+
+    :param out_file: the output, opened in binary mode
+    :param columns: the template columns
+    :param file_format: "parquet" or "ipc"
+    :param batch_size: rows per record batch
+    """
+
+    def __init__(
+        self,
+        out_file: BinaryIO,
+        columns: list["ColumnInfo"],
+        file_format: str = "parquet",
+        batch_size: int = RECORD_BATCH_SIZE,
+    ) -> None:
+        try:
+            import pyarrow as pa  # type: ignore[import-not-found]
+        except ImportError as exc:
+            raise ImportError(
+                "Parquet and Arrow IPC output need pyarrow, install it with"
+                " `poetry install --extras arrow` or `pip install pyarrow`"
+            ) from exc
+
+        self._pa = pa
+        self.columns = [TypedColumn(x) for x in columns]
+        self.batch_size = batch_size
+        self.rows_written = 0
+        arrow_types = {
+            "int": pa.int64(),
+            "float": pa.float64(),
+            "date": pa.date32(),
+            "string": pa.string(),
+        }
+        self.schema = pa.schema([(x.name, arrow_types[x.kind]) for x in self.columns])
+        if file_format == "parquet":
+            import pyarrow.parquet as pq  # type: ignore[import-not-found]
+
+            self._writer = pq.ParquetWriter(out_file, self.schema)
+        elif file_format == "ipc":
+            self._writer = pa.ipc.new_file(out_file, self.schema)
+        else:
+            raise ValueError(f"Unknown columnar format {file_format}, use parquet or ipc")
+        self._pending: list[list] = [[] for _ in self.columns]
+
+    def write_rows(self, rows: Iterable[dict]) -> int:
+        columns = [(x.name, x.convert, values) for x, values in zip(self.columns, self._pending)]
+        written = 0
+        for row in rows:
+            for name, convert, values in columns:
+                values.append(convert(row.get(name)))
+            written += 1
+            if len(self._pending[0]) >= self.batch_size:
+                self._write_batch()
+                columns = [
+                    (x.name, x.convert, values) for x, values in zip(self.columns, self._pending)
+                ]
+        self.rows_written += written
+        return written
+
+    def _write_batch(self) -> None:
+        if not self._pending or not self._pending[0]:
+            return
+        batch = self._pa.RecordBatch.from_arrays(
+            [
+                self._pa.array(values, type=field.type)
+                for values, field in zip(self._pending, self.schema)
+            ],
+            schema=self.schema,
+        )
+        self._writer.write_batch(batch)
+        self._pending = [[] for _ in self.columns]
+
+    def flush(self) -> None:
+        self._write_batch()
+
+    def close(self) -> None:
+        self._write_batch()
+        self._writer.close()
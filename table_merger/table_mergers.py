@@ -1,7 +1,14 @@
 import asyncio
+import contextlib
 import csv
+import io
+import itertools
 import json
+import logging
+import os
 import textwrap
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from pathlib import Path
 from types import CodeType
 from typing import Generator, TextIO
@@ -11,24 +18,116 @@ from langchain.chat_models.base import BaseChatModel
 from langchain.output_parsers import PydanticOutputParser
 from langchain.prompts import PromptTemplate
 from langchain.schema.language_model import BaseLanguageModel
+from pydantic.json_schema import SkipJsonSchema
 
+from table_merger import checkpoint, parallel, readers
+from table_merger.dry_run import DRY_RUN_ROWS, DryRunReport, dry_run_transforms
+from table_merger.errors import ErrorCollector, row_failures
+from table_merger.mapping_store import AcceptedMerge, MappingStore
+from table_merger.matching import (
+    FALLBACK_SCORE,
+    candidate_score,
+    confidence_rank,
+    match_obvious_columns,
+    match_score,
+    rank_candidates,
+)
+from table_merger.profiling import ColumnProfile
+from table_merger.sampling import (
+    RANDOM_OFFSET_MIN_BYTES,
+    ColumnSampler,
+    sample_path_at_random_offsets,
+    sample_text_io,
+)
+from table_merger.scheduler import LLMScheduler
+from table_merger.sinks import (
+    OUTPUT_BUFFER_SIZE,
+    RECORD_BATCH_SIZE,
+    ArrowSink,
+    CsvSink,
+    JsonLinesSink,
+    RejectSink,
+    SpoolSink,
+    RowSink,
+    read_reject_header,
+)
+from table_merger.transform_library import detect_transform
+from table_merger.transforms import (
+    TRANSFORM_MEMO_SIZE,
+    RowProjector,
+    compile_row_projector,
+    is_memoizable,
+    transform_memo_stats,
+    validate_transform,
+)
 from table_merger.types import IncomingColName, TemplateColName
 from table_merger.util import (
     convert_list_of_pydantic_objects_for_json,
-    get_response,
+    estimate_tokens,
+    get_context_size,
+    get_max_output_tokens,
     get_response_async,
-    parse_and_attempt_repair_for_output,
+    parse_and_attempt_repair_for_output_async,
 )
 
 MAX_ROW_SAMPLES = 10
+PARALLEL_CHUNK_SIZE = 16 * 1024 * 1024
+# wider templates are mapped in chunks of this many columns
+MERGE_INFO_CHUNK_SIZE = 25
+# narrower incoming files are sent whole with every chunk
+MAX_INCOMING_COLUMNS_PER_CHUNK = 50
+CANDIDATES_PER_TEMPLATE_COLUMN = 5
+# rough size of one ColumnInfo in a response, excluding the name and examples
+COLUMN_INFO_OUTPUT_TOKENS = 60
+
+BATCH_COLUMN_INFO_PROMPT = textwrap.dedent(
+    """
+    We are working with a table of csv data and have a template document to
+    use for combining other csv files with it. The first step is to
+    analyze the template and report the column information. We need
+    the following column information for every column:
+
+    - name - exactly as given
+    - column type (e.g. string, number, date)
+    - output format is a broad regex it seems to conform to.
+    - empty_expected - whether or not we expect the column to be empty
+    - a minimal set of examples that show unique traits. Usually one is sufficient. No empty values.
+
+    Here are the column names with some sample values, in JSON format:
+    BEGIN COLUMNS
+    -----
+    {columns}
+    -----
+    END COLUMNS
+
+    Report one entry per column, in the same order.
+
+    {format_instructions}
+    """
+).strip()
+# only added when every profile in the prompt was built from the whole incoming file
+PROFILE_INSTRUCTIONS = """
+
+An incoming column profile, when given, summarizes every value in the incoming file. The
+expression must handle all of the patterns and the empty values it reports, not just the examples."""
 
 
 class ColumnInfo(pydantic.BaseModel):
+    model_config = pydantic.ConfigDict(arbitrary_types_allowed=True)
+
     name: str
     type: str
     output_format: str
     empty_expected: bool
     example_values: list[str]
+    # statistics over the whole file, kept out of the LLM's schema and of dumps
+    profile: SkipJsonSchema[ColumnProfile | None] = pydantic.Field(
+        default=None, exclude=True, repr=False
+    )
+
+
+class ColumnInfoBatch(pydantic.BaseModel):
+    columns: list[ColumnInfo]
 
 
 class ColumnMapping(pydantic.BaseModel):
@@ -56,28 +155,146 @@ class ColumnTransformations(pydantic.BaseModel):
     errors: list[str]
 
 
+class FileMergeStatus(pydantic.BaseModel):
+    path: Path
+    # pending, merged or failed
+    state: str = "pending"
+    recalled: bool = False
+    rows_written: int = 0
+    errors: list[str] = []
+
+
 class TableMergeOperation:
     def __init__(
         self,
         template_column_info: list[ColumnInfo],
         incoming_column_info: list[ColumnInfo],
         in_file: TextIO,
+        in_path: Path | None = None,
+        scheduler: LLMScheduler | None = None,
     ) -> None:
         self.template_column_info = template_column_info
         self.incoming_column_info = incoming_column_info
         self.in_file = in_file
+        self.in_path = in_path
+        self.scheduler = scheduler
+        # mapping and transformations came from the mapping store rather than the LLM
+        self.recalled = False
         self.suggested_merge_info: ColumnMergeInfo | None = None
         self.actual_column_mapping: dict[TemplateColName, IncomingColName] | None = None
         self.suggested_transformation_operations: ColumnTransformations | None = None
         self.actual_transformation_operations: dict[str, CodeType] = {}
+        self.actual_transformation_sources: dict[str, str] = {}
+        self.row_projector: RowProjector | None = None
+        self.row_projector_columns: list[TemplateColName] = []
+        # values cached per deterministic transform, 0 turns memoizing off
+        self.memo_size = TRANSFORM_MEMO_SIZE
         self.errors: list[str] = []
+        # rows that fail to transform are written here in full, when set
+        self.reject_sink: RejectSink | None = None
+        # counts of the row errors from the last apply
+        self.error_collector = ErrorCollector(self.errors)
 
     def create_suggested_merge_info(
         self,
         llm: BaseChatModel | BaseLanguageModel,
         repair_llm: BaseChatModel | BaseLanguageModel | None = None,
+        template_chunk_size: int | None = MERGE_INFO_CHUNK_SIZE,
+        premap: bool = True,
     ) -> ColumnMergeInfo:
+        return asyncio.run(
+            self.create_suggested_merge_info_async(llm, repair_llm, template_chunk_size, premap)
+        )
+
+    async def create_suggested_merge_info_async(
+        self,
+        llm: BaseChatModel | BaseLanguageModel,
+        repair_llm: BaseChatModel | BaseLanguageModel | None = None,
+        template_chunk_size: int | None = MERGE_INFO_CHUNK_SIZE,
+        premap: bool = True,
+    ) -> ColumnMergeInfo:
+        """
+        Ask the LLM how the incoming columns map to the template columns
+
+        Templates wider than `template_chunk_size` are split into chunks that are mapped in
+        parallel, each against its likeliest incoming columns, and the results are combined.
+
+        :param llm: the model to ask
+        :param repair_llm: the model used to fix unparseable output, defaults to `llm`
+        :param template_chunk_size: most template columns per request, None for no limit
+        :param premap: lock in pairs that are clear from the column names and sample values
+            locally, so only the rest go to the LLM
+        """
         repair_llm = repair_llm or llm
+        # scoring every pair is CPU bound, so keep it off the event loop
+        locked = (
+            await asyncio.to_thread(
+                match_obvious_columns, self.template_column_info, self.incoming_column_info
+            )
+            if premap
+            else {}
+        )
+        locked_incoming = {incoming_col for incoming_col, _ in locked.values()}
+        template_cols = [x for x in self.template_column_info if x.name not in locked]
+        incoming_cols = [x for x in self.incoming_column_info if x.name not in locked_incoming]
+
+        if not template_cols:
+            column_merge_info = ColumnMergeInfo(reasoning=[], column_mapping=[], errors=[])
+        elif not template_chunk_size or len(template_cols) <= template_chunk_size:
+            column_merge_info = await self._suggest_merge_info(
+                template_cols, incoming_cols, llm, repair_llm
+            )
+        else:
+            chunks = [
+                template_cols[idx : idx + template_chunk_size]
+                for idx in range(0, len(template_cols), template_chunk_size)
+            ]
+            chunk_results = await asyncio.gather(
+                *(
+                    self._suggest_merge_info(
+                        chunk, self._incoming_candidates(chunk, incoming_cols), llm, repair_llm
+                    )
+                    for chunk in chunks
+                )
+            )
+            column_merge_info = self._reduce_merge_info(chunk_results, incoming_cols)
+
+        if locked:
+            column_merge_info = self._add_locked_mappings(column_merge_info, locked)
+        self.suggested_merge_info = column_merge_info
+        return column_merge_info
+
+    def _add_locked_mappings(
+        self, column_merge_info: ColumnMergeInfo, locked: dict[str, tuple[str, float]]
+    ) -> ColumnMergeInfo:
+        mappings = {x.template_column: x for x in column_merge_info.column_mapping}
+        for template_col, (incoming_col, score) in locked.items():
+            mappings[template_col] = ColumnMapping(
+                template_column=template_col,
+                incoming_column=incoming_col,
+                reasoning=f"Column names and sample values match (score {score:.2f}).",
+                confidence="high",
+                ambiguous_with=[],
+            )
+        template_order = {x.name: idx for idx, x in enumerate(self.template_column_info)}
+        return ColumnMergeInfo(
+            reasoning=[
+                f"{len(locked)} column(s) were matched locally without the LLM.",
+                *column_merge_info.reasoning,
+            ],
+            column_mapping=sorted(
+                mappings.values(), key=lambda x: template_order.get(x.template_column, -1)
+            ),
+            errors=column_merge_info.errors,
+        )
+
+    async def _suggest_merge_info(
+        self,
+        template_column_info: list[ColumnInfo],
+        incoming_column_info: list[ColumnInfo],
+        llm: BaseChatModel | BaseLanguageModel,
+        repair_llm: BaseChatModel | BaseLanguageModel,
+    ) -> ColumnMergeInfo:
         prompt_template_str = textwrap.dedent(
             """
             We are mapping data table columns from a new file to the template file.
@@ -116,19 +333,95 @@ class TableMergeOperation:
         )
         formatted_prompt = prompt_template.format_prompt(
             template_column_info=json.dumps(
-                convert_list_of_pydantic_objects_for_json(self.template_column_info)
+                convert_list_of_pydantic_objects_for_json(template_column_info)
             ),
             incoming_column_info=json.dumps(
-                convert_list_of_pydantic_objects_for_json(self.incoming_column_info)
+                convert_list_of_pydantic_objects_for_json(incoming_column_info)
             ),
         )
-        output = get_response(llm, formatted_prompt.to_string())
-        column_merge_info: ColumnMergeInfo = parse_and_attempt_repair_for_output(
-            output, parser, formatted_prompt, repair_llm
+        output = await get_response_async(
+            llm, formatted_prompt.to_string(), scheduler=self.scheduler, parser=parser
+        )
+        column_merge_info: ColumnMergeInfo = await parse_and_attempt_repair_for_output_async(
+            output, parser, formatted_prompt, repair_llm, scheduler=self.scheduler
         )
-        self.suggested_merge_info = column_merge_info
         return column_merge_info
 
+    def _incoming_candidates(
+        self, template_chunk: list[ColumnInfo], incoming_cols: list[ColumnInfo]
+    ) -> list[ColumnInfo]:
+        if len(incoming_cols) <= MAX_INCOMING_COLUMNS_PER_CHUNK:
+            return incoming_cols
+        candidate_names = {
+            candidate.name
+            for template_col in template_chunk
+            for candidate in rank_candidates(
+                template_col, incoming_cols, CANDIDATES_PER_TEMPLATE_COLUMN
+            )
+        }
+        return [x for x in incoming_cols if x.name in candidate_names]
+
+    def _reduce_merge_info(
+        self, chunk_results: list[ColumnMergeInfo], incoming_cols: list[ColumnInfo]
+    ) -> ColumnMergeInfo:
+        """
+        Combine the mappings for each chunk of template columns
+
+        Chunks can't see each other, so two of them may claim the same incoming column.
+        The most confident claim keeps it and the others move to their next best unused
+        candidate, flagged as ambiguous with the contested column. A column with no unused
+        candidate scoring at least `FALLBACK_SCORE` is reported missing instead.
+        """
+        mappings = [mapping for result in chunk_results for mapping in result.column_mapping]
+        reasoning = [line for result in chunk_results for line in result.reasoning]
+        errors = [error for result in chunk_results for error in result.errors]
+
+        claims: dict[IncomingColName, ColumnMapping] = {}
+        for mapping in sorted(mappings, key=lambda x: -confidence_rank(x.confidence)):
+            claims.setdefault(mapping.incoming_column, mapping)
+        used_incoming = set(claims)
+        template_cols_by_name = {x.name: x for x in self.template_column_info}
+
+        column_mapping = []
+        for mapping in mappings:
+            if claims[mapping.incoming_column] is mapping:
+                column_mapping.append(mapping)
+                continue
+            template_col = template_cols_by_name.get(mapping.template_column)
+            alternatives: list[IncomingColName] = []
+            if template_col:
+                alternatives = [
+                    x.name
+                    for x in rank_candidates(
+                        template_col, incoming_cols, CANDIDATES_PER_TEMPLATE_COLUMN
+                    )
+                    if x.name not in used_incoming
+                    and min(candidate_score(template_col, x), match_score(template_col, x))
+                    >= FALLBACK_SCORE
+                ]
+            claimed_by = claims[mapping.incoming_column].template_column
+            if not alternatives:
+                errors.append(
+                    f"Column {mapping.template_column} is missing. Its best match"
+                    f" {mapping.incoming_column} was used for {claimed_by}."
+                )
+                continue
+            used_incoming.add(alternatives[0])
+            column_mapping.append(
+                ColumnMapping(
+                    template_column=mapping.template_column,
+                    incoming_column=alternatives[0],
+                    reasoning=(
+                        f"{mapping.incoming_column} was a better fit for {claimed_by}."
+                        f" Original reasoning: {mapping.reasoning}"
+                    ),
+                    confidence="low",
+                    ambiguous_with=[mapping.incoming_column, *alternatives[1:]],
+                )
+            )
+
+        return ColumnMergeInfo(reasoning=reasoning, column_mapping=column_mapping, errors=errors)
+
     def assign_column_mapping(
         self, column_mapping: dict[TemplateColName, IncomingColName]
     ) -> None:
@@ -138,9 +431,72 @@ class TableMergeOperation:
         self,
         llm: BaseChatModel | BaseLanguageModel,
         repair_llm: BaseChatModel | BaseLanguageModel | None = None,
+        use_library: bool = True,
     ) -> ColumnTransformations:
+        return asyncio.run(
+            self.create_suggested_transformation_operations_async(llm, repair_llm, use_library)
+        )
+
+    async def create_suggested_transformation_operations_async(
+        self,
+        llm: BaseChatModel | BaseLanguageModel,
+        repair_llm: BaseChatModel | BaseLanguageModel | None = None,
+        use_library: bool = True,
+    ) -> ColumnTransformations:
+        """
+        Suggest a transformation for each template column
+
+        Columns the built-in transform library recognizes (already matching, date format
+        changes, name reordering, separators, numbers) don't go to the LLM. The LLM is
+        only called for the rest, and not at all if nothing is left.
+
+        :param llm: the LLM that writes the remaining transformations
+        :param repair_llm: the LLM that repairs malformed output, defaults to `llm`
+        :param use_library: try the built-in transform library first
+        :return: the suggested transformations, in template column order
+        """
         assert self.actual_column_mapping
         repair_llm = repair_llm or llm
+        incoming_cols_by_name = {x.name: x for x in self.incoming_column_info}
+        library_transforms: dict[TemplateColName, ColumnTransform] = {}
+        if use_library:
+            for template_col in self.template_column_info:
+                incoming_col = incoming_cols_by_name[
+                    self.actual_column_mapping[template_col.name]
+                ]
+                if found := detect_transform(template_col, incoming_col):
+                    library_transforms[template_col.name] = ColumnTransform(
+                        reasoning=[found.reasoning],
+                        column_name=template_col.name,
+                        python_lambda_body=found.python_lambda_body,
+                    )
+        remaining_cols = [
+            x for x in self.template_column_info if x.name not in library_transforms
+        ]
+
+        llm_transformations = ColumnTransformations(transformations=[], errors=[])
+        if remaining_cols:
+            llm_transformations = await self._suggest_transformations(
+                remaining_cols, llm, repair_llm
+            )
+        llm_transforms = {x.column_name: x for x in llm_transformations.transformations}
+        col_transformations = ColumnTransformations(
+            transformations=[
+                library_transforms.get(x.name) or llm_transforms[x.name]
+                for x in self.template_column_info
+                if x.name in library_transforms or x.name in llm_transforms
+            ],
+            errors=llm_transformations.errors,
+        )
+        self.suggested_transformation_operations = col_transformations
+        return col_transformations
+
+    async def _suggest_transformations(
+        self,
+        template_cols: list[ColumnInfo],
+        llm: BaseChatModel | BaseLanguageModel,
+        repair_llm: BaseChatModel | BaseLanguageModel,
+    ) -> ColumnTransformations:
         prompt_template_str = textwrap.dedent(
             """
             We converting data from one input table to match the format of the template table.
@@ -156,7 +512,7 @@ class TableMergeOperation:
             in the JSON payload. Avoid unpredictable values. The JSON payload will contain the code.
 
             The Python code within the JSON response to transform a column should be no longer than a single line. It should
-            be the body of the lambda function `lambda value: <contents goes here>`.
+            be the body of the lambda function `lambda value: <contents goes here>`.{profile_instructions}
 
             Python Code examples:
             "value"
@@ -171,13 +527,23 @@ class TableMergeOperation:
         parser = PydanticOutputParser(pydantic_object=ColumnTransformations)  # type: ignore
         prompt_template = PromptTemplate(
             template=prompt_template_str,
-            input_variables=["column_data"],
+            input_variables=["column_data", "profile_instructions"],
             partial_variables={"format_instructions": parser.get_format_instructions()},
         )
         column_data = []
         incoming_cols_by_name = {x.name: x for x in self.incoming_column_info}
-        template_col: ColumnInfo
-        for template_col in self.template_column_info:
+        assert self.actual_column_mapping
+        profiles = [
+            incoming_cols_by_name[self.actual_column_mapping[x.name]].profile
+            for x in template_cols
+        ]
+        # a profile from probes of a large file can't promise to cover every value
+        profile_instructions = (
+            PROFILE_INSTRUCTIONS
+            if any(profiles) and not any(x.sampled for x in profiles if x)
+            else ""
+        )
+        for template_col in template_cols:
             incoming_col = incoming_cols_by_name[self.actual_column_mapping[template_col.name]]
             column_data.append(
                 {
@@ -189,70 +555,494 @@ class TableMergeOperation:
                     "empty_expected": template_col.empty_expected,
                     "example_values_template": template_col.example_values,
                     "example_values_incoming": incoming_col.example_values,
+                    **(
+                        {"incoming_column_profile": incoming_col.profile.summary()}
+                        if incoming_col.profile
+                        else {}
+                    ),
                 }
             )
 
-        formatted_prompt = prompt_template.format_prompt(column_data=json.dumps(column_data))
-        output = get_response(llm, formatted_prompt.to_string())
-        col_transformations: ColumnTransformations = parse_and_attempt_repair_for_output(
-            output, parser, formatted_prompt, repair_llm
+        formatted_prompt = prompt_template.format_prompt(
+            column_data=json.dumps(column_data), profile_instructions=profile_instructions
+        )
+        output = await get_response_async(
+            llm, formatted_prompt.to_string(), scheduler=self.scheduler, parser=parser
+        )
+        return await parse_and_attempt_repair_for_output_async(
+            output, parser, formatted_prompt, repair_llm, scheduler=self.scheduler
         )
-        self.suggested_transformation_operations = col_transformations
-        return col_transformations
 
     def assign_column_transformations(
         self, actual_transformations: dict[str, str]
     ) -> dict[str, CodeType]:
         result = {}
+        sources = {}
         for column, transform in actual_transformations.items():
             try:
-                compiled_transform = compile(transform, "<string>", "eval")
+                compiled_transform = compile(validate_transform(transform), "<string>", "eval")
             except Exception as exc:
                 self.errors.append(f"Could not compile transform {transform}. Reason: {exc}")
                 continue
             result[column] = compiled_transform
+            sources[column] = transform
         self.actual_transformation_operations = result
+        self.actual_transformation_sources = sources
+        # columns run in mapping order so errors are reported in the same order as before
+        column_order = [*(self.actual_column_mapping or {}), *sources]
+        self.row_projector_columns = [
+            column for column in dict.fromkeys(column_order) if column in sources
+        ]
+        self.row_projector = self._compile_row_projector(
+            {column: sources[column] for column in self.row_projector_columns}
+        )
         return result
 
+    def _memoized_columns(self, transforms: dict[TemplateColName, str]) -> set[TemplateColName]:
+        # a column with more distinct values than fit in the memo would mostly miss
+        incoming_cols_by_name = {x.name: x for x in self.incoming_column_info}
+        mapping = self.actual_column_mapping or {}
+        memoized = set()
+        for column, transform in transforms.items():
+            incoming_col = incoming_cols_by_name.get(mapping.get(column, ""))
+            profile = incoming_col.profile if incoming_col else None
+            # a sampled profile's distinct count says little about the whole file
+            if is_memoizable(transform) and (
+                profile is None or profile.sampled or profile.distinct_count <= self.memo_size
+            ):
+                memoized.add(column)
+        return memoized
+
+    def _compile_row_projector(self, transforms: dict[TemplateColName, str]) -> RowProjector:
+        return compile_row_projector(
+            transforms, self.memo_size, self._memoized_columns(transforms)
+        )
+
+    def transform_memo_stats(self) -> dict[TemplateColName, dict[str, int]]:
+        """
+        Hits, misses and evictions of the memo of each memoized column since the
+        transformations were assigned, to help tune `memo_size`
+
+        Rows transformed by `apply_parallel` are not counted, each worker has its own memo.
+        """
+        return transform_memo_stats(self.row_projector) if self.row_projector else {}
+
+    def dry_run_transformations(self, max_rows: int = DRY_RUN_ROWS) -> DryRunReport:
+        """
+        Try the assigned transformations on the incoming examples and the first rows of
+        the file, so a bad plan shows up before the full pass
+
+        Columns with failures or outputs that don't match the template's output_format
+        are also reported in `errors`.
+
+        :param max_rows: rows read from the start of the incoming file, when `in_path` is set
+        :return: per column failure and format mismatch rates and a rows/sec estimate
+        """
+        assert self.actual_column_mapping
+        mapping = self.actual_column_mapping
+        columns = [x for x in self.row_projector_columns if x in mapping]
+        rows: list[readers.ProjectedValues] = []
+        if self.in_path:
+            encoding = getattr(self.in_file, "encoding", None) or "utf-8"
+            with self.in_path.open(newline="", encoding=encoding) as in_file:
+                lines = readers.iter_file_lines(in_file)
+                field_indexes = {
+                    field: idx for idx, field in enumerate(next(csv.reader(lines), []))
+                }
+                columns = [x for x in columns if mapping[x] in field_indexes]
+                projected_rows = readers.iter_projected_rows(
+                    lines, [field_indexes[mapping[x]] for x in columns]
+                )
+                rows = [values for values, _ in itertools.islice(projected_rows, max_rows)]
+
+        incoming_cols_by_name = {x.name: x for x in self.incoming_column_info}
+        values: dict[TemplateColName, list[str | None]] = {}
+        for idx, column in enumerate(columns):
+            incoming_col = incoming_cols_by_name.get(mapping[column])
+            values[column] = [
+                *(incoming_col.example_values if incoming_col else []),
+                *(row[idx] for row in rows),
+            ]
+        report = dry_run_transforms(
+            {x: self.actual_transformation_sources[x] for x in columns},
+            values,
+            {x.name: x.output_format for x in self.template_column_info},
+            rows,
+        )
+        for result in report.columns:
+            if result.failures:
+                self.errors.append(
+                    f"Dry run of column {result.column}: {result.failures} of"
+                    f" {result.values_tested} values failed, e.g. {'; '.join(result.sample_errors)}"
+                )
+            if result.format_mismatches:
+                self.errors.append(
+                    f"Dry run of column {result.column}: {result.format_mismatches} values"
+                    " don't match the template's output format."
+                )
+        return report
+
+    def _build_projection_plan(self, header: list[str]) -> list[tuple[TemplateColName, int]]:
+        """
+        Resolve which field of each incoming row feeds which template column
+
+        Problems with the mapping are reported once here rather than once per row.
+
+        :param header: the header row of the incoming file
+        :return: (template column, incoming field index) pairs in mapping order
+        """
+        assert self.actual_column_mapping
+        field_indexes: dict[str, int] = {}
+        for idx, field in enumerate(header):
+            # csv.DictReader keeps the last column when a name is repeated
+            field_indexes[field] = idx
+
+        plan = []
+        for template_col, incoming_col in self.actual_column_mapping.items():
+            if incoming_col not in field_indexes:
+                self.errors.append(f"Column {incoming_col} not found in input data.")
+                continue
+            if template_col not in self.actual_transformation_sources:
+                self.errors.append(f"No transformation found for column {template_col}.")
+                continue
+            plan.append((template_col, field_indexes[incoming_col]))
+        return plan
+
+    def _get_row_projector(self, plan: list[tuple[TemplateColName, int]]) -> RowProjector:
+        projected_columns = [template_col for template_col, _ in plan]
+        if self.row_projector is None or self.row_projector_columns != projected_columns:
+            self.row_projector = self._compile_row_projector(
+                {col: self.actual_transformation_sources[col] for col in projected_columns}
+            )
+            self.row_projector_columns = projected_columns
+        return self.row_projector
+
     def apply(self) -> Generator:
-        import datetime  # noqa: F401
-        import re  # noqa: F401
+        assert self.actual_transformation_operations
+        assert self.actual_column_mapping
 
-        import arrow  # noqa: F401
+        if self.in_file.closed and self.in_path:
+            # prep_csv_file_from_path closes the file once the columns are extracted
+            with self.in_path.open("r") as in_file:
+                self.in_file = in_file
+                yield from self.apply()
+            return
 
+        lines = readers.iter_file_lines(self.in_file)
+        header = next(csv.reader(lines), None)
+        if header is None:
+            return
+        plan = self._build_projection_plan(header)
+        row_projector = self._get_row_projector(plan)
+        error_collector = self._start_error_collection(header)
+
+        # only the fields the plan uses are split out of each row
+        projected_rows = readers.iter_projected_rows(lines, [idx for _, idx in plan])
+        try:
+            for row_num, (values, raw) in enumerate(projected_rows):
+                transformed_row, failed_columns = row_projector(values)
+                if failed_columns:
+                    error_collector.record(
+                        row_num + 1,
+                        readers.parse_record(raw),
+                        row_failures(failed_columns),
+                    )
+                else:
+                    yield transformed_row
+        finally:
+            error_collector.finish()
+
+    def _start_error_collection(self, header: list[str]) -> ErrorCollector:
+        if self.reject_sink:
+            self.reject_sink.start(header)
+        self.error_collector = ErrorCollector(self.errors, reject_sink=self.reject_sink)
+        return self.error_collector
+
+    def apply_parallel(
+        self,
+        processes: int | None = None,
+        chunk_size: int = PARALLEL_CHUNK_SIZE,
+    ) -> Generator:
+        """
+        Apply the transformations using a pool of processes
+
+        The input file is split into row aligned byte ranges which are transformed
+        independently. Rows are yielded in input order and errors use the same row
+        numbers as `apply`. Files that fit in a single range are applied in process.
+
+        :param processes: number of worker processes, defaults to the cpu count
+        :param chunk_size: approximate number of bytes handed to a worker at a time
+        """
         assert self.actual_transformation_operations
         assert self.actual_column_mapping
+        assert self.in_path, "Parallel apply needs a file on disk, see prep_csv_file_from_path"
+
+        header_end, ranges = parallel.split_row_aligned_ranges(self.in_path, chunk_size)
+        if len(ranges) <= 1:
+            yield from self.apply()
+            return
 
-        reader = csv.DictReader(self.in_file)
+        encoding = getattr(self.in_file, "encoding", None) or "utf-8"
+        with self.in_path.open("rb") as in_file:
+            header_text = in_file.read(header_end).decode(encoding)
+        header = next(csv.reader(io.StringIO(header_text, newline="")), [])
+        plan = self._build_projection_plan(header)
+        error_collector = self._start_error_collection(header)
+        transforms = {
+            template_col: self.actual_transformation_sources[template_col]
+            for template_col, _ in plan
+        }
+        field_indexes = [idx for _, idx in plan]
 
-        for row_num, row in enumerate(reader):
-            transformed_row = {}
-            row_errors = []
-            for template_col, incoming_col in self.actual_column_mapping.items():
-                if incoming_col not in row:
-                    self.errors.append(f"Column {incoming_col} not found in input data.")
-                    continue
+        processes = processes or os.cpu_count() or 1
+        rows_before = 0
+        try:
+            with ProcessPoolExecutor(
+                processes,
+                initializer=parallel.init_worker,
+                initargs=(transforms, self.memo_size, self._memoized_columns(transforms)),
+            ) as executor:
+                pending: deque[Future] = deque()
+                range_iter = iter(ranges)
+                while True:
+                    # keep a bounded number of ranges in flight so memory stays flat
+                    for start, end in itertools.islice(range_iter, processes * 2 - len(pending)):
+                        pending.append(
+                            executor.submit(
+                                parallel.apply_range,
+                                self.in_path,
+                                start,
+                                end,
+                                field_indexes,
+                                encoding,
+                            )
+                        )
+                    if not pending:
+                        break
+                    row_count, rows, failed_rows = pending.popleft().result()
+                    for row_num, fields, failures in failed_rows:
+                        error_collector.record(rows_before + row_num + 1, fields, failures)
+                    rows_before += row_count
+                    yield from rows
+        finally:
+            error_collector.finish()
 
-                compiled_transform = self.actual_transformation_operations.get(template_col)
-                if not compiled_transform:
-                    self.errors.append(f"No transformation found for column {template_col}.")
-                    continue
+    def apply_to_sink(self, sink: RowSink, in_parallel: bool = False) -> int:
+        """
+        Stream the transformed rows into a sink
 
-                try:
-                    transformed_value = eval(
-                        compiled_transform,
-                        {"arrow": arrow, "re": re, "datetime": datetime},
-                        {"value": row[incoming_col]},
+        :param sink: where the rows go, may be shared with other operations
+        :param in_parallel: use `apply_parallel` rather than `apply`
+        :return: number of rows written
+        """
+        rows = self.apply_parallel() if in_parallel else self.apply()
+        return sink.write_rows(rows)
+
+    def apply_to_stream(
+        self, out_file: TextIO, write_header: bool = True, in_parallel: bool = False
+    ) -> int:
+        """
+        Stream the transformed rows into a text stream as csv
+
+        :param out_file: the stream, opened with newline=""
+        :param write_header: whether to write the template columns as the first row
+        :param in_parallel: use `apply_parallel` rather than `apply`
+        :return: number of rows written
+        """
+        sink = CsvSink(out_file, [x.name for x in self.template_column_info], write_header)
+        written = self.apply_to_sink(sink, in_parallel)
+        sink.flush()
+        return written
+
+    def apply_to_file(
+        self,
+        path: Path,
+        append: bool = False,
+        in_parallel: bool = False,
+        reject_path: Path | None = None,
+    ) -> int:
+        """
+        Stream the transformed rows into a csv file
+
+        :param path: the output file
+        :param append: add to the end of an existing output, such as one written for another
+            incoming file. The header is only written when the file is empty.
+        :param in_parallel: use `apply_parallel` rather than `apply`
+        :param reject_path: write the rows that fail to transform here, with the reasons. It is
+            added to rather than replaced when `append` is set, and its header is only
+            written when the file is empty.
+        :raises ValueError: when appending to a reject file written for other columns
+        :return: number of rows written
+        """
+        with contextlib.ExitStack() as stack:
+            out_file = stack.enter_context(
+                path.open("a" if append else "w", newline="", buffering=OUTPUT_BUFFER_SIZE)
+            )
+            if reject_path:
+                reject_header = read_reject_header(reject_path) if append else None
+                self.reject_sink = RejectSink(
+                    stack.enter_context(reject_path.open("a" if append else "w", newline="")),
+                    reject_header,
+                )
+                stack.callback(setattr, self, "reject_sink", None)
+            return self.apply_to_stream(out_file, out_file.tell() == 0, in_parallel)
+
+    def apply_to_file_resumable(
+        self,
+        path: Path,
+        checkpoint_path: Path,
+        reject_path: Path | None = None,
+        checkpoint_interval: int = checkpoint.CHECKPOINT_INTERVAL,
+    ) -> int:
+        """
+        Stream the transformed rows into a csv file, checkpointing so a failed run can resume
+
+        Every `checkpoint_interval` bytes of input, the output is synced to disk and the
+        input offset, row counts, output offsets and error counts are saved to
+        `checkpoint_path`. Calling this again after a failure picks up from the last
+        checkpoint, discarding any output written after it, as long as the input file
+        and the transformations are unchanged. The checkpoint is removed once the file
+        is done.
+
+        :param path: the output file
+        :param checkpoint_path: where the checkpoint is kept
+        :param reject_path: write the rows that fail to transform here, with the reasons
+        :param checkpoint_interval: input bytes between checkpoints
+        :return: number of rows written, including those written before a resume
+        """
+        assert self.actual_transformation_operations
+        assert self.actual_column_mapping
+        assert self.in_path, "Resumable apply needs a file on disk, see prep_csv_file_from_path"
+
+        encoding = getattr(self.in_file, "encoding", None) or "utf-8"
+        input_fingerprint = checkpoint.input_fingerprint(self.in_path)
+        transform_fingerprint = checkpoint.transform_fingerprint(
+            [x.name for x in self.template_column_info],
+            self.actual_column_mapping,
+            self.actual_transformation_sources,
+        )
+        resume_from = checkpoint.load_checkpoint(checkpoint_path)
+        if resume_from and (
+            resume_from.input_fingerprint != input_fingerprint
+            or resume_from.transform_fingerprint != transform_fingerprint
+            or not path.exists()
+            or (reject_path and (resume_from.reject_offset is None or not reject_path.exists()))
+        ):
+            logging.warning("Not resuming from %s, the merge has changed", checkpoint_path)
+            resume_from = None
+
+        with contextlib.ExitStack() as stack:
+            in_file = stack.enter_context(self.in_path.open("rb"))
+            header_end, header = checkpoint.read_header(in_file, encoding)
+            plan = self._build_projection_plan(header)
+            row_projector = self._get_row_projector(plan)
+            field_indexes = [idx for _, idx in plan]
+
+            state = resume_from or checkpoint.Checkpoint(
+                input_fingerprint=input_fingerprint,
+                transform_fingerprint=transform_fingerprint,
+                input_offset=header_end,
+                rows_read=0,
+                output_offset=0,
+                rows_written=0,
+            )
+            out_file = stack.enter_context(
+                checkpoint.open_output(
+                    path, resume_from.output_offset if resume_from else None, OUTPUT_BUFFER_SIZE
+                )
+            )
+            sink = CsvSink(
+                out_file, [x.name for x in self.template_column_info], resume_from is None
+            )
+            reject_file = None
+            if reject_path:
+                reject_file = stack.enter_context(
+                    checkpoint.open_output(
+                        reject_path, resume_from.reject_offset if resume_from else None
                     )
-                    transformed_row[template_col] = transformed_value
-                except Exception as exc:
-                    row_errors.append(
-                        f"Row: {row_num + 1} - Error applying transformation for column {template_col}. Reason: {exc}"
+                )
+                self.reject_sink = RejectSink(reject_file)
+                stack.callback(setattr, self, "reject_sink", None)
+                if resume_from is None:
+                    self.reject_sink.start(header)
+            error_collector = self.error_collector = ErrorCollector(
+                self.errors, reject_sink=self.reject_sink
+            )
+            error_collector.counts.update(
+                {(template_col, kind): count for template_col, kind, count in state.error_counts}
+            )
+            error_collector.failed_rows = state.failed_rows
+
+            next_checkpoint = state.input_offset + checkpoint_interval
+            try:
+                for block_end, block in checkpoint.iter_row_aligned_blocks(
+                    in_file, state.input_offset
+                ):
+                    rows = []
+                    projected_rows = readers.iter_projected_rows(
+                        readers.iter_lines([block.decode(encoding)]), field_indexes
                     )
-            if row_errors:
-                self.errors.extend(row_errors)
+                    for values, raw in projected_rows:
+                        state.rows_read += 1
+                        transformed_row, failed_columns = row_projector(values)
+                        if failed_columns:
+                            error_collector.record(
+                                state.rows_read,
+                                readers.parse_record(raw),
+                                row_failures(failed_columns),
+                            )
+                        else:
+                            rows.append(transformed_row)
+                    state.rows_written += sink.write_rows(rows)
+                    state.input_offset = block_end
+                    if block_end >= next_checkpoint:
+                        # the output has to be on disk before a checkpoint refers to it
+                        state.output_offset = checkpoint.sync(out_file)
+                        if reject_file:
+                            state.reject_offset = checkpoint.sync(reject_file)
+                        state.error_counts = [
+                            (template_col, kind, count)
+                            for (template_col, kind), count in error_collector.counts.items()
+                        ]
+                        state.failed_rows = error_collector.failed_rows
+                        checkpoint.save_checkpoint(checkpoint_path, state)
+                        next_checkpoint = block_end + checkpoint_interval
+            finally:
+                error_collector.finish()
+        checkpoint_path.unlink(missing_ok=True)
+        return state.rows_written
+
+    def apply_to_typed_file(
+        self,
+        path: Path,
+        file_format: str = "parquet",
+        batch_size: int = RECORD_BATCH_SIZE,
+        in_parallel: bool = False,
+    ) -> int:
+        """
+        Write the transformed rows to a file with typed columns
+
+        Column types come from the template's `ColumnInfo.type`. Values that don't
+        convert are written as null, see `TypedColumn`.
+
+        :param path: the output file
+        :param file_format: "parquet" or "ipc" (both need pyarrow), or "jsonl"
+        :param batch_size: rows per record batch
+        :param in_parallel: use `apply_parallel` rather than `apply`
+        :return: number of rows written
+        """
+        sink: RowSink
+        with contextlib.ExitStack() as stack:
+            if file_format == "jsonl":
+                out_file = stack.enter_context(
+                    path.open("w", encoding="utf-8", buffering=OUTPUT_BUFFER_SIZE)
+                )
+                sink = JsonLinesSink(out_file, self.template_column_info, batch_size)
             else:
-                yield transformed_row
+                binary_out = stack.enter_context(path.open("wb", buffering=OUTPUT_BUFFER_SIZE))
+                sink = ArrowSink(binary_out, self.template_column_info, file_format, batch_size)
+            stack.callback(sink.close)
+            return self.apply_to_sink(sink, in_parallel)
 
 
 class TableMergerManager:
@@ -261,10 +1051,21 @@ class TableMergerManager:
         llm: BaseChatModel | BaseLanguageModel,
         power_llm: BaseChatModel | BaseLanguageModel | None = None,
         repair_llm: BaseChatModel | BaseLanguageModel | None = None,
+        mapping_store: MappingStore | None = None,
+        batch_column_inference: bool = False,
+        scheduler: LLMScheduler | None = None,
+        profile_columns: bool = True,
     ) -> None:
         self.llm = llm
         self.power_llm = power_llm or self.llm
         self.repair_llm = repair_llm or self.llm
+        self.mapping_store = mapping_store
+        # describe many columns per request rather than one request per column
+        self.batch_column_inference = batch_column_inference
+        # concurrency, rate limits and retries for the manager's LLM calls
+        self.scheduler = scheduler or LLMScheduler()
+        # profile every column while sampling, for the matching and transform stages
+        self.profile_columns = profile_columns
         self.template_columns: list[ColumnInfo] = []
         self.errors: list[str] = []
 
@@ -274,35 +1075,150 @@ class TableMergerManager:
 
         :return: True if the table merger is ready to run
         """
-        self.template_columns = asyncio.run(self._extract_columns_from_file(template_file))
+        return asyncio.run(self.ready_async(template_file))
+
+    async def ready_async(self, template_file: TextIO) -> bool:
+        """
+        Ready the Table Merger
+
+        :return: True if the table merger is ready to run
+        """
+        self.template_columns = await self._extract_columns_from_file(template_file)
         if not self.template_columns:
             self.errors.append("No columns found in template file")
             return False
         return True
 
-    async def _extract_columns_from_file(self, incoming_file: TextIO) -> list[ColumnInfo]:
+    def _sample_file(self, incoming_file: TextIO, path: Path | None) -> ColumnSampler | None:
         cur_pos = incoming_file.tell()
         try:
-            reader = csv.DictReader(incoming_file)
-            columns = reader.fieldnames
-            sample_rows = []
-            row_counter = 0
-            for row in reader:
-                sample_rows.append(row)
-                row_counter += 1
-                if row_counter >= MAX_ROW_SAMPLES:
-                    break
-            if not columns:
-                return []
-            output_col_tasks = []
-            for column in columns:
-                sample_values = [row[column] for row in sample_rows]
-                output_col_tasks.append(self._infer_column_info(column, sample_values))
-            output_column_info = await asyncio.gather(*output_col_tasks)
-            return output_column_info
+            if path and cur_pos == 0 and path.stat().st_size >= RANDOM_OFFSET_MIN_BYTES:
+                return sample_path_at_random_offsets(
+                    path, MAX_ROW_SAMPLES, profile=self.profile_columns
+                )
+            return sample_text_io(incoming_file, MAX_ROW_SAMPLES, profile=self.profile_columns)
         finally:
             incoming_file.seek(cur_pos)
 
+    async def _extract_columns_from_file(
+        self, incoming_file: TextIO, path: Path | None = None
+    ) -> list[ColumnInfo]:
+        """
+        Infer the column info of a csv file from samples taken across the whole file
+
+        :param incoming_file: the file, read from its current position and seeked back
+        :param path: where the file is on disk, lets a large file be sampled at random offsets
+        :return: the column info in file order
+        """
+        # sampling reads the file, keep it off the event loop other files are prepared on
+        sampler = await asyncio.to_thread(self._sample_file, incoming_file, path)
+        if not sampler:
+            return []
+        column_samples = sampler.samples()
+        output_column_info: list[ColumnInfo]
+        if self.batch_column_inference:
+            output_column_info = await self._infer_column_info_batched(column_samples)
+        else:
+            output_col_tasks = []
+            for column, sample_values in column_samples.items():
+                output_col_tasks.append(self._infer_column_info(column, sample_values))
+            output_column_info = list(await asyncio.gather(*output_col_tasks))
+        profiles = sampler.profiles()
+        for column, column_info in zip(column_samples, output_column_info):
+            column_info.profile = profiles.get(column)
+        return output_column_info
+
+    async def _infer_column_info_batched(
+        self, column_samples: dict[str, list[str]]
+    ) -> list[ColumnInfo]:
+        """
+        Infer column info for several columns per request
+
+        Columns are packed into as few requests as fit the model's context. Any column that
+        is missing from a response, or whose batch fails to parse, is retried on its own.
+
+        :param column_samples: sample values keyed by column name, in file order
+        :return: column info in the same order as `column_samples`
+        """
+        batches = self._plan_column_batches(column_samples)
+        batch_results = await asyncio.gather(
+            *(
+                self._infer_column_info_batch(
+                    {column: column_samples[column] for column in batch}
+                )
+                for batch in batches
+            )
+        )
+        inferred: dict[str, ColumnInfo] = {}
+        for batch_result in batch_results:
+            inferred.update(batch_result)
+
+        missing = [column for column in column_samples if column not in inferred]
+        fallback_results = await asyncio.gather(
+            *(self._infer_column_info(column, column_samples[column]) for column in missing)
+        )
+        inferred.update(zip(missing, fallback_results))
+        return [inferred[column] for column in column_samples]
+
+    def _plan_column_batches(self, column_samples: dict[str, list[str]]) -> list[list[str]]:
+        context_size = get_context_size(self.llm)
+        output_budget = get_max_output_tokens(self.llm) or context_size // 2
+        parser = PydanticOutputParser(pydantic_object=ColumnInfoBatch)  # type: ignore
+        input_budget = (
+            context_size
+            - output_budget
+            - estimate_tokens(BATCH_COLUMN_INFO_PROMPT + parser.get_format_instructions())
+        )
+
+        batches: list[list[str]] = []
+        batch: list[str] = []
+        input_tokens = output_tokens = 0
+        for column, sample_values in column_samples.items():
+            column_input_tokens = estimate_tokens(json.dumps({column: sample_values}))
+            # the response repeats the name and a couple of the samples for each column
+            column_output_tokens = COLUMN_INFO_OUTPUT_TOKENS + estimate_tokens(
+                json.dumps([column, *sample_values[:2]])
+            )
+            if batch and (
+                input_tokens + column_input_tokens > input_budget
+                or output_tokens + column_output_tokens > output_budget
+            ):
+                batches.append(batch)
+                batch = []
+                input_tokens = output_tokens = 0
+            batch.append(column)
+            input_tokens += column_input_tokens
+            output_tokens += column_output_tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    async def _infer_column_info_batch(
+        self, column_samples: dict[str, list[str]]
+    ) -> dict[str, ColumnInfo]:
+        parser = PydanticOutputParser(pydantic_object=ColumnInfoBatch)  # type: ignore
+        prompt_template = PromptTemplate(
+            template=BATCH_COLUMN_INFO_PROMPT,
+            input_variables=["columns"],
+            partial_variables={"format_instructions": parser.get_format_instructions()},
+        )
+        formatted_prompt = prompt_template.format_prompt(columns=json.dumps(column_samples))
+        output = await get_response_async(
+            self.llm, formatted_prompt.to_string(), scheduler=self.scheduler, parser=parser
+        )
+        try:
+            column_info_batch: ColumnInfoBatch = await parse_and_attempt_repair_for_output_async(
+                output, parser, formatted_prompt, self.repair_llm, do_not_repair=True
+            )
+        except Exception:
+            # every column in the batch falls back to its own request
+            return {}
+        return {
+            column_info.name: column_info
+            for column_info in column_info_batch.columns
+            if column_info.name in column_samples
+        }
+
     async def _infer_column_info(self, column_name, sample_values) -> ColumnInfo:
         prompt_template_str = textwrap.dedent(
             """
@@ -342,9 +1258,11 @@ class TableMergerManager:
         formatted_prompt = prompt_template.format_prompt(
             column_name=column_name, sample_values=json.dumps(sample_values)
         )
-        output = await get_response_async(self.llm, formatted_prompt.to_string())
-        column_info: ColumnInfo = parse_and_attempt_repair_for_output(
-            output, parser, formatted_prompt, self.repair_llm
+        output = await get_response_async(
+            self.llm, formatted_prompt.to_string(), scheduler=self.scheduler, parser=parser
+        )
+        column_info: ColumnInfo = await parse_and_attempt_repair_for_output_async(
+            output, parser, formatted_prompt, self.repair_llm, scheduler=self.scheduler
         )
         return column_info
 
@@ -352,10 +1270,20 @@ class TableMergerManager:
         """
         Add a file to the table merger
 
+        :param path: path to the file to add
+        """
+        return asyncio.run(self.prep_csv_file_from_path_async(path))
+
+    async def prep_csv_file_from_path_async(self, path: Path) -> TableMergeOperation:
+        """
+        Add a file to the table merger
+
         :param path: path to the file to add
         """
         with path.open("r") as in_file:
-            return self.prep_csv_file_from_text_io(in_file)
+            operation = await self._prep_operation(in_file, path)
+        operation.in_path = path
+        return operation
 
     def prep_csv_file_from_text_io(self, in_file: TextIO) -> TableMergeOperation:
         """
@@ -363,11 +1291,178 @@ class TableMergerManager:
 
         :param in_file: a file like object
         """
+        return asyncio.run(self.prep_csv_file_from_text_io_async(in_file))
+
+    async def prep_csv_file_from_text_io_async(self, in_file: TextIO) -> TableMergeOperation:
+        """
+        Add a file to the table merger
+
+        :param in_file: a file like object
+        """
+        return await self._prep_operation(in_file)
+
+    async def _prep_operation(
+        self, in_file: TextIO, path: Path | None = None
+    ) -> TableMergeOperation:
+        assert self.template_columns, "Template columns must be extracted before adding files"
+
+        if operation := self._recall_operation(in_file):
+            return operation
+
+        columns = await self._extract_columns_from_file(in_file, path)
+
+        return TableMergeOperation(
+            self.template_columns, columns, in_file, scheduler=self.scheduler
+        )
+
+    def _recall_operation(self, in_file: TextIO) -> TableMergeOperation | None:
+        if not self.mapping_store:
+            return None
+        cur_pos = in_file.tell()
+        try:
+            header = next(csv.reader(in_file), [])
+        finally:
+            in_file.seek(cur_pos)
+        accepted = self.mapping_store.recall(self.get_template_columns(), header)
+        if not accepted:
+            return None
+
+        operation = TableMergeOperation(
+            self.template_columns,
+            [ColumnInfo(**x) for x in accepted.incoming_column_info],
+            in_file,
+            scheduler=self.scheduler,
+        )
+        operation.recalled = True
+        operation.suggested_merge_info = ColumnMergeInfo(
+            reasoning=["Recalled a previously accepted mapping for this layout."],
+            column_mapping=[
+                ColumnMapping(
+                    template_column=template_col,
+                    incoming_column=incoming_col,
+                    reasoning="Previously accepted",
+                    confidence="high",
+                    ambiguous_with=[],
+                )
+                for template_col, incoming_col in accepted.column_mapping.items()
+            ],
+            errors=[],
+        )
+        operation.assign_column_mapping(accepted.column_mapping)
+        operation.suggested_transformation_operations = ColumnTransformations(
+            transformations=[
+                ColumnTransform(
+                    reasoning=["Previously accepted"],
+                    column_name=template_col,
+                    python_lambda_body=transform,
+                )
+                for template_col, transform in accepted.transformations.items()
+            ],
+            errors=[],
+        )
+        operation.assign_column_transformations(accepted.transformations)
+        return operation
+
+    def remember_operation(self, operation: TableMergeOperation) -> None:
+        """
+        Save the mapping and transformations the user accepted so files with the same
+        layout are ready to apply without asking the LLM
+
+        :param operation: an operation with its column mapping and transformations assigned
+        """
+        assert self.mapping_store, "No mapping store configured"
+        assert operation.actual_column_mapping
+        self.mapping_store.save(
+            AcceptedMerge(
+                template_columns=self.get_template_columns(),
+                incoming_columns=[x.name for x in operation.incoming_column_info],
+                incoming_column_info=convert_list_of_pydantic_objects_for_json(
+                    operation.incoming_column_info
+                ),
+                column_mapping=operation.actual_column_mapping,
+                transformations=operation.actual_transformation_sources,
+            )
+        )
+
+    def merge_many(
+        self, paths: list[Path], sink: RowSink, max_concurrent_files: int = 8
+    ) -> list[FileMergeStatus]:
+        """
+        Merge many incoming files into one sink, see `merge_many_async`
+        """
+        return asyncio.run(self.merge_many_async(paths, sink, max_concurrent_files))
+
+    async def merge_many_async(
+        self, paths: list[Path], sink: RowSink, max_concurrent_files: int = 8
+    ) -> list[FileMergeStatus]:
+        """
+        Merge many incoming files into one sink without user review
+
+        Files are prepared concurrently and their LLM stages share the manager's scheduler.
+        Each file is transformed into a temporary spool and copied to the sink once all of
+        it succeeded, one file at a time, so a failed file leaves no rows in the output.
+        Mappings and transformations come from the mapping store when the layout is known,
+        otherwise the suggestions from `power_llm` are used as is.
+
+        :param paths: the incoming csv files
+        :param sink: where the merged rows go
+        :param max_concurrent_files: most files being prepared at once
+        :return: the status of each file, in the same order as `paths`
+        """
         assert self.template_columns, "Template columns must be extracted before adding files"
+        file_slots = asyncio.Semaphore(max_concurrent_files)
+        sink_lock = asyncio.Lock()
+
+        async def merge_file(status: FileMergeStatus) -> None:
+            try:
+                async with file_slots:
+                    operation = await self.prep_csv_file_from_path_async(status.path)
+                    status.recalled = operation.recalled
+                    if not operation.recalled and not await self._accept_suggestions(
+                        operation, status
+                    ):
+                        return
+                spool = SpoolSink()
+                try:
+                    await asyncio.to_thread(operation.apply_to_sink, spool)
+                    async with sink_lock:
+                        status.rows_written = await asyncio.to_thread(
+                            sink.write_rows, spool.rows()
+                        )
+                finally:
+                    spool.close()
+                status.errors.extend(operation.errors)
+                status.state = "merged"
+            except Exception as exc:
+                logging.exception("Failed to merge %s", status.path)
+                status.errors.append(f"Could not merge file. Reason: {exc}")
+                status.state = "failed"
 
-        columns = asyncio.run(self._extract_columns_from_file(in_file))
+        statuses = [FileMergeStatus(path=path) for path in paths]
+        await asyncio.gather(*(merge_file(status) for status in statuses))
+        sink.flush()
+        return statuses
 
-        return TableMergeOperation(self.template_columns, columns, in_file)
+    async def _accept_suggestions(
+        self, operation: TableMergeOperation, status: FileMergeStatus
+    ) -> bool:
+        merge_info = await operation.create_suggested_merge_info_async(
+            self.power_llm, self.repair_llm
+        )
+        if merge_info.errors:
+            status.errors.extend(merge_info.errors)
+            status.state = "failed"
+            return False
+        operation.assign_column_mapping(
+            {x.template_column: x.incoming_column for x in merge_info.column_mapping}
+        )
+        transformations = await operation.create_suggested_transformation_operations_async(
+            self.power_llm, self.repair_llm
+        )
+        operation.assign_column_transformations(
+            {x.column_name: x.python_lambda_body for x in transformations.transformations}
+        )
+        return True
 
     def get_template_columns(self) -> list[str]:
         return [x.name for x in self.template_columns]
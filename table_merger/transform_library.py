@@ -0,0 +1,256 @@
+import datetime
+import re
+from typing import TYPE_CHECKING, Callable
+
+import pydantic
+
+from table_merger.matching import value_shape
+from table_merger.transforms import compile_row_projector
+
+if TYPE_CHECKING:
+    from table_merger.table_mergers import ColumnInfo
+
+DATE_FORMATS = [
+    "%m/%d/%Y",
+    "%d/%m/%Y",
+    "%Y-%m-%d",
+    "%m-%d-%Y",
+    "%d-%m-%Y",
+    "%Y/%m/%d",
+    "%d.%m.%Y",
+    "%m/%d/%y",
+    "%d/%m/%y",
+    "%Y%m%d",
+    "%b %d, %Y",
+    "%d %b %Y",
+    "%B %d, %Y",
+    "%d %B %Y",
+]
+# a day that can't be mistaken for a month, to tell %m/%d from %d/%m using a regex
+UNAMBIGUOUS_DATE = datetime.datetime(2023, 12, 31)
+# spaces are left alone, stripping them would turn "Gold Plan" into "GoldPlan"
+SEPARATORS = "-_/."
+NUMBER_NOISE = ",$ "
+NAME_LAST_FIRST = re.compile(r"\s*[^,]+,\s*[^,]+\s*")
+
+
+class LibraryTransform(pydantic.BaseModel):
+    name: str
+    python_lambda_body: str
+    reasoning: str
+
+
+def _non_empty(values: list[str]) -> list[str]:
+    return [x for x in values if x.strip()]
+
+
+def compile_output_format(output_format: str) -> re.Pattern | None:
+    if not output_format:
+        return None
+    try:
+        return re.compile(output_format)
+    except re.error:
+        return None
+
+
+def _parses_all(date_format: str, values: list[str]) -> bool:
+    try:
+        for value in values:
+            datetime.datetime.strptime(value.strip(), date_format)
+    except ValueError:
+        return False
+    return True
+
+
+def date_formats(values: list[str], output_format: str) -> list[str]:
+    """
+    The strptime formats that parse every value, narrowed down by the column's regex
+    """
+    candidates = [x for x in DATE_FORMATS if _parses_all(x, values)]
+    if (pattern := compile_output_format(output_format)) and len(candidates) > 1:
+        narrowed = [x for x in candidates if pattern.fullmatch(UNAMBIGUOUS_DATE.strftime(x))]
+        candidates = narrowed or candidates
+    return candidates
+
+
+def detect_identity(
+    template_col: "ColumnInfo", incoming_col: "ColumnInfo"
+) -> LibraryTransform | None:
+    incoming_values = _non_empty(incoming_col.example_values)
+    template_shapes = {value_shape(x) for x in _non_empty(template_col.example_values)}
+    if all(value_shape(x) in template_shapes for x in incoming_values):
+        return LibraryTransform(
+            name="identity",
+            python_lambda_body="value",
+            reasoning="Incoming values already match the template format.",
+        )
+    return None
+
+
+def detect_date_format(
+    template_col: "ColumnInfo", incoming_col: "ColumnInfo"
+) -> LibraryTransform | None:
+    incoming_values = _non_empty(incoming_col.example_values)
+    source_formats = date_formats(incoming_values, incoming_col.output_format)
+    target_formats = date_formats(
+        _non_empty(template_col.example_values), template_col.output_format
+    )
+    if not source_formats or not target_formats:
+        return None
+
+    # ambiguous formats are fine as long as every reading gives the same output
+    conversions = {
+        tuple(
+            datetime.datetime.strptime(value.strip(), source).strftime(target)
+            for value in incoming_values
+        )
+        for source in source_formats
+        for target in target_formats
+    }
+    if len(conversions) != 1:
+        return None
+    source, target = source_formats[0], target_formats[0]
+    return LibraryTransform(
+        name="date_format",
+        python_lambda_body=(
+            f"datetime.datetime.strptime(value.strip(), {source!r}).strftime({target!r})"
+        ),
+        reasoning=f"Dates are converted from {source} to {target}.",
+    )
+
+
+def detect_name_reorder(
+    template_col: "ColumnInfo", incoming_col: "ColumnInfo"
+) -> LibraryTransform | None:
+    incoming_values = _non_empty(incoming_col.example_values)
+    template_values = _non_empty(template_col.example_values)
+    if not all(NAME_LAST_FIRST.fullmatch(x) for x in incoming_values):
+        return None
+    if any("," in x for x in template_values) or not all(" " in x for x in template_values):
+        return None
+    return LibraryTransform(
+        name="name_reorder",
+        python_lambda_body="' '.join(part.strip() for part in reversed(value.split(',', 1)))",
+        reasoning="Names are reordered from 'Last, First' to 'First Last'.",
+    )
+
+
+def _parse_numbers(values: list[str]) -> list[float] | None:
+    # thousands separators, currency signs and spaces are noise around a number
+    noise = {char for value in values for char in value if char in NUMBER_NOISE}
+    try:
+        return [float("".join(x for x in value if x not in noise)) for value in values]
+    except ValueError:
+        return None
+
+
+def detect_separator_strip(
+    template_col: "ColumnInfo", incoming_col: "ColumnInfo"
+) -> LibraryTransform | None:
+    incoming_values = _non_empty(incoming_col.example_values)
+    if _parse_numbers(incoming_values) is not None:
+        # removing "." or "," from a number changes its value, that's detect_numeric's job
+        return None
+    template_values = "".join(template_col.example_values)
+    separators = {
+        char for value in incoming_values for char in value if char in SEPARATORS
+    } - set(template_values)
+    if not separators:
+        return None
+    separator_class = "[" + re.escape("".join(sorted(separators))) + "]"
+    return LibraryTransform(
+        name="separator_strip",
+        python_lambda_body=f"re.sub({separator_class!r}, '', value)",
+        reasoning=f"Separators {''.join(sorted(separators))!r} are removed.",
+    )
+
+
+def detect_numeric(
+    template_col: "ColumnInfo", incoming_col: "ColumnInfo"
+) -> LibraryTransform | None:
+    incoming_values = _non_empty(incoming_col.example_values)
+    template_values = _non_empty(template_col.example_values)
+    numbers = _parse_numbers(incoming_values)
+    if numbers is None:
+        return None
+    if not all(re.fullmatch(r"-?[0-9]+(\.[0-9]+)?", x) for x in template_values):
+        return None
+    decimals = {len(x.partition(".")[2]) for x in template_values}
+    if len(decimals) != 1:
+        return None
+    (places,) = decimals
+
+    noise = {char for value in incoming_values for char in value if char in NUMBER_NOISE}
+    cleaned = "value"
+    for char in sorted(noise):
+        cleaned = f"{cleaned}.replace({char!r}, '')"
+    if places == 0:
+        if any(x != int(x) for x in numbers):
+            # rounding away cents is a decision for a person, not a default
+            return None
+        # "150.00" loses its zeros, but int() fails on "150.75" in a later row rather
+        # than rounding it
+        body = f"str(int(re.sub('[.]0*$', '', {cleaned}.strip())))"
+    else:
+        body = f"format(float({cleaned}), '.{places}f')"
+    if template_col.empty_expected:
+        # empty stays empty rather than failing to parse
+        body = f"'' if not value.strip() else {body}"
+    return LibraryTransform(
+        name="numeric",
+        python_lambda_body=body,
+        reasoning=f"Numbers are normalized to {places} decimal place(s).",
+    )
+
+
+DETECTORS: list[Callable[["ColumnInfo", "ColumnInfo"], LibraryTransform | None]] = [
+    detect_identity,
+    detect_date_format,
+    detect_name_reorder,
+    # before separator stripping, which would turn 150.00 into 15000
+    detect_numeric,
+    detect_separator_strip,
+]
+
+
+def _produces_template_format(
+    transform: LibraryTransform, template_col: "ColumnInfo", incoming_col: "ColumnInfo"
+) -> bool:
+    project_row = compile_row_projector({template_col.name: transform.python_lambda_body})
+    pattern = compile_output_format(template_col.output_format)
+    template_shapes = {value_shape(x) for x in _non_empty(template_col.example_values)}
+    for value in _non_empty(incoming_col.example_values):
+        transformed_row, failed_columns = project_row([value])
+        if failed_columns:
+            return False
+        output = transformed_row[template_col.name]
+        if not isinstance(output, str):
+            return False
+        if pattern and not pattern.fullmatch(output):
+            return False
+        if not pattern and value_shape(output) not in template_shapes:
+            return False
+    return True
+
+
+def detect_transform(
+    template_col: "ColumnInfo", incoming_col: "ColumnInfo"
+) -> LibraryTransform | None:
+    """
+    Find a built-in transform for a column from the example values and template format
+
+    Detectors are tried in order, and a transform is only returned if it turns every
+    incoming example into a value matching the template's `output_format` (or the shape
+    of its examples when there is no usable regex).
+
+    :param template_col: the template column
+    :param incoming_col: the incoming column mapped to it
+    :return: the transform, or None when the column needs the LLM
+    """
+    if not _non_empty(incoming_col.example_values) or not _non_empty(template_col.example_values):
+        return None
+    for detector in DETECTORS:
+        transform = detector(template_col, incoming_col)
+        if transform and _produces_template_format(transform, template_col, incoming_col):
+            return transform
+    return None
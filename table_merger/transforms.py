@@ -0,0 +1,469 @@
+import ast
+import builtins
+import datetime
+import functools
+import re
+import string
+from typing import Any, Callable, Sequence
+
+import arrow
+
+from table_merger.types import TemplateColName
+
+# (transformed row, [(template column, exception), ...])
+# values are None for fields a short row lacks
+RowProjector = Callable[[Sequence[str | None]], tuple[dict[TemplateColName, object], list[tuple]]]
+
+TRANSFORM_GLOBALS = {"arrow": arrow, "re": re, "datetime": datetime}
+TRANSFORM_MEMO_SIZE = 4096
+
+# the only syntax a transform may use, an expression without assignments or imports
+ALLOWED_NODES = (
+    ast.Expression,
+    ast.Constant,
+    ast.Name,
+    ast.Load,
+    ast.Store,
+    ast.Attribute,
+    ast.Call,
+    ast.keyword,
+    ast.Starred,
+    ast.BinOp,
+    ast.UnaryOp,
+    ast.BoolOp,
+    ast.Compare,
+    ast.IfExp,
+    ast.Subscript,
+    ast.Slice,
+    ast.Tuple,
+    ast.List,
+    ast.Dict,
+    ast.Set,
+    ast.JoinedStr,
+    ast.FormattedValue,
+    ast.Lambda,
+    ast.arguments,
+    ast.arg,
+    ast.ListComp,
+    ast.SetComp,
+    ast.DictComp,
+    ast.GeneratorExp,
+    ast.comprehension,
+    ast.operator,
+    ast.unaryop,
+    ast.boolop,
+    ast.cmpop,
+)
+COMPREHENSIONS = (ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+# what a transform may use from each module it is given
+ALLOWED_MODULE_ATTRIBUTES = {
+    "arrow": {"get", "Arrow"},
+    "datetime": {"datetime", "date", "time", "timedelta", "timezone"},
+    "re": {
+        "sub",
+        "subn",
+        "compile",
+        "match",
+        "fullmatch",
+        "search",
+        "findall",
+        "split",
+        "escape",
+        "IGNORECASE",
+        "I",
+        "MULTILINE",
+        "M",
+        "DOTALL",
+        "S",
+        "ASCII",
+        "A",
+    },
+}
+# no range, getattr, type or anything else that reaches beyond the value
+SAFE_BUILTINS = {
+    name: getattr(builtins, name)
+    for name in [
+        "abs",
+        "all",
+        "any",
+        "bool",
+        "chr",
+        "dict",
+        "divmod",
+        "enumerate",
+        "filter",
+        "float",
+        "format",
+        "int",
+        "isinstance",
+        "len",
+        "list",
+        "map",
+        "max",
+        "min",
+        "ord",
+        "repr",
+        "reversed",
+        "round",
+        "set",
+        "sorted",
+        "str",
+        "sum",
+        "tuple",
+        "zip",
+    ]
+}
+# frame and code attributes reach the interpreter without a leading underscore
+BLOCKED_ATTRIBUTES = {
+    "format_map",
+    "mro",
+    "gi_frame",
+    "gi_code",
+    "cr_frame",
+    "cr_code",
+    "ag_frame",
+    "ag_code",
+    "tb_frame",
+    "f_back",
+    "f_globals",
+    "f_locals",
+    "f_builtins",
+}
+# larger numbers, repeat counts and exponents are how a one line expression exhausts memory,
+# so a repeat or power is also limited to one per operand
+MAX_INT_OPERAND = 10_000
+MAX_EXPONENT = 64
+# a repeat inside a comprehension runs once per item, so its count is kept lower
+MAX_COMPREHENSION_REPEAT = 100
+REPEAT_OPERATORS = (ast.Mult, ast.Pow, ast.LShift)
+# arrow methods that return an Arrow, so `.format` on them is Arrow.format, not str.format
+ARROW_CHAIN_METHODS = {"get", "to", "shift", "replace", "floor", "ceil"}
+# results are only memoized for transforms that call and reach nothing else, since anything
+# new (the clock, random numbers, arrow's humanize) might not give the same result twice
+DETERMINISTIC_ATTRIBUTES = {
+    *(x for x in dir(str) if not x.startswith("_")),
+    *(x for attributes in ALLOWED_MODULE_ATTRIBUTES.values() for x in attributes),
+    *ARROW_CHAIN_METHODS,
+    # dicts and lists
+    "items",
+    "keys",
+    "values",
+    "count",
+    "index",
+    # dates, times and Arrows
+    "strptime",
+    "strftime",
+    "isoformat",
+    "fromisoformat",
+    "weekday",
+    "isoweekday",
+    "isocalendar",
+    "toordinal",
+    "total_seconds",
+    "utc",
+    "year",
+    "month",
+    "day",
+    "hour",
+    "minute",
+    "second",
+    "microsecond",
+    "tzinfo",
+    "days",
+    "seconds",
+    "microseconds",
+}
+
+
+class UnsafeTransformError(ValueError):
+    """
+    A transform uses syntax, names or attributes that aren't allowed
+    """
+
+
+def _is_small_number(node: ast.expr, limit: int) -> bool:
+    return (
+        isinstance(node, ast.Constant)
+        and isinstance(node.value, (int, float))
+        and not isinstance(node.value, bool)
+        and abs(node.value) <= limit
+    )
+
+
+def _contains_repeat(node: ast.expr) -> bool:
+    return any(
+        isinstance(inner, ast.BinOp) and isinstance(inner.op, REPEAT_OPERATORS)
+        for inner in ast.walk(node)
+    )
+
+
+def _is_arrow_chain(node: ast.expr) -> bool:
+    # arrow.get(...), optionally followed by .to(...), .shift(...) and so on
+    while isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+        if node.func.attr not in ARROW_CHAIN_METHODS:
+            return False
+        node = node.func.value
+    return isinstance(node, ast.Name) and node.id == "arrow"
+
+
+def _format_fields(format_string: str) -> list[str]:
+    fields = []
+    for _, field, spec, _ in string.Formatter().parse(format_string):
+        if field is not None:
+            fields.append(field)
+        if spec:
+            fields += _format_fields(spec)
+    return fields
+
+
+def _check_format(receiver: ast.expr) -> None:
+    # str.format looks up attributes and items named in the format string at runtime
+    if _is_arrow_chain(receiver):
+        return
+    if not (isinstance(receiver, ast.Constant) and isinstance(receiver.value, str)):
+        raise UnsafeTransformError("format is only allowed on a constant string in a transform")
+    try:
+        fields = _format_fields(receiver.value)
+    except ValueError as exc:
+        raise UnsafeTransformError(f"Invalid format string in a transform: {exc}") from exc
+    if any("." in field or "[" in field for field in fields):
+        raise UnsafeTransformError(
+            "Format fields can't look up attributes or items in a transform"
+        )
+
+
+def _check_repeat(node: ast.BinOp) -> None:
+    if isinstance(node.op, ast.Mult):
+        operands = [(node.left, node.right), (node.right, node.left)]
+        if not any(
+            _is_small_number(count, MAX_INT_OPERAND) and not _contains_repeat(repeated)
+            for count, repeated in operands
+        ):
+            raise UnsafeTransformError(
+                "Multiplying is only allowed by a single small constant in a transform"
+            )
+    elif not _is_small_number(node.right, MAX_EXPONENT) or _contains_repeat(node.left):
+        raise UnsafeTransformError(
+            f"Exponents and shifts must be constants up to {MAX_EXPONENT} in a transform"
+        )
+
+
+def validate_transform(transform: str) -> ast.Expression:
+    """
+    Check that a transform only uses what a column transform needs
+
+    A transform is a single expression of `value` using the `arrow`, `re` and
+    `datetime` modules and a few builtins. Loops, assignments, imports, names or
+    attributes with a leading underscore, strings containing "__", `format` on anything
+    but a constant string or an Arrow, rebinding a module or builtin, nested
+    comprehensions, comprehensions over a repeat, and repeats or powers that aren't by a
+    single small constant are all rejected, so a validated transform can run in the
+    merging process.
+
+    :param transform: the body of `lambda value: <transform>`
+    :raises UnsafeTransformError: naming the first problem found
+    :return: the parsed expression
+    """
+    try:
+        tree = ast.parse(transform.strip(), mode="eval")
+    except SyntaxError as exc:
+        raise UnsafeTransformError(f"Transform is not a single expression: {exc.msg}") from exc
+
+    # names bound by lambdas and comprehensions within the transform
+    local_names = {
+        node.arg if isinstance(node, ast.arg) else node.id
+        for node in ast.walk(tree)
+        if isinstance(node, ast.arg)
+        or (isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store))
+    }
+    # rebinding a module or builtin would hide later uses of it from the checks below
+    if shadowed := sorted(local_names & {*ALLOWED_MODULE_ATTRIBUTES, *SAFE_BUILTINS}):
+        raise UnsafeTransformError(f"Name {shadowed[0]} can't be rebound in a transform")
+    allowed_names = {"value", *ALLOWED_MODULE_ATTRIBUTES, *SAFE_BUILTINS, *local_names}
+    for node in ast.walk(tree):
+        if not isinstance(node, ALLOWED_NODES):
+            raise UnsafeTransformError(f"{type(node).__name__} is not allowed in a transform")
+        if isinstance(node, ast.Name) and (
+            node.id.startswith("_") or node.id not in allowed_names
+        ):
+            raise UnsafeTransformError(f"Name {node.id} is not allowed in a transform")
+        if isinstance(node, ast.arg) and node.arg.startswith("_"):
+            raise UnsafeTransformError(f"Name {node.arg} is not allowed in a transform")
+        if isinstance(node, ast.Attribute):
+            if node.attr.startswith("_") or node.attr in BLOCKED_ATTRIBUTES:
+                raise UnsafeTransformError(f"Attribute {node.attr} is not allowed in a transform")
+            if node.attr == "format":
+                _check_format(node.value)
+            module = node.value.id if isinstance(node.value, ast.Name) else None
+            if module in ALLOWED_MODULE_ATTRIBUTES:
+                if node.attr not in ALLOWED_MODULE_ATTRIBUTES[module]:
+                    raise UnsafeTransformError(
+                        f"{module}.{node.attr} is not allowed in a transform"
+                    )
+        if isinstance(node, ast.Constant) and isinstance(node.value, (str, bytes)):
+            if "__" in str(node.value):
+                raise UnsafeTransformError(
+                    "Strings containing '__' are not allowed in a transform"
+                )
+        if isinstance(node, ast.Constant) and isinstance(node.value, int):
+            if abs(node.value) > MAX_INT_OPERAND:
+                raise UnsafeTransformError(f"Number {node.value} is too large for a transform")
+        if isinstance(node, ast.BinOp) and isinstance(node.op, REPEAT_OPERATORS):
+            _check_repeat(node)
+        if isinstance(node, COMPREHENSIONS):
+            if len(node.generators) > 1 or any(
+                isinstance(inner, COMPREHENSIONS) for inner in ast.walk(node) if inner is not node
+            ):
+                raise UnsafeTransformError("Nested comprehensions are not allowed in a transform")
+            if _contains_repeat(node.generators[0].iter):
+                raise UnsafeTransformError("A comprehension can't iterate over a repeat")
+            if any(
+                isinstance(inner, ast.BinOp)
+                and isinstance(inner.op, ast.Mult)
+                and not any(
+                    _is_small_number(x, MAX_COMPREHENSION_REPEAT)
+                    for x in (inner.left, inner.right)
+                )
+                for inner in ast.walk(node)
+            ):
+                raise UnsafeTransformError(
+                    f"Repeats in a comprehension must be by constants up to"
+                    f" {MAX_COMPREHENSION_REPEAT}"
+                )
+    return tree
+
+
+def is_memoizable(transform: str) -> bool:
+    """
+    Whether a transform is worth memoizing: it calls something, and everything it calls
+    or looks up is known to give the same result for the same value
+    """
+    try:
+        tree = ast.parse(transform.strip(), mode="eval")
+    except SyntaxError:
+        return False
+    has_call = False
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            has_call = True
+            func = node.func
+            if isinstance(func, ast.Name) and func.id not in SAFE_BUILTINS:
+                return False
+            if not isinstance(func, (ast.Name, ast.Attribute, ast.Lambda)):
+                return False
+            # arrow.get() with nothing to parse is the current time
+            if (
+                isinstance(func, ast.Attribute)
+                and func.attr == "get"
+                and _is_arrow_chain(func.value)
+                and not node.args
+            ):
+                return False
+        if isinstance(node, ast.Attribute) and node.attr not in DETERMINISTIC_ATTRIBUTES:
+            return False
+    # a bare expression such as `value[:3]` is cheaper than a cache lookup
+    return has_call
+
+
+def compile_row_projector(
+    transforms: dict[TemplateColName, str],
+    memo_size: int = 0,
+    memoized_columns: set[TemplateColName] | None = None,
+) -> RowProjector:
+    """
+    Generate a single function that runs every column transform for a row
+
+    The function takes the incoming values in the same order as `transforms` and returns
+    the transformed row along with the columns that failed and why. Every transform must
+    pass `validate_transform` and runs with only the safe builtins.
+
+    With a `memo_size`, each column in `memoized_columns` (by default every column that
+    `is_memoizable`) keeps an LRU cache of that many input values, holding the result or
+    the error, so repeated values aren't transformed again. See `transform_memo_stats`.
+
+    :param transforms: python lambda bodies keyed by template column, in output order
+    :param memo_size: values cached per memoized column, 0 to turn memoizing off
+    :param memoized_columns: the columns to memoize, they must be deterministic
+    :raises UnsafeTransformError: when a transform fails validation
+    :return: the row projector
+    """
+    # the column names are never pasted into the generated source, only the validated
+    # bodies, re-rendered from their syntax tree so they can't break out of the template
+    columns = list(transforms)
+    transforms = {
+        column: ast.unparse(validate_transform(body)) for column, body in transforms.items()
+    }
+    if memoized_columns is None:
+        memoized_columns = {column for column, body in transforms.items() if is_memoizable(body)}
+    memoized = [
+        idx for idx, column in enumerate(columns) if memo_size and column in memoized_columns
+    ]
+    lines = []
+    for idx in memoized:
+        lines += [
+            f"def __column_{idx}(value):",
+            "    try:",
+            "        return True, (",
+            transforms[columns[idx]],
+            "        )",
+            "    except Exception as exc:",
+            "        return False, exc",
+        ]
+    lines += [
+        "def project_row(__values):",
+        "    __row = {}",
+        "    __errors = []",
+    ]
+    for idx, transform in enumerate(transforms.values()):
+        if idx in memoized:
+            lines += [
+                f"    __ok, __result = __memos[{idx}](__values[{idx}])",
+                "    if __ok:",
+                f"        __row[__columns[{idx}]] = __result",
+                "    else:",
+                f"        __errors.append((__columns[{idx}], __result))",
+            ]
+            continue
+        lines += [
+            f"    value = __values[{idx}]",
+            "    try:",
+            f"        __row[__columns[{idx}]] = (",
+            transform,
+            "        )",
+            "    except Exception as exc:",
+            f"        __errors.append((__columns[{idx}], exc))",
+        ]
+    lines.append("    return __row, __errors")
+
+    namespace: dict[str, Any] = {
+        **TRANSFORM_GLOBALS,
+        # strptime imports its helper module through the caller's builtins, a validated
+        # transform can't name `__import__` itself
+        "__builtins__": {**SAFE_BUILTINS, "Exception": Exception, "__import__": __import__},
+        "__columns": columns,
+    }
+    exec(compile("\n".join(lines), "<row projector>", "exec"), namespace)
+    memos = {
+        idx: functools.lru_cache(memo_size)(namespace[f"__column_{idx}"]) for idx in memoized
+    }
+    namespace["__memos"] = memos
+    project_row = namespace["project_row"]
+    project_row.memos = {columns[idx]: memo for idx, memo in memos.items()}
+    return project_row
+
+
+def transform_memo_stats(row_projector: RowProjector) -> dict[TemplateColName, dict[str, int]]:
+    """
+    Hits, misses, evictions and size of each memoized column of a row projector
+    """
+    stats = {}
+    for column, memo in getattr(row_projector, "memos", {}).items():
+        info = memo.cache_info()
+        stats[column] = {
+            "hits": info.hits,
+            "misses": info.misses,
+            # every miss is cached, so anything no longer cached was evicted
+            "evictions": info.misses - info.currsize,
+            "size": info.currsize,
+        }
+    return stats
@@ -2,14 +2,22 @@ import logging
 from typing import Sequence, TypeVar
 
 from langchain.chat_models.base import BaseChatModel
+from langchain.llms.openai import BaseOpenAI
 from langchain.output_parsers import RetryWithErrorOutputParser
+from langchain.output_parsers.retry import NAIVE_RETRY_WITH_ERROR_PROMPT
 from langchain.schema import BaseOutputParser, HumanMessage
 from langchain.schema.language_model import BaseLanguageModel
 from langchain.schema.prompt import PromptValue
 from pydantic import BaseModel
 
+from table_merger.llm_cache import LLMResponseCache, get_response_cache, make_cache_key
+from table_merger.scheduler import LLMScheduler
+
 T = TypeVar("T")
 
+DEFAULT_CONTEXT_SIZE = 4096
+CHARS_PER_TOKEN = 4
+
 
 def parse_and_attempt_repair_for_output(
     output: str,
@@ -28,21 +36,117 @@ def parse_and_attempt_repair_for_output(
         return retry_parser.parse_with_prompt(completion=output, prompt_value=formatted_prompt)
 
 
+async def parse_and_attempt_repair_for_output_async(
+    output: str,
+    parser: BaseOutputParser[T],
+    formatted_prompt: PromptValue,
+    repair_llm: BaseLanguageModel,
+    do_not_repair: bool = False,
+    scheduler: LLMScheduler | None = None,
+) -> T:
+    try:
+        return parser.parse(output)
+    except Exception as exc:
+        logging.exception("Parse failed. Doing retry")
+        if do_not_repair:
+            raise
+        # the same prompt RetryWithErrorOutputParser uses, sent through the scheduler
+        repair_prompt = NAIVE_RETRY_WITH_ERROR_PROMPT.format(
+            prompt=formatted_prompt.to_string(), completion=output, error=repr(exc)
+        )
+        repaired = await get_response_async(
+            repair_llm, repair_prompt, scheduler=scheduler, parser=parser
+        )
+        return parser.parse(repaired)
+
+
 def convert_list_of_pydantic_objects_for_json(
     pydantic_objects: Sequence[BaseModel],
 ) -> list[dict]:
     return [obj.model_dump() for obj in pydantic_objects]
 
 
-def get_response(llm: BaseLanguageModel | BaseChatModel, message: str) -> str:
-    # I really despise the interface inconsistencies with LangChain
-    if isinstance(llm, BaseLanguageModel):
-        return llm.predict(message)
-    return llm([HumanMessage(content=message)]).content
+def _cacheable(response: str, parser: BaseOutputParser | None) -> bool:
+    # a response that doesn't parse would be served again on every later attempt
+    if parser is None:
+        return True
+    try:
+        parser.parse(response)
+    except Exception:
+        return False
+    return True
 
 
-async def get_response_async(llm: BaseLanguageModel | BaseChatModel, message: str) -> str:
+def get_response(
+    llm: BaseLanguageModel | BaseChatModel,
+    message: str,
+    cache: LLMResponseCache | None = None,
+    parser: BaseOutputParser | None = None,
+) -> str:
+    cache = cache or get_response_cache()
+    if cache:
+        cache_key = make_cache_key(llm, message)
+        if (cached := cache.lookup(cache_key)) is not None:
+            return cached
+
     # I really despise the interface inconsistencies with LangChain
-    if isinstance(llm, BaseLanguageModel):
+    # (chat models are language models too, so check for them first)
+    if isinstance(llm, BaseChatModel):
+        response = llm([HumanMessage(content=message)]).content
+    else:
+        response = llm.predict(message)
+
+    if cache and _cacheable(response, parser):
+        cache.update(cache_key, response)
+    return response
+
+
+async def get_response_async(
+    llm: BaseLanguageModel | BaseChatModel,
+    message: str,
+    cache: LLMResponseCache | None = None,
+    scheduler: LLMScheduler | None = None,
+    parser: BaseOutputParser | None = None,
+) -> str:
+    cache = cache or get_response_cache()
+    if cache:
+        cache_key = make_cache_key(llm, message)
+        if (cached := cache.lookup(cache_key)) is not None:
+            return cached
+
+    async def call() -> str:
+        # I really despise the interface inconsistencies with LangChain
+        if isinstance(llm, BaseChatModel):
+            return (await llm.apredict_messages([HumanMessage(content=message)])).content
         return await llm.apredict(message)
-    return await llm.agenerate([HumanMessage(content=message)]).content
+
+    if scheduler:
+        estimated_tokens = estimate_tokens(message) + (get_max_output_tokens(llm) or 0)
+        response = await scheduler.run(call, estimated_tokens)
+    else:
+        response = await call()
+
+    if cache and _cacheable(response, parser):
+        cache.update(cache_key, response)
+    return response
+
+
+def estimate_tokens(text: str) -> int:
+    # deliberately rough, avoids needing a tokenizer for every model
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def get_context_size(llm: BaseLanguageModel | BaseChatModel) -> int:
+    if model_name := getattr(llm, "model_name", None):
+        try:
+            return BaseOpenAI.modelname_to_contextsize(model_name)
+        except ValueError:
+            pass
+    return DEFAULT_CONTEXT_SIZE
+
+
+def get_max_output_tokens(llm: BaseLanguageModel | BaseChatModel) -> int | None:
+    max_tokens = getattr(llm, "max_tokens", None)
+    if isinstance(max_tokens, int) and max_tokens > 0:
+        return max_tokens
+    return None
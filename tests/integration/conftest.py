@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 from typing import Iterable, TextIO
 
@@ -6,11 +7,19 @@ from langchain.chat_models import ChatOpenAI
 from langchain.llms.openai import OpenAI
 from langchain.schema.language_model import BaseLanguageModel
 
+from table_merger.fake_llm import FakeChatModel, FakeLLM
 from table_merger.table_mergers import ColumnInfo
 
 sample_data = Path(__file__).parent / "sample_data"
 
 
+@pytest.fixture()
+def use_fake_llm(request: pytest.FixtureRequest) -> bool:
+    return (
+        request.config.getoption("--fake-llm") or os.environ.get("TABLE_MERGER_FAKE_LLM") == "1"
+    )
+
+
 @pytest.fixture()
 def example_template_csv() -> Iterable[TextIO]:
     with (sample_data / "template.csv").open() as template_file:
@@ -28,13 +37,17 @@ def table_b() -> Path:
 
 
 @pytest.fixture()
-def gpt3() -> OpenAI:
+def gpt3(use_fake_llm: bool) -> OpenAI | FakeLLM:
+    if use_fake_llm:
+        return FakeLLM()
     # gpt-3.5-turbo chat is slower
     return OpenAI(max_tokens=1000, temperature=0.0)
 
 
 @pytest.fixture()
-def gpt4() -> ChatOpenAI:
+def gpt4(use_fake_llm: bool) -> ChatOpenAI | FakeChatModel:
+    if use_fake_llm:
+        return FakeChatModel()
     return ChatOpenAI(model="gpt-4", max_tokens=1000, temperature=0.0)
 
 
@@ -0,0 +1,61 @@
+import csv
+from pathlib import Path
+
+from benchmarks.generate import Scenario, generate_files
+from benchmarks.run import compare_results, run_benchmarks
+
+
+def test_generate_files(tmp_path: Path) -> None:
+    scenario = Scenario(name="tiny", rows=50, columns=8, cardinality=5, quote_rate=1.0)
+    template_path, incoming_path = generate_files(scenario, tmp_path)
+
+    with incoming_path.open(newline="") as in_file:
+        incoming = list(csv.reader(in_file))
+    with template_path.open(newline="") as in_file:
+        template = list(csv.reader(in_file))
+    assert incoming[0] == [
+        "policy_date",
+        "employee_name",
+        "plan",
+        "policy_number",
+        "premium",
+        "notes",
+        "policy_date_1",
+        "employee_name_1",
+    ]
+    assert template[0][:2] == ["PolicyDate", "EmployeeName"]
+    assert len(incoming) == 51
+    assert all(len(row) == 8 for row in incoming)
+    assert len({row[3] for row in incoming[1:]}) <= 5
+    # every text cell needs quoting
+    assert incoming_path.read_text().count('"') >= 50
+
+
+def test_run_benchmarks(tmp_path: Path) -> None:
+    results = run_benchmarks([Scenario(name="tiny", rows=200)], tmp_path, trace_memory=False)
+
+    tiny = results["scenarios"]["tiny"]
+    assert tiny["rows_written"] == 200
+    assert tiny["transform_errors"] == 0
+    assert tiny["stages"]["apply"]["rows_per_second"]
+    assert compare_results(results, results) == []
+    slower = {
+        "scenarios": {"tiny": {"stages": {"apply": {"seconds": 0.0, "peak_memory_mb": None}}}}
+    }
+    assert compare_results(slower, {"scenarios": {"tiny": tiny}}) == []
+    assert compare_results({"scenarios": {"tiny": tiny}}, slower) == []
+
+
+def test_compare_results_reports_regressions() -> None:
+    def results(apply_seconds: float, extract_seconds: float) -> dict:
+        stages = {
+            "apply": {"seconds": apply_seconds, "peak_memory_mb": None},
+            # too quick to compare
+            "extract_columns": {"seconds": extract_seconds, "peak_memory_mb": None},
+        }
+        return {"scenarios": {"tall": {"stages": stages}}}
+
+    baseline = results(0.1, 0.001)
+
+    assert compare_results(results(0.15, 0.01), baseline) == ["tall/apply: 0.100s -> 0.150s"]
+    assert compare_results(results(0.11, 0.01), baseline) == []
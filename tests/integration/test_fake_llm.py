@@ -0,0 +1,63 @@
+import asyncio
+from typing import TextIO
+
+from megamock import MegaMock
+
+from table_merger.fake_llm import FakeBehavior, FakeChatModel, FakeLLM
+from table_merger.scheduler import LLMScheduler
+from table_merger.table_mergers import ColumnInfo, TableMergeOperation
+from table_merger.util import get_response_async
+
+
+def test_malformed_response_is_repaired(
+    template_column_info: list[ColumnInfo], incoming_column_info: list[ColumnInfo]
+) -> None:
+    behavior = FakeBehavior(responses=['{"transformations": [{"reasoning": '])
+    scheduler = LLMScheduler()
+    merge_op = TableMergeOperation(
+        template_column_info, incoming_column_info, MegaMock.it(TextIO), scheduler=scheduler
+    )
+    merge_op.assign_column_mapping(
+        {
+            "Date": "Date_of_Policy",
+            "EmployeeName": "FullName",
+            "Plan": "Insurance_Plan",
+            "PolicyNumber": "Policy_No",
+            "Premium": "Monthly_Premium",
+        }
+    )
+
+    transformations = merge_op.create_suggested_transformation_operations(
+        FakeChatModel(behavior=behavior), use_library=False
+    )
+
+    # the first response is cut off, the repair prompt is answered by the rules
+    assert behavior.calls == 2
+    # the repair goes through the scheduler like the first call
+    assert scheduler.stats()["calls"] == 2
+    transforms = {x.column_name: x.python_lambda_body for x in transformations.transformations}
+    assert len(transforms) == 5
+    assert transforms["Premium"] == "str(int(re.sub('[.]0*$', '', value.strip())))"
+    assert transforms["PolicyNumber"] == r"re.sub('[\\-]', '', value)"
+
+
+def test_rate_limits_and_latency() -> None:
+    behavior = FakeBehavior(
+        latency_seconds=0.02, latency_distribution="lognormal", rate_limit_rate=0.3, seed=1
+    )
+    llm = FakeLLM(behavior=behavior)
+    scheduler = LLMScheduler(max_concurrency=4, base_delay=0.0)
+
+    async def run() -> list[str]:
+        return await asyncio.gather(
+            *(get_response_async(llm, f"prompt {idx}", scheduler=scheduler) for idx in range(12))
+        )
+
+    assert asyncio.run(run()) == ["{}"] * 12
+    assert behavior.rate_limited
+    assert scheduler.stats() == {
+        "calls": 12 + behavior.rate_limited,
+        "retries": behavior.rate_limited,
+        "failures": 0,
+    }
+    assert 1 < behavior.max_in_flight <= 4
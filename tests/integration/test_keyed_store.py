@@ -0,0 +1,90 @@
+import datetime
+from io import StringIO
+from pathlib import Path
+
+import arrow
+import pytest
+
+from table_merger.keyed_store import KeyedRowStore
+from table_merger.table_mergers import ColumnInfo, TableMergeOperation
+
+COLUMNS = ["PolicyNumber", "EmployeeName", "Premium"]
+
+
+def test_duplicate_keys_are_skipped_across_files_and_runs(
+    template_column_info: list[ColumnInfo], incoming_column_info: list[ColumnInfo], tmp_path: Path
+) -> None:
+    def merge(store: KeyedRowStore, text: str) -> int:
+        merge_op = TableMergeOperation(template_column_info, incoming_column_info, StringIO(text))
+        merge_op.assign_column_mapping({"PolicyNumber": "Policy_No", "EmployeeName": "FullName"})
+        merge_op.assign_column_transformations(
+            {"PolicyNumber": "value.replace('-', '')", "EmployeeName": "value"}
+        )
+        return merge_op.apply_to_sink(store)
+
+    store = KeyedRowStore(tmp_path / "merged.sqlite", COLUMNS, ["PolicyNumber"])
+    assert merge(store, "Policy_No,FullName\nAB-1,John Doe\nAB-2,Jane Smith\nAB-1,Dupe\n") == 2
+    store.close()
+
+    # a later run sees the rows stored by the first
+    store = KeyedRowStore(tmp_path / "merged.sqlite", COLUMNS, ["PolicyNumber"])
+    assert merge(store, "Policy_No,FullName\nAB-2,Jane Smith\nAB-3,Bob Wilson\n,No Key\n") == 1
+    assert (len(store), store.rows_skipped, store.rows_missing_key) == (3, 1, 1)
+
+    out_file = StringIO()
+    assert store.export_csv(out_file) == 3
+    assert out_file.getvalue().splitlines() == [
+        "PolicyNumber,EmployeeName,Premium",
+        "AB1,John Doe,",
+        "AB2,Jane Smith,",
+        "AB3,Bob Wilson,",
+    ]
+
+
+def test_replace_keeps_the_latest_row(tmp_path: Path) -> None:
+    store = KeyedRowStore(tmp_path / "merged.sqlite", COLUMNS, ["PolicyNumber"], "replace")
+
+    store.write_rows([{"PolicyNumber": "AB1", "Premium": "100"}, {"PolicyNumber": "AB2"}])
+    store.write_rows([{"PolicyNumber": "AB1", "Premium": "150"}])
+
+    out_file = StringIO()
+    store.export_csv(out_file, write_header=False)
+    # the replaced row keeps its place
+    assert out_file.getvalue().splitlines() == ["AB1,,150", "AB2,,"]
+
+
+def test_values_sqlite_cant_store_are_written_as_text(tmp_path: Path) -> None:
+    store = KeyedRowStore(tmp_path / "merged.sqlite", COLUMNS, ["PolicyNumber"])
+    when = arrow.get(2023, 5, 1)
+
+    store.write_rows(
+        [
+            {"PolicyNumber": "AB1", "EmployeeName": when, "Premium": 150},
+            {"PolicyNumber": "AB2", "EmployeeName": datetime.date(2023, 5, 2), "Premium": 1.5},
+        ]
+    )
+
+    out_file = StringIO()
+    store.export_csv(out_file, write_header=False)
+    assert out_file.getvalue().splitlines() == [f"AB1,{when},150", "AB2,2023-05-02,1.5"]
+
+
+def test_int_and_str_keys_are_the_same_key(tmp_path: Path) -> None:
+    store = KeyedRowStore(tmp_path / "merged.sqlite", COLUMNS, ["PolicyNumber", "Premium"])
+
+    # a typed column gives ints, an untyped one the csv text
+    assert store.write_rows([{"PolicyNumber": 1, "Premium": 150}]) == 1
+    assert store.write_rows([{"PolicyNumber": "1", "Premium": "150"}]) == 0
+    assert store.write_rows([{"PolicyNumber": 1.5, "Premium": "150"}]) == 1
+    assert store.write_rows([{"PolicyNumber": "1.5", "Premium": 150}]) == 0
+
+    out_file = StringIO()
+    store.export_csv(out_file, write_header=False)
+    assert out_file.getvalue().splitlines() == ["1,,150", "1.5,,150"]
+
+
+def test_store_with_other_columns_is_rejected(tmp_path: Path) -> None:
+    KeyedRowStore(tmp_path / "merged.sqlite", COLUMNS, ["PolicyNumber"]).close()
+
+    with pytest.raises(ValueError):
+        KeyedRowStore(tmp_path / "merged.sqlite", COLUMNS[:2], ["PolicyNumber"])
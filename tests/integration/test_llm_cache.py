@@ -0,0 +1,51 @@
+from pathlib import Path
+
+from langchain.llms.fake import FakeListLLM
+from langchain.output_parsers import PydanticOutputParser
+
+from table_merger.llm_cache import SQLiteLLMResponseCache, make_cache_key
+from table_merger.table_mergers import ColumnTransformations
+from table_merger.util import get_response
+
+
+class TestSQLiteLLMResponseCache:
+    def test_get_response_uses_cache(self, tmp_path: Path) -> None:
+        cache = SQLiteLLMResponseCache(tmp_path / "cache.sqlite")
+        llm = FakeListLLM(responses=["first", "second"])
+
+        assert get_response(llm, "prompt", cache) == "first"
+        assert get_response(llm, "prompt", cache) == "first"
+        assert get_response(llm, "other prompt", cache) == "second"
+        assert cache.stats() == {"hits": 1, "misses": 2, "evictions": 0}
+
+        # survives a restart
+        reopened = SQLiteLLMResponseCache(tmp_path / "cache.sqlite")
+        assert reopened.lookup(make_cache_key(llm, "prompt")) == "first"
+
+    def test_responses_that_dont_parse_are_not_cached(self, tmp_path: Path) -> None:
+        cache = SQLiteLLMResponseCache(tmp_path / "cache.sqlite")
+        parsed = '{"transformations": [], "errors": []}'
+        llm = FakeListLLM(responses=['{"transformations": [', parsed])
+        parser = PydanticOutputParser(pydantic_object=ColumnTransformations)  # type: ignore
+
+        assert get_response(llm, "prompt", cache, parser) == '{"transformations": ['
+        # asked again rather than served the malformed response
+        assert get_response(llm, "prompt", cache, parser) == parsed
+        assert get_response(llm, "prompt", cache, parser) == parsed
+        assert cache.stats() == {"hits": 1, "misses": 2, "evictions": 0}
+
+    def test_eviction(self, tmp_path: Path) -> None:
+        cache = SQLiteLLMResponseCache(tmp_path / "cache.sqlite", max_bytes=10, max_age=None)
+        cache.update("a", "12345")
+        cache.update("b", "12345")
+        cache.lookup("a")
+        cache.update("c", "12345")
+
+        assert cache.lookup("b") is None
+        assert cache.lookup("a") == "12345"
+        assert cache.lookup("c") == "12345"
+        assert cache.evictions == 1
+
+        expiring = SQLiteLLMResponseCache(tmp_path / "expiring.sqlite", max_age=0)
+        expiring.update("a", "12345")
+        assert expiring.lookup("a") is None
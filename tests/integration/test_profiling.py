@@ -0,0 +1,100 @@
+from io import StringIO
+
+from table_merger.matching import profile_similarity
+from table_merger.profiling import (
+    MAX_PATTERN_KINDS,
+    MAX_PATTERN_LENGTH,
+    MAX_PATTERNS,
+    ColumnProfile,
+    HyperLogLog,
+)
+from table_merger.sampling import sample_text_io
+from table_merger.table_mergers import ColumnInfo
+
+
+def test_hyperloglog_estimate_and_merge() -> None:
+    first = HyperLogLog()
+    second = HyperLogLog()
+    for i in range(20_000):
+        first.add(str(i))
+        # half overlaps with the first counter
+        second.add(str(i + 10_000))
+
+    assert abs(first.count() - 20_000) < 20_000 * 0.05
+    first.merge(second)
+    assert abs(first.count() - 30_000) < 30_000 * 0.05
+
+
+def test_column_profile_rates_and_merge() -> None:
+    profile = ColumnProfile()
+    for value in ["150.00", "1,200", "", "05/01/2023", None]:
+        profile.add(value)
+    other = ColumnProfile()
+    other.add("n/a")
+
+    profile.merge(other)
+
+    assert profile.count == 6
+    assert profile.null_rate == 1 / 6
+    assert profile.empty_rate == 1 / 6
+    # rates over the values that are present
+    assert profile.numeric_rate == 2 / 4
+    assert profile.date_rate == 1 / 4
+    assert (profile.min_length, profile.max_length) == (0, 10)
+    assert profile.patterns["99/99/9999"] == 1
+    assert profile.distinct_count == 5
+
+
+def test_sampler_profiles_in_the_same_pass() -> None:
+    rows = "\n".join(f"{i},{'' if i % 4 else 'x'}" for i in range(1000))
+    sampler = sample_text_io(StringIO(f"Id,Flag\n{rows}\n"), profile=True)
+
+    assert sampler
+    profiles = sampler.profiles()
+    assert profiles["Id"].numeric_rate == 1.0
+    assert abs(profiles["Id"].distinct_count - 1000) < 50
+    assert profiles["Flag"].empty_rate == 0.75
+
+    column_info = ColumnInfo(
+        name="Id",
+        type="number",
+        output_format="[0-9]+",
+        empty_expected=False,
+        example_values=["1"],
+        profile=profiles["Id"],
+    )
+    # profiles stay out of what is stored and sent to the LLM
+    assert "profile" not in column_info.model_dump()
+
+
+def test_profile_similarity() -> None:
+    def column(name: str, values: list[str]) -> ColumnInfo:
+        profile = ColumnProfile()
+        profile.add_many(values)
+        return ColumnInfo(
+            name=name,
+            type="string",
+            output_format="",
+            empty_expected=False,
+            example_values=values[:1],
+            profile=profile,
+        )
+
+    dates = column("Date", ["05/01/2023", "12/31/2022"])
+    other_dates = column("Start", ["01/02/2021", "11/30/2020"])
+    amounts = column("Amount", ["150.00", "20.50"])
+
+    assert profile_similarity(dates, other_dates) == 1.0
+    assert profile_similarity(dates, amounts) == 0.0
+    assert profile_similarity(dates, dates.model_copy(update={"profile": None})) is None
+
+
+def test_column_profile_memory_is_bounded() -> None:
+    profile = ColumnProfile()
+    # a distinct pattern per value, as in free text
+    profile.add_many(f"{i:b}".replace("1", "x") for i in range(20_000))
+    profile.add(" ".join(["long text"] * 100))
+
+    assert len(profile._pattern_kinds) <= MAX_PATTERN_KINDS
+    assert len(profile.patterns) <= MAX_PATTERNS + 1
+    assert all(len(x) <= MAX_PATTERN_LENGTH + 3 for x in profile.patterns)
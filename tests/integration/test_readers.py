@@ -0,0 +1,31 @@
+import csv
+from io import StringIO
+
+from table_merger.readers import iter_file_lines, iter_projected_rows, parse_record
+
+TRICKY_CSV = (
+    "a,b,c,d\r\n"
+    "1,2,3,4\r\n"
+    '"x, y","multi\nline",z,"say ""hi"""\r\n'
+    "\r\n"
+    "short,row\r\n"
+    'mid"quote,2,3,4\n'
+    "last,2,3,4"
+)
+
+
+def test_projected_rows_match_csv_reader() -> None:
+    expected = [
+        (fields[3] if len(fields) > 3 else None, fields[1])
+        for fields in csv.reader(StringIO(TRICKY_CSV, newline=""))
+        if fields
+    ][1:]
+
+    lines = iter_file_lines(StringIO(TRICKY_CSV, newline=""), block_size=5)
+    header = next(csv.reader(lines))
+    projected = list(iter_projected_rows(lines, [3, 1]))
+
+    assert header == ["a", "b", "c", "d"]
+    assert [tuple(values) for values, _ in projected] == expected
+    # the raw record parses back into the whole row
+    assert parse_record(projected[1][1]) == ["x, y", "multi\nline", "z", 'say "hi"']
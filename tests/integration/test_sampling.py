@@ -0,0 +1,52 @@
+from io import StringIO
+from pathlib import Path
+
+from table_merger.sampling import (
+    ColumnSampler,
+    sample_path_at_random_offsets,
+    sample_text_io,
+    truncate_cell,
+)
+
+
+def test_sample_text_io_covers_whole_file() -> None:
+    rows = "\n".join(f"{i},{'active' if i % 2 else 'closed'}" for i in range(10_000))
+    in_file = StringIO(f"Id,Status\n{rows}\n")
+
+    sampler = sample_text_io(in_file, size=10)
+
+    assert sampler
+    samples = sampler.samples()
+    assert sampler.rows_seen == 10_000
+    assert len(samples["Id"]) == 10
+    # a sorted file still gives samples from past the first rows
+    assert max(int(x) for x in samples["Id"]) > 1000
+    # and duplicates are only kept once
+    assert sorted(samples["Status"]) == ["active", "closed"]
+    # the same file gives the same samples
+    assert sample_text_io(StringIO(in_file.getvalue()), size=10).samples() == samples  # type: ignore
+
+
+def test_oversized_cells_are_truncated() -> None:
+    sampler = ColumnSampler(["Notes"], max_cell_chars=10)
+
+    sampler.add_row(["x" * 5000])
+
+    assert sampler.samples() == {"Notes": [truncate_cell("x" * 5000, 10)]}
+    assert sampler.samples()["Notes"][0] == "xxxxxxxxxx... (5000 characters)"
+
+
+def test_sample_path_at_random_offsets(tmp_path: Path) -> None:
+    path = tmp_path / "big.csv"
+    rows = "\n".join(f'{i},"note, {i}"' for i in range(5000))
+    path.write_text(f"Id,Note\n{rows}\n")
+
+    sampler = sample_path_at_random_offsets(path, size=5, probes=50, profile=True)
+
+    assert sampler
+    # the profiles only cover the probed rows
+    assert all(x.sampled for x in sampler.profiles().values())
+    samples = sampler.samples()
+    assert len(samples["Id"]) == 5
+    # rows are parsed whole, quoted commas included
+    assert all(note.startswith("note, ") for note in samples["Note"])
@@ -0,0 +1,69 @@
+import asyncio
+import functools
+
+import pytest
+
+from table_merger.scheduler import LLMScheduler, TokenBucket
+
+
+class RateLimitError(Exception):
+    http_status = 429
+
+
+class TestLLMScheduler:
+    def test_concurrency_cap_and_retries(self) -> None:
+        scheduler = LLMScheduler(max_concurrency=2, base_delay=0.0)
+        in_flight = 0
+        max_in_flight = 0
+        attempts: dict[int, int] = {}
+
+        async def call(idx: int) -> int:
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            try:
+                await asyncio.sleep(0.01)
+                attempts[idx] = attempts.get(idx, 0) + 1
+                if idx % 2 and attempts[idx] < 3:
+                    raise RateLimitError()
+                return idx
+            finally:
+                in_flight -= 1
+
+        async def main() -> list[int]:
+            return await asyncio.gather(
+                *(scheduler.run(functools.partial(call, idx)) for idx in range(6))
+            )
+
+        assert asyncio.run(main()) == list(range(6))
+        assert max_in_flight == 2
+        assert scheduler.stats() == {"calls": 12, "retries": 6, "failures": 0}
+
+    def test_timeout_and_non_retryable(self) -> None:
+        scheduler = LLMScheduler(max_retries=1, base_delay=0.0, timeout=0.01)
+
+        async def slow() -> None:
+            await asyncio.sleep(1)
+
+        async def broken() -> None:
+            raise ValueError("bad prompt")
+
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(scheduler.run(slow))
+        assert scheduler.retries == 1
+
+        with pytest.raises(ValueError):
+            asyncio.run(scheduler.run(broken))
+        assert scheduler.retries == 1
+
+    def test_token_bucket(self) -> None:
+        async def main() -> float:
+            # 600 per minute is 10 per second, the bucket starts full with 10
+            bucket = TokenBucket(per_minute=600, capacity=10)
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            await bucket.acquire(10)
+            await bucket.acquire(2)
+            return loop.time() - start
+
+        assert 0.15 <= asyncio.run(main()) < 1
@@ -0,0 +1,21 @@
+from table_merger.sinks import TypedColumn
+from table_merger.table_mergers import ColumnInfo
+
+
+def test_typed_int_column_keeps_precision() -> None:
+    column = TypedColumn(
+        ColumnInfo(
+            name="PolicyId",
+            type="integer",
+            output_format="^[0-9]+$",
+            empty_expected=False,
+            example_values=["1"],
+        )
+    )
+
+    assert column.convert("9007199254740993") == 9007199254740993
+    assert column.convert("1,234,567") == 1234567
+    assert column.convert("150.0") == 150
+    assert column.convert("150.5") is None
+    assert column.convert("") is None
+    assert column.failures == 1
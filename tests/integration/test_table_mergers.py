@@ -1,16 +1,39 @@
+import asyncio
+import csv
+import itertools
+import json
+from io import StringIO
 from pathlib import Path
-from typing import TextIO
+from typing import BinaryIO, Iterator, TextIO
 
+import pytest
 from langchain.chat_models import ChatOpenAI
+from langchain.chat_models.fake import FakeListChatModel
 from langchain.globals import set_verbose
+from langchain.llms.fake import FakeListLLM
 from langchain.llms.openai import OpenAI
 from megamock import MegaMock
 
+from table_merger import checkpoint
+from table_merger.errors import MAX_ERROR_SAMPLES
+from table_merger.fake_llm import FakeBehavior, FakeLLM
+from table_merger.mapping_store import MappingStore
+from table_merger.profiling import ColumnProfile
+from table_merger.sinks import CsvSink
 from table_merger.table_mergers import ColumnInfo, TableMergeOperation, TableMergerManager
 
 set_verbose(True)
 
 
+def write_stray_quote_csv(path: Path, rows: int) -> None:
+    # quotes inside unquoted fields, as csv reads them, next to quoted multi line fields
+    with path.open("w", newline="") as out_file:
+        out_file.write("FullName,Notes,Monthly_Premium\n")
+        for idx in range(rows):
+            notes = f'"multi\nline ""{idx}"""' if idx % 3 else f'Bob {idx}" tall'
+            out_file.write(f"Name {idx},{notes},{'oops' if idx % 50 == 0 else idx}\n")
+
+
 class TestTableMergers:
     def test_ready(self, gpt3: OpenAI, example_template_csv: TextIO) -> None:
         # happy path
@@ -114,3 +137,832 @@ class TestTableMergeOperation:
         template_column_names = {x.name for x in template_col_info}
         transformed_column_names = {x.column_name for x in transformations.transformations}
         assert template_column_names == transformed_column_names
+
+    def test_apply(
+        self, template_column_info: list[ColumnInfo], incoming_column_info: list[ColumnInfo]
+    ) -> None:
+        in_file = StringIO(
+            "Date_of_Policy,FullName,Insurance_Type,Policy_No,Monthly_Premium\n"
+            "05/01/2023,John Doe,Gold,AB-12345,150.00\n"
+            "05/02/2023,Jane Smith,Silver,CD-67890,oops\n"
+        )
+        merge_op = TableMergeOperation(template_column_info, incoming_column_info, in_file)
+        merge_op.assign_column_mapping(
+            {
+                "Date": "Date_of_Policy",
+                "EmployeeName": "FullName",
+                "Plan": "Insurance_Type",
+                "PolicyNumber": "Policy_No",
+                "Premium": "Monthly_Premium",
+            }
+        )
+        merge_op.assign_column_transformations(
+            {
+                "Date": "arrow.get(value, 'MM/DD/YYYY').format('DD-MM-YYYY')",
+                "EmployeeName": "value",
+                "Plan": "value",
+                "PolicyNumber": "re.sub('-', '', value)",
+                "Premium": "str(int(float(value)))",
+            }
+        )
+
+        assert list(merge_op.apply()) == [
+            {
+                "Date": "01-05-2023",
+                "EmployeeName": "John Doe",
+                "Plan": "Gold",
+                "PolicyNumber": "AB12345",
+                "Premium": "150",
+            }
+        ]
+        assert merge_op.errors == [
+            "Row: 2 - Error applying transformation for column Premium. "
+            "Reason: could not convert string to float: 'oops'"
+        ]
+
+    def test_apply_missing_column_reported_once(
+        self, template_column_info: list[ColumnInfo], incoming_column_info: list[ColumnInfo]
+    ) -> None:
+        in_file = StringIO(
+            "FullName,Insurance_Type\nJohn Doe,Gold\nJane Smith\n\nBob Wilson,Silver\n"
+        )
+        merge_op = TableMergeOperation(template_column_info, incoming_column_info, in_file)
+        merge_op.assign_column_mapping(
+            {"EmployeeName": "FullName", "Plan": "Insurance_Type", "Premium": "Monthly_Premium"}
+        )
+        merge_op.assign_column_transformations({"EmployeeName": "value", "Plan": "value.upper()"})
+
+        assert list(merge_op.apply()) == [
+            {"EmployeeName": "John Doe", "Plan": "GOLD"},
+            {"EmployeeName": "Bob Wilson", "Plan": "SILVER"},
+        ]
+        assert merge_op.errors == [
+            "Column Monthly_Premium not found in input data.",
+            "Row: 2 - Error applying transformation for column Plan. "
+            "Reason: 'NoneType' object has no attribute 'upper'",
+        ]
+
+    def test_apply_parallel(
+        self,
+        template_column_info: list[ColumnInfo],
+        incoming_column_info: list[ColumnInfo],
+        tmp_path: Path,
+    ) -> None:
+        in_path = tmp_path / "incoming.csv"
+        with in_path.open("w", newline="") as out_file:
+            writer = csv.writer(out_file)
+            writer.writerow(["FullName", "Notes", "Monthly_Premium"])
+            for idx in range(500):
+                premium = "oops" if idx % 97 == 0 else f"{idx}.00"
+                writer.writerow([f"Name {idx}", f'multi\nline "{idx}"\n', premium])
+
+        def make_operation() -> TableMergeOperation:
+            merge_op = TableMergeOperation(
+                template_column_info, incoming_column_info, in_path.open(), in_path
+            )
+            merge_op.assign_column_mapping(
+                {"EmployeeName": "FullName", "Premium": "Monthly_Premium"}
+            )
+            merge_op.assign_column_transformations(
+                {"EmployeeName": "value", "Premium": "str(int(float(value)))"}
+            )
+            return merge_op
+
+        serial_op = make_operation()
+        parallel_op = make_operation()
+
+        expected_rows = list(serial_op.apply())
+        assert list(parallel_op.apply_parallel(processes=2, chunk_size=1024)) == expected_rows
+        assert len(expected_rows) == 494
+        assert parallel_op.errors == serial_op.errors
+        assert parallel_op.errors[1].startswith("Row: 98 - ")
+
+    def test_apply_parallel_stray_quotes(
+        self,
+        template_column_info: list[ColumnInfo],
+        incoming_column_info: list[ColumnInfo],
+        tmp_path: Path,
+    ) -> None:
+        in_path = tmp_path / "incoming.csv"
+        write_stray_quote_csv(in_path, 400)
+
+        def make_operation() -> TableMergeOperation:
+            merge_op = TableMergeOperation(
+                template_column_info, incoming_column_info, in_path.open(newline=""), in_path
+            )
+            merge_op.assign_column_mapping(
+                {"EmployeeName": "FullName", "Premium": "Monthly_Premium"}
+            )
+            merge_op.assign_column_transformations(
+                {"EmployeeName": "value", "Premium": "str(int(value))"}
+            )
+            return merge_op
+
+        serial_op = make_operation()
+        parallel_op = make_operation()
+
+        expected_rows = list(serial_op.apply())
+        assert list(parallel_op.apply_parallel(processes=2, chunk_size=256)) == expected_rows
+        assert len(expected_rows) == 392
+        assert parallel_op.errors == serial_op.errors
+
+    def test_apply_to_file_appends_files(
+        self,
+        template_column_info: list[ColumnInfo],
+        incoming_column_info: list[ColumnInfo],
+        tmp_path: Path,
+    ) -> None:
+        out_path = tmp_path / "merged.csv"
+        for incoming in ("FullName\nJohn Doe\n", "FullName\nJane Smith\nBob Wilson\n"):
+            merge_op = TableMergeOperation(
+                template_column_info, incoming_column_info, StringIO(incoming)
+            )
+            merge_op.assign_column_mapping({"EmployeeName": "FullName"})
+            merge_op.assign_column_transformations({"EmployeeName": "value.upper()"})
+            merge_op.apply_to_file(out_path, append=True)
+
+        assert out_path.read_text().splitlines() == [
+            "Date,EmployeeName,Plan,PolicyNumber,Premium",
+            ",JOHN DOE,,,",
+            ",JANE SMITH,,,",
+            ",BOB WILSON,,,",
+        ]
+
+    def test_apply_errors_are_bounded_with_rejected_rows(
+        self,
+        template_column_info: list[ColumnInfo],
+        incoming_column_info: list[ColumnInfo],
+        tmp_path: Path,
+    ) -> None:
+        in_path = tmp_path / "incoming.csv"
+        rows = "".join(f"Name {idx},{'oops' if idx % 2 else '10.00'}\n" for idx in range(500))
+        in_path.write_text(f"FullName,Monthly_Premium\n{rows}")
+        merge_op = TableMergeOperation(
+            template_column_info, incoming_column_info, in_path.open(), in_path
+        )
+        merge_op.assign_column_mapping({"EmployeeName": "FullName", "Premium": "Monthly_Premium"})
+        merge_op.assign_column_transformations(
+            {"EmployeeName": "value", "Premium": "str(int(float(value)))"}
+        )
+
+        written = merge_op.apply_to_file(
+            tmp_path / "merged.csv", reject_path=tmp_path / "rejected.csv"
+        )
+
+        assert written == 250
+        assert merge_op.error_collector.counts == {("Premium", "ValueError"): 250}
+        # only a sample of the row errors is kept, followed by the totals
+        assert len(merge_op.errors) == MAX_ERROR_SAMPLES + 2
+        assert merge_op.errors[0].startswith("Row: 2 - ")
+        assert merge_op.errors[-2:] == [
+            f"250 transformation errors in 250 rows, only the first {MAX_ERROR_SAMPLES} are listed.",
+            "250 rows failed for column Premium with ValueError",
+        ]
+        with (tmp_path / "rejected.csv").open(newline="") as reject_file:
+            rejected = list(csv.reader(reject_file))
+        assert len(rejected) == 251
+        assert rejected[:2] == [
+            ["row_number", "reject_reasons", "FullName", "Monthly_Premium"],
+            ["2", "Premium: could not convert string to float: 'oops'", "Name 1", "oops"],
+        ]
+
+    def test_apply_to_file_appends_rejected_rows(
+        self,
+        template_column_info: list[ColumnInfo],
+        incoming_column_info: list[ColumnInfo],
+        tmp_path: Path,
+    ) -> None:
+        reject_path = tmp_path / "rejected.csv"
+        for idx in range(2):
+            in_path = tmp_path / f"incoming_{idx}.csv"
+            in_path.write_text(f"FullName,Monthly_Premium\nName {idx},oops\nOther {idx},10\n")
+            with in_path.open(newline="") as in_file:
+                merge_op = TableMergeOperation(
+                    template_column_info, incoming_column_info, in_file, in_path
+                )
+                merge_op.assign_column_mapping(
+                    {"EmployeeName": "FullName", "Premium": "Monthly_Premium"}
+                )
+                merge_op.assign_column_transformations(
+                    {"EmployeeName": "value", "Premium": "str(int(value))"}
+                )
+                merge_op.apply_to_file(
+                    tmp_path / "merged.csv", append=True, reject_path=reject_path
+                )
+
+        with reject_path.open(newline="") as reject_file:
+            rejected = list(csv.reader(reject_file))
+        # the first file's rejects are kept, under the one header
+        assert [x[2] for x in rejected] == ["FullName", "Name 0", "Name 1"]
+
+        in_path = tmp_path / "incoming_other.csv"
+        in_path.write_text("Full_Name,Monthly_Premium\nName 2,oops\n")
+        with in_path.open(newline="") as in_file:
+            merge_op = TableMergeOperation(
+                template_column_info, incoming_column_info, in_file, in_path
+            )
+            merge_op.assign_column_mapping(
+                {"EmployeeName": "Full_Name", "Premium": "Monthly_Premium"}
+            )
+            merge_op.assign_column_transformations(
+                {"EmployeeName": "value", "Premium": "str(int(value))"}
+            )
+            # a file with other columns doesn't add rows the header doesn't describe
+            with pytest.raises(ValueError, match="separate reject file"):
+                merge_op.apply_to_file(
+                    tmp_path / "merged.csv", append=True, reject_path=reject_path
+                )
+        with reject_path.open(newline="") as reject_file:
+            assert len(list(csv.reader(reject_file))) == 3
+
+    def test_apply_to_file_resumable(
+        self,
+        template_column_info: list[ColumnInfo],
+        incoming_column_info: list[ColumnInfo],
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        in_path = tmp_path / "incoming.csv"
+        with in_path.open("w", newline="") as out_file:
+            writer = csv.writer(out_file)
+            writer.writerow(["FullName", "Notes", "Monthly_Premium"])
+            for idx in range(300):
+                premium = "oops" if idx % 50 == 0 else f"{idx}.00"
+                writer.writerow([f"Name {idx}", f"multi\nline {idx}", premium])
+
+        def make_operation() -> TableMergeOperation:
+            merge_op = TableMergeOperation(
+                template_column_info, incoming_column_info, in_path.open(), in_path
+            )
+            merge_op.assign_column_mapping(
+                {"EmployeeName": "FullName", "Premium": "Monthly_Premium"}
+            )
+            merge_op.assign_column_transformations(
+                {"EmployeeName": "value", "Premium": "str(int(float(value)))"}
+            )
+            return merge_op
+
+        make_operation().apply_to_file(tmp_path / "expected.csv")
+        read_blocks = checkpoint.iter_row_aligned_blocks
+
+        def crash_after_ten_blocks(in_file: BinaryIO, start: int) -> Iterator:
+            yield from itertools.islice(read_blocks(in_file, start, block_size=256), 10)
+            raise RuntimeError("Worker died")
+
+        out_path = tmp_path / "merged.csv"
+        checkpoint_path = tmp_path / "merged.checkpoint"
+        monkeypatch.setattr(checkpoint, "iter_row_aligned_blocks", crash_after_ten_blocks)
+        with pytest.raises(RuntimeError):
+            make_operation().apply_to_file_resumable(
+                out_path, checkpoint_path, checkpoint_interval=1024
+            )
+        saved = checkpoint.load_checkpoint(checkpoint_path)
+        assert saved and 0 < saved.rows_read < 300
+        # rows written after the last checkpoint are discarded on resume
+        with out_path.open("a") as out_file:
+            out_file.write("partial,row\n")
+
+        monkeypatch.setattr(
+            checkpoint,
+            "iter_row_aligned_blocks",
+            lambda in_file, start: read_blocks(in_file, start, block_size=256),
+        )
+        resumed_op = make_operation()
+        written = resumed_op.apply_to_file_resumable(
+            out_path, checkpoint_path, checkpoint_interval=1024
+        )
+
+        assert written == 294
+        assert out_path.read_text() == (tmp_path / "expected.csv").read_text()
+        assert resumed_op.error_collector.counts == {("Premium", "ValueError"): 6}
+        assert not checkpoint_path.exists()
+
+    def test_apply_to_file_resumable_stray_quotes(
+        self,
+        template_column_info: list[ColumnInfo],
+        incoming_column_info: list[ColumnInfo],
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        in_path = tmp_path / "incoming.csv"
+        write_stray_quote_csv(in_path, 300)
+
+        def make_operation() -> TableMergeOperation:
+            merge_op = TableMergeOperation(
+                template_column_info, incoming_column_info, in_path.open(newline=""), in_path
+            )
+            merge_op.assign_column_mapping({"EmployeeName": "FullName", "Plan": "Notes"})
+            merge_op.assign_column_transformations({"EmployeeName": "value", "Plan": "value"})
+            return merge_op
+
+        make_operation().apply_to_file(tmp_path / "expected.csv")
+        read_blocks = checkpoint.iter_row_aligned_blocks
+
+        def crash_after_ten_blocks(in_file: BinaryIO, start: int) -> Iterator:
+            yield from itertools.islice(read_blocks(in_file, start, block_size=256), 10)
+            raise RuntimeError("Worker died")
+
+        out_path = tmp_path / "merged.csv"
+        checkpoint_path = tmp_path / "merged.checkpoint"
+        monkeypatch.setattr(checkpoint, "iter_row_aligned_blocks", crash_after_ten_blocks)
+        with pytest.raises(RuntimeError):
+            make_operation().apply_to_file_resumable(
+                out_path, checkpoint_path, checkpoint_interval=1024
+            )
+        monkeypatch.setattr(
+            checkpoint,
+            "iter_row_aligned_blocks",
+            lambda in_file, start: read_blocks(in_file, start, block_size=256),
+        )
+
+        assert (
+            make_operation().apply_to_file_resumable(
+                out_path, checkpoint_path, checkpoint_interval=1024
+            )
+            == 300
+        )
+        assert out_path.read_text() == (tmp_path / "expected.csv").read_text()
+
+    def test_apply_to_typed_file_jsonl(
+        self,
+        template_column_info: list[ColumnInfo],
+        incoming_column_info: list[ColumnInfo],
+        tmp_path: Path,
+    ) -> None:
+        in_file = StringIO(
+            "Date_of_Policy,FullName,Monthly_Premium\n"
+            "05/01/2023,John Doe,150.00\n"
+            "05/02/2023,Jane Smith,\n"
+        )
+        merge_op = TableMergeOperation(template_column_info, incoming_column_info, in_file)
+        merge_op.assign_column_mapping(
+            {"Date": "Date_of_Policy", "EmployeeName": "FullName", "Premium": "Monthly_Premium"}
+        )
+        merge_op.assign_column_transformations(
+            {
+                "Date": "datetime.datetime.strptime(value, '%m/%d/%Y').strftime('%m-%d-%Y')",
+                "EmployeeName": "value",
+                "Premium": "value.split('.')[0]",
+            }
+        )
+
+        assert merge_op.apply_to_typed_file(tmp_path / "out.jsonl", "jsonl") == 2
+
+        lines = (tmp_path / "out.jsonl").read_text().splitlines()
+        # numbers are JSON numbers, dates ISO formatted and missing columns null
+        assert [json.loads(x) for x in lines] == [
+            {
+                "Date": "2023-05-01",
+                "EmployeeName": "John Doe",
+                "Plan": None,
+                "PolicyNumber": None,
+                "Premium": 150.0,
+            },
+            {
+                "Date": "2023-05-02",
+                "EmployeeName": "Jane Smith",
+                "Plan": None,
+                "PolicyNumber": None,
+                "Premium": None,
+            },
+        ]
+
+    def test_dry_run_transformations(
+        self,
+        template_column_info: list[ColumnInfo],
+        incoming_column_info: list[ColumnInfo],
+        tmp_path: Path,
+    ) -> None:
+        in_path = tmp_path / "in.csv"
+        in_path.write_text(
+            "Date_of_Policy,FullName,Monthly_Premium\n"
+            "05/01/2023,John Doe,150.00\n"
+            "05/02/2023,Jane Smith,n/a\n"
+            "05/03/2023,Bob Wilson,50.00\n"
+        )
+        with in_path.open(newline="") as in_file:
+            merge_op = TableMergeOperation(
+                template_column_info, incoming_column_info, in_file, in_path
+            )
+            merge_op.assign_column_mapping(
+                {
+                    "Date": "Date_of_Policy",
+                    "EmployeeName": "FullName",
+                    "Premium": "Monthly_Premium",
+                }
+            )
+            merge_op.assign_column_transformations(
+                {
+                    # the template wants dashes
+                    "Date": "datetime.datetime.strptime(value, '%m/%d/%Y').strftime('%m/%d/%Y')",
+                    "EmployeeName": "value",
+                    "Premium": "str(round(float(value)))",
+                }
+            )
+
+            report = merge_op.dry_run_transformations(max_rows=2)
+
+        results = {x.column: x for x in report.columns}
+        assert report.rows_tested == 2
+        assert report.rows_per_second
+        # the incoming examples and the first two rows
+        assert results["Date"].values_tested == 12
+        assert results["Date"].format_mismatch_rate == 1.0
+        assert results["EmployeeName"].failures == 0
+        assert results["EmployeeName"].format_mismatches == 0
+        assert results["Premium"].values_tested == 5
+        assert results["Premium"].failures == 1
+        assert results["Premium"].sample_errors == [
+            "'n/a': ValueError: could not convert string to float: 'n/a'"
+        ]
+        assert merge_op.errors == [
+            "Dry run of column Date: 12 values don't match the template's output format.",
+            "Dry run of column Premium: 1 of 5 values failed,"
+            " e.g. 'n/a': ValueError: could not convert string to float: 'n/a'",
+        ]
+
+    @pytest.mark.parametrize("file_format", ["parquet", "ipc"])
+    def test_apply_to_typed_file_arrow(
+        self,
+        template_column_info: list[ColumnInfo],
+        incoming_column_info: list[ColumnInfo],
+        tmp_path: Path,
+        file_format: str,
+    ) -> None:
+        pa = pytest.importorskip("pyarrow")
+        in_file = StringIO(
+            "Date_of_Policy,Monthly_Premium\n"
+            + "".join(f"05/{day:02d}/2023,{day}.00\n" for day in range(1, 29))
+        )
+        merge_op = TableMergeOperation(template_column_info, incoming_column_info, in_file)
+        merge_op.assign_column_mapping({"Date": "Date_of_Policy", "Premium": "Monthly_Premium"})
+        merge_op.assign_column_transformations(
+            {"Date": "value.replace('/', '-')", "Premium": "value.split('.')[0]"}
+        )
+        out_path = tmp_path / f"out.{file_format}"
+
+        assert merge_op.apply_to_typed_file(out_path, file_format, batch_size=10) == 28
+
+        if file_format == "parquet":
+            table = pytest.importorskip("pyarrow.parquet").read_table(out_path)
+        else:
+            table = pa.ipc.open_file(pa.memory_map(str(out_path))).read_all()
+        assert table.schema.field("Date").type == pa.date32()
+        assert table.schema.field("Premium").type == pa.float64()
+        assert table.num_rows == 28
+
+    def test_recall_accepted_merge(
+        self,
+        template_column_info: list[ColumnInfo],
+        incoming_column_info: list[ColumnInfo],
+        tmp_path: Path,
+    ) -> None:
+        tm = TableMergerManager(
+            MegaMock.it(OpenAI), mapping_store=MappingStore(tmp_path / "store.sqlite")
+        )
+        tm.template_columns = template_column_info
+        header = ",".join(x.name for x in incoming_column_info)
+
+        merge_op = TableMergeOperation(
+            template_column_info, incoming_column_info, StringIO(header + "\n")
+        )
+        merge_op.assign_column_mapping({"EmployeeName": "FullName", "Plan": "Insurance_Type"})
+        merge_op.assign_column_transformations({"EmployeeName": "value", "Plan": "value"})
+        tm.remember_operation(merge_op)
+
+        # same layout with slightly different column names
+        renamed_header = header.replace("Insurance_Type", "Insurance Type").replace(
+            "Department,", ""
+        )
+        recalled_op = tm.prep_csv_file_from_text_io(StringIO(renamed_header + "\n"))
+        assert recalled_op.recalled
+        assert recalled_op.actual_column_mapping == {
+            "EmployeeName": "FullName",
+            "Plan": "Insurance Type",
+        }
+        assert recalled_op.actual_transformation_sources == {
+            "EmployeeName": "value",
+            "Plan": "value",
+        }
+        assert recalled_op.suggested_merge_info
+        assert recalled_op.suggested_transformation_operations
+
+    def test_batch_column_inference(self) -> None:
+        def column_info(name: str) -> dict:
+            return {
+                "name": name,
+                "type": "string",
+                "output_format": ".*",
+                "empty_expected": False,
+                "example_values": ["x"],
+            }
+
+        llm = FakeListLLM(
+            responses=[
+                # Hobby is left out of the batch response
+                json.dumps({"columns": [column_info("Name"), column_info("Plan")]}),
+                json.dumps(column_info("Hobby")),
+            ]
+        )
+        tm = TableMergerManager(llm, batch_column_inference=True)
+
+        assert tm.ready(StringIO("Name,Hobby,Plan\nJohn Doe,Reading,Gold\n"))
+        assert tm.get_template_columns() == ["Name", "Hobby", "Plan"]
+
+    def test_async_api_with_chat_model(
+        self, template_column_info: list[ColumnInfo], incoming_column_info: list[ColumnInfo]
+    ) -> None:
+        merge_info = {
+            "reasoning": [],
+            "column_mapping": [
+                {
+                    "template_column": "EmployeeName",
+                    "incoming_column": "FullName",
+                    "reasoning": "Same names",
+                    "confidence": "high",
+                    "ambiguous_with": [],
+                }
+            ],
+            "errors": [],
+        }
+        transformations = {
+            "transformations": [
+                {"reasoning": [], "column_name": "EmployeeName", "python_lambda_body": "value"}
+            ],
+            "errors": [],
+        }
+        llm = FakeListChatModel(responses=[json.dumps(merge_info), json.dumps(transformations)])
+        merge_op = TableMergeOperation(
+            template_column_info[1:2], incoming_column_info, MegaMock.it(TextIO)
+        )
+
+        async def main() -> None:
+            # called from inside a running event loop
+            column_merge_info = await merge_op.create_suggested_merge_info_async(llm)
+            merge_op.assign_column_mapping(
+                {x.template_column: x.incoming_column for x in column_merge_info.column_mapping}
+            )
+            await merge_op.create_suggested_transformation_operations_async(llm)
+
+        asyncio.run(main())
+        assert merge_op.actual_column_mapping == {"EmployeeName": "FullName"}
+        assert merge_op.suggested_transformation_operations
+        assert merge_op.suggested_transformation_operations.transformations[0].column_name == (
+            "EmployeeName"
+        )
+
+    def test_merge_many(
+        self,
+        template_column_info: list[ColumnInfo],
+        incoming_column_info: list[ColumnInfo],
+        tmp_path: Path,
+    ) -> None:
+        tm = TableMergerManager(
+            MegaMock.it(OpenAI), mapping_store=MappingStore(tmp_path / "store.sqlite")
+        )
+        tm.template_columns = template_column_info[1:3]
+        known_layout = TableMergeOperation(
+            template_column_info, incoming_column_info[1:3], StringIO()
+        )
+        known_layout.assign_column_mapping({"EmployeeName": "FullName", "Plan": "Insurance_Plan"})
+        known_layout.assign_column_transformations(
+            {"EmployeeName": "value", "Plan": "value.split()[0]"}
+        )
+        tm.remember_operation(known_layout)
+
+        paths = []
+        for idx in range(3):
+            paths.append(tmp_path / f"incoming_{idx}.csv")
+            paths[-1].write_text(f"FullName,Insurance_Plan\nName {idx},Gold Plan\n")
+        paths.insert(1, tmp_path / "missing.csv")
+
+        out_file = StringIO()
+        statuses = tm.merge_many(paths, CsvSink(out_file, tm.get_template_columns()))
+
+        assert [x.state for x in statuses] == ["merged", "failed", "merged", "merged"]
+        assert all(x.recalled for x in statuses if x.state == "merged")
+        assert sorted(out_file.getvalue().splitlines()) == [
+            "EmployeeName,Plan",
+            "Name 0,Gold",
+            "Name 1,Gold",
+            "Name 2,Gold",
+        ]
+
+    def test_merge_many_drops_partial_files(
+        self,
+        template_column_info: list[ColumnInfo],
+        incoming_column_info: list[ColumnInfo],
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        tm = TableMergerManager(
+            MegaMock.it(OpenAI), mapping_store=MappingStore(tmp_path / "store.sqlite")
+        )
+        tm.template_columns = template_column_info[1:3]
+        known_layout = TableMergeOperation(
+            template_column_info, incoming_column_info[1:3], StringIO()
+        )
+        known_layout.assign_column_mapping({"EmployeeName": "FullName", "Plan": "Insurance_Plan"})
+        known_layout.assign_column_transformations({"EmployeeName": "value", "Plan": "value"})
+        tm.remember_operation(known_layout)
+
+        apply = TableMergeOperation.apply
+
+        def fail_part_way(self: TableMergeOperation) -> Iterator[dict]:
+            for row in apply(self):
+                yield row
+                if row["EmployeeName"] == "Broken":
+                    raise OSError("Read failed")
+
+        monkeypatch.setattr(TableMergeOperation, "apply", fail_part_way)
+        good_path = tmp_path / "good.csv"
+        good_path.write_text("FullName,Insurance_Plan\nName,Gold\n")
+        broken_path = tmp_path / "broken.csv"
+        broken_path.write_text("FullName,Insurance_Plan\nBefore,Gold\nBroken,Gold\n")
+
+        out_file = StringIO()
+        # rows reach the output one at a time
+        sink = CsvSink(out_file, tm.get_template_columns(), batch_size=1)
+        statuses = tm.merge_many([good_path, broken_path], sink)
+
+        assert [x.state for x in statuses] == ["merged", "failed"]
+        assert statuses[1].rows_written == 0
+        assert out_file.getvalue().splitlines() == ["EmployeeName,Plan", "Name,Gold"]
+
+    def test_create_suggested_merge_info_in_chunks(
+        self, template_column_info: list[ColumnInfo], incoming_column_info: list[ColumnInfo]
+    ) -> None:
+        def merge_info(template_column: str, confidence: str) -> str:
+            mapping = {
+                "template_column": template_column,
+                "incoming_column": "FullName",
+                "reasoning": "Looks right",
+                "confidence": confidence,
+                "ambiguous_with": [],
+            }
+            return json.dumps({"reasoning": [], "column_mapping": [mapping], "errors": []})
+
+        # both chunks claim FullName
+        llm = FakeListLLM(
+            responses=[merge_info("EmployeeName", "High"), merge_info("Plan", "low")]
+        )
+        merge_op = TableMergeOperation(
+            template_column_info[1:3], incoming_column_info, MegaMock.it(TextIO)
+        )
+        # Plan would be locked to Insurance_Plan without asking
+        column_merge_info = merge_op.create_suggested_merge_info(
+            llm, template_chunk_size=1, premap=False
+        )
+
+        assert [
+            (x.template_column, x.incoming_column, x.confidence)
+            for x in column_merge_info.column_mapping
+        ] == [("EmployeeName", "FullName", "High"), ("Plan", "Insurance_Plan", "low")]
+        assert column_merge_info.column_mapping[1].ambiguous_with[0] == "FullName"
+
+    def test_create_suggested_merge_info_in_chunks_reports_missing(
+        self, template_column_info: list[ColumnInfo], incoming_column_info: list[ColumnInfo]
+    ) -> None:
+        def merge_info(template_column: str, confidence: str) -> str:
+            mapping = {
+                "template_column": template_column,
+                "incoming_column": "FullName",
+                "reasoning": "Looks right",
+                "confidence": confidence,
+                "ambiguous_with": [],
+            }
+            return json.dumps({"reasoning": [], "column_mapping": [mapping], "errors": []})
+
+        hobby = ColumnInfo(
+            name="Hobby",
+            type="string",
+            output_format="",
+            empty_expected=False,
+            example_values=["Chess", "Hiking"],
+        )
+        # the loser's only unused candidate is unrelated to it
+        llm = FakeListLLM(
+            responses=[merge_info("EmployeeName", "High"), merge_info("PolicyNumber", "low")]
+        )
+        merge_op = TableMergeOperation(
+            [template_column_info[1], template_column_info[3]],
+            [incoming_column_info[1], hobby],
+            MegaMock.it(TextIO),
+        )
+        column_merge_info = merge_op.create_suggested_merge_info(llm, template_chunk_size=1)
+
+        assert [
+            (x.template_column, x.incoming_column) for x in column_merge_info.column_mapping
+        ] == [("EmployeeName", "FullName")]
+        assert column_merge_info.errors == [
+            "Column PolicyNumber is missing. Its best match FullName was used for EmployeeName."
+        ]
+
+    def test_sampled_profiles(
+        self, template_column_info: list[ColumnInfo], incoming_column_info: list[ColumnInfo]
+    ) -> None:
+        profile = ColumnProfile()
+        profile.add_many(f"Plan {idx}" for idx in range(10_000))
+        profile.sampled = True
+        incoming = [x.model_copy(update={"profile": profile}) for x in incoming_column_info]
+        merge_op = TableMergeOperation(template_column_info[2:3], incoming, MegaMock.it(TextIO))
+        merge_op.assign_column_mapping({"Plan": "Insurance_Plan"})
+        behavior = FakeBehavior()
+
+        merge_op.create_suggested_transformation_operations(
+            FakeLLM(behavior=behavior), use_library=False
+        )
+        merge_op.assign_column_transformations({"Plan": "value.split()[0]"})
+
+        # the profile came from probes of the file, so it isn't presented as covering it all
+        assert "profile" in behavior.prompts[0]
+        assert "summarizes every value" not in behavior.prompts[0]
+        # nor is its distinct count trusted to rule out memoizing
+        assert merge_op._memoized_columns({"Plan": "value.split()[0]"}) == {"Plan"}
+        profile.sampled = False
+        assert merge_op._memoized_columns({"Plan": "value.split()[0]"}) == set()
+
+    def test_create_suggested_merge_info_premaps_obvious_columns(
+        self, template_column_info: list[ColumnInfo]
+    ) -> None:
+        incoming = [
+            x.model_copy(update={"name": name})
+            for x, name in zip(template_column_info, ["Policy Date", "Employee_Name", "PLAN"])
+        ]
+        # no responses, the LLM is never asked
+        llm = FakeListLLM(responses=[])
+        merge_op = TableMergeOperation(template_column_info[:3], incoming, MegaMock.it(TextIO))
+
+        column_merge_info = merge_op.create_suggested_merge_info(llm)
+
+        assert [
+            (x.template_column, x.incoming_column) for x in column_merge_info.column_mapping
+        ] == [
+            ("Date", "Policy Date"),
+            ("EmployeeName", "Employee_Name"),
+            ("Plan", "PLAN"),
+        ]
+
+    def test_create_suggested_merge_info_premaps_sample_fixtures(
+        self, template_column_info: list[ColumnInfo], incoming_column_info: list[ColumnInfo]
+    ) -> None:
+        behavior = FakeBehavior()
+        merge_op = TableMergeOperation(
+            template_column_info, incoming_column_info, MegaMock.it(TextIO)
+        )
+
+        column_merge_info = merge_op.create_suggested_merge_info(FakeLLM(behavior=behavior))
+
+        mapping = {x.template_column: x.incoming_column for x in column_merge_info.column_mapping}
+        assert {x: mapping[x] for x in ["Date", "Plan", "Premium"]} == {
+            "Date": "Date_of_Policy",
+            "Plan": "Insurance_Plan",
+            "Premium": "Monthly_Premium",
+        }
+        # only the columns with close rivals went to the LLM
+        assert len(behavior.prompts) == 1
+        assert "Monthly_Premium" not in behavior.prompts[0]
+        assert "Full_Name" in behavior.prompts[0]
+
+    def test_create_suggested_transformation_operations_uses_library(
+        self, template_column_info: list[ColumnInfo], incoming_column_info: list[ColumnInfo]
+    ) -> None:
+        transformations = {
+            "transformations": [
+                {
+                    "reasoning": ["Drop the suffix"],
+                    "column_name": "Plan",
+                    "python_lambda_body": "value.split(' ')[0]",
+                }
+            ],
+            "errors": [],
+        }
+        # one response, only the column the library doesn't recognize goes to the LLM
+        llm = FakeListLLM(responses=[json.dumps(transformations)])
+        merge_op = TableMergeOperation(
+            template_column_info, incoming_column_info, MegaMock.it(TextIO)
+        )
+        merge_op.assign_column_mapping(
+            {
+                "Date": "Date_of_Policy",
+                "EmployeeName": "FullName",
+                "Plan": "Insurance_Plan",
+                "PolicyNumber": "Policy_No",
+                "Premium": "Monthly_Premium",
+            }
+        )
+
+        result = merge_op.create_suggested_transformation_operations(llm)
+
+        assert {x.column_name: x.python_lambda_body for x in result.transformations} == {
+            "Date": (
+                "datetime.datetime.strptime(value.strip(), '%m/%d/%Y').strftime('%m-%d-%Y')"
+            ),
+            "EmployeeName": "value",
+            "Plan": "value.split(' ')[0]",
+            "PolicyNumber": "re.sub('[\\\\-]', '', value)",
+            "Premium": "str(int(re.sub('[.]0*$', '', value.strip())))",
+        }
+        assert [x.column_name for x in result.transformations] == [
+            x.name for x in template_column_info
+        ]
@@ -0,0 +1,49 @@
+from table_merger.table_mergers import ColumnInfo
+from table_merger.transform_library import detect_transform
+from table_merger.transforms import compile_row_projector
+
+
+def _column(
+    name: str, output_format: str, example_values: list[str], empty_expected: bool = False
+) -> ColumnInfo:
+    return ColumnInfo(
+        name=name,
+        type="string",
+        output_format=output_format,
+        empty_expected=empty_expected,
+        example_values=example_values,
+    )
+
+
+def test_detect_transform_keeps_decimal_points() -> None:
+    template = _column("Premium", "^[0-9]+$", ["150", "200"])
+
+    # rounding away the cents is left to the LLM, "150.75" must not become "15075"
+    assert detect_transform(template, _column("premium", "", ["150.75", "1,200.50"])) is None
+    transform = detect_transform(template, _column("premium", "", ["150.00", "1,200"]))
+    assert transform is not None and transform.name == "numeric"
+
+
+def test_detect_transform_numeric_fails_on_later_fractions() -> None:
+    template = _column("Premium", "^[0-9]*$", ["150", ""], empty_expected=True)
+
+    transform = detect_transform(template, _column("premium", "", ["150.00", "1,200", ""]))
+
+    assert transform is not None and transform.name == "numeric"
+    project_row = compile_row_projector({"Premium": transform.python_lambda_body})
+    assert project_row(["1,200.00"]) == ({"Premium": "1200"}, [])
+    # the template has empty values, so an empty value isn't an error
+    assert project_row([" "]) == ({"Premium": ""}, [])
+    # a row the examples didn't show is rejected, not rounded (to even, as round() would)
+    for value in ["150.75", "2.5"]:
+        transformed_row, failed_columns = project_row([value])
+        assert transformed_row == {}
+        assert [column for column, _ in failed_columns] == ["Premium"]
+
+
+def test_detect_transform_strips_separators() -> None:
+    template = _column("PolicyNumber", "^[A-Z]{2}[0-9]{5}$", ["AB12345"])
+
+    transform = detect_transform(template, _column("policy_no", "", ["CD-54321", "EF-00001"]))
+
+    assert transform is not None and transform.name == "separator_strip"
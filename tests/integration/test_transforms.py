@@ -0,0 +1,120 @@
+import pytest
+
+from table_merger.transforms import (
+    UnsafeTransformError,
+    compile_row_projector,
+    is_memoizable,
+    transform_memo_stats,
+    validate_transform,
+)
+
+
+def test_is_memoizable() -> None:
+    assert is_memoizable("value.strip().upper()")
+    assert is_memoizable("arrow.get(value, 'MM/DD/YYYY').format('YYYY-MM-DD')")
+    # nothing to save over a cache lookup
+    assert not is_memoizable("value")
+    assert not is_memoizable("value[:3]")
+    # not the same result for the same value
+    assert not is_memoizable("arrow.now().format('YYYY') + value.strip()")
+    assert not is_memoizable("datetime.date.today().isoformat()")
+    assert not is_memoizable("arrow.get(value).humanize()")
+    assert not is_memoizable("arrow.get().format('YYYY') + value.strip()")
+    assert not is_memoizable("''.join(map(str, [datetime.datetime.now, value]))")
+    # only calls known to be deterministic, not everything that isn't known not to be
+    assert not is_memoizable("arrow.get(value).dehumanize('now')")
+    assert is_memoizable("datetime.datetime.strptime(value, '%m/%d/%Y').strftime('%Y')")
+    assert is_memoizable("str(arrow.get(value).to('utc').year)")
+
+
+def test_row_projector_memo() -> None:
+    project_row = compile_row_projector(
+        {"Name": "value.strip().title()", "Amount": "str(float(value))", "Raw": "value"},
+        memo_size=2,
+    )
+    rows = [
+        project_row(values)
+        for values in [[" a ", "1", "x"], [" a ", "y", "x"], [" b ", "y", "x"]]
+    ]
+    rows.append(project_row([" c ", "y", "x"]))
+
+    assert [row for row, _ in rows] == [
+        {"Name": "A", "Amount": "1.0", "Raw": "x"},
+        {"Name": "A", "Raw": "x"},
+        {"Name": "B", "Raw": "x"},
+        {"Name": "C", "Raw": "x"},
+    ]
+    # a cached error is reported again on every row with the value
+    assert [[(col, type(exc)) for col, exc in errors] for _, errors in rows[1:]] == [
+        [("Amount", ValueError)]
+    ] * 3
+    assert transform_memo_stats(project_row) == {
+        "Name": {"hits": 1, "misses": 3, "evictions": 1, "size": 2},
+        "Amount": {"hits": 2, "misses": 2, "evictions": 0, "size": 2},
+    }
+    assert transform_memo_stats(compile_row_projector({"Name": "value.strip()"})) == {}
+
+
+@pytest.mark.parametrize(
+    "transform",
+    [
+        "value.strip().title()",
+        "datetime.datetime.strptime(value, '%m/%d/%Y').strftime('%Y-%m-%d')",
+        "arrow.get(value, 'MM/DD/YYYY').format('YYYY-MM-DD')",
+        "re.sub(r'[^0-9]', '', value) or None",
+        "' '.join(part.strip() for part in reversed(value.split(',', 1)))",
+        "format(float(value.replace('$', '')), '.2f') if value else ''",
+        "f'{value[:3]}-{value[3:]}'",
+        "re.sub('a', lambda match: match.group(0).upper(), value)",
+        "'{}-{:.2f}'.format(value[:2], float(value[2:]))",
+        "arrow.get(value, 'MM/DD/YYYY').to('utc').format('YYYY-MM-DD')",
+        "str(round(float(value) * 100))",
+        "float(value) ** 2",
+        "str(sum(int(digit) * 2 for digit in value))",
+    ],
+)
+def test_validate_transform_allows(transform: str) -> None:
+    validate_transform(transform)
+
+
+@pytest.mark.parametrize(
+    "transform",
+    [
+        "__import__('os').system('true')",
+        "value.__class__.__mro__",
+        "getattr(value, 'upper')()",
+        "'{0.__class__}'.format(value)",
+        "[x for x in range(10 ** 9)]",
+        "[a + b for a in value for b in value]",
+        "'x' * 10_000_000",
+        "('{0._' + '_globals_' + '_[Arrow]._' + '_init_' + '_._' + '_globals_'"
+        " + '_[sys].modules[os].environ[SECRET_KEY]}').format(arrow.get)",
+        "'{0.real}'.format(value)",
+        "'{0[0]}'.format(value)",
+        "'{:{0.real}}'.format(value)",
+        "str.format(value, arrow.get)",
+        "arrow.get(value).strftime(value).format(arrow.get)",
+        "'a' * 1000000 * 1000000",
+        "'a' * 10000 * 10000",
+        "(9 ** 999999) ** 999999",
+        "9 ** 99",
+        "'ab' * int(value)",
+        "[0 for arrow in []] or arrow.arrow.sys.modules['os'].getpid()",
+        "(lambda re: re)(1)",
+        "(lambda str: str.mro)(1)",
+        "''.join(['a' * 10000 for c in value * 10000])",
+        "''.join(['a' * 10000 for c in value])",
+        "2 ** int(value)",
+        "re.purge()",
+        "arrow.now()",
+        "(lambda: 1).__code__",
+        "open('/etc/passwd').read()",
+        "value; import os",
+        "(x := value)",
+    ],
+)
+def test_validate_transform_rejects(transform: str) -> None:
+    with pytest.raises(UnsafeTransformError):
+        validate_transform(transform)
+    with pytest.raises(UnsafeTransformError):
+        compile_row_projector({"Column": transform})